@@ -0,0 +1,146 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.utils.crypto import salted_hmac
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    BaseAuthentication,
+    BasicAuthentication,
+    get_authorization_header,
+)
+
+from .lru import LRUCache
+
+TOKEN_SALT = 'api.authentication.token'
+
+credential_cache = LRUCache(
+    max_entries=settings.API_CREDENTIAL_CACHE_SIZE,
+    ttl=settings.API_CREDENTIAL_CACHE_TTL,
+)
+
+
+def credential_key(userid, password):
+    """Keyed hash (HMAC with the SECRET_KEY) identifying a credential pair.
+    """
+    return salted_hmac(
+        'api.authentication.credential_key',
+        f'{userid}\x00{password}',
+        algorithm='sha256',
+    ).digest()
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """HTTP Basic authentication that skips the password hasher on repeat.
+
+    Verifying a password runs the full PBKDF2 hasher, which dominates the cost
+    of a request. Once a credential pair is verified the user's id and
+    password hash are cached, and later requests with the same pair only
+    reload the user by primary key. The entry is dropped as soon as the
+    stored password hash or the username changes, or the user is deactivated.
+    """
+
+    def authenticate_credentials(self, userid, password, request=None):
+        key = credential_key(userid, password)
+        cached = credential_cache.get(key)
+        if cached is not None:
+            user_id, password_hash = cached
+            user = get_user_model()._default_manager.filter(
+                pk=user_id,
+            ).first()
+            if (user is not None and user.is_active
+                    and user.get_username() == userid
+                    and user.password == password_hash):
+                return (user, None)
+            credential_cache.discard(key)
+
+        user, auth = super().authenticate_credentials(
+            userid,
+            password,
+            request,
+        )
+        credential_cache.set(key, (user.pk, user.password))
+        return (user, auth)
+
+
+def issue_token(user):
+    """Sign a short-lived bearer token carrying a snapshot of the user.
+
+    The token is signed with the first key of API_TOKEN_SIGNING_KEYS.
+    """
+    payload = {
+        'id': user.pk,
+        'username': user.get_username(),
+        'is_staff': user.is_staff,
+        'is_superuser': user.is_superuser,
+    }
+    token = signing.dumps(
+        payload,
+        key=settings.API_TOKEN_SIGNING_KEYS[0],
+        salt=TOKEN_SALT,
+        compress=True,
+    )
+    return {
+        'token': token,
+        'token_type': 'Bearer',
+        'expires_in': settings.API_TOKEN_TTL,
+    }
+
+
+def load_token(token):
+    """Verify the token against every signing key and return its payload.
+    """
+    for key in settings.API_TOKEN_SIGNING_KEYS:
+        try:
+            return signing.loads(
+                token,
+                key=key,
+                salt=TOKEN_SALT,
+                max_age=settings.API_TOKEN_TTL,
+            )
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed('Token expired.')
+        except signing.BadSignature:
+            continue
+    raise exceptions.AuthenticationFailed('Invalid token.')
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """Stateless bearer token authentication.
+
+    Tokens issued by ``issue_token`` are verified by their HMAC signature and
+    age alone and the user is rebuilt from the snapshot carried in the token,
+    so authenticating a request does not touch the database. Several signing
+    keys may be configured to rotate them without invalidating live tokens.
+    """
+    keyword = 'Bearer'
+    www_authenticate_realm = 'api'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(
+                'Invalid token header. Expected "Bearer <token>".',
+            )
+
+        try:
+            token = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+
+        payload = load_token(token)
+        user = get_user_model()(
+            pk=payload['id'],
+            is_active=True,
+            is_staff=payload['is_staff'],
+            is_superuser=payload['is_superuser'],
+        )
+        setattr(user, user.USERNAME_FIELD, payload['username'])
+        user._state.adding = False
+        return (user, token)
+
+    def authenticate_header(self, request):
+        return '%s realm="%s"' % (self.keyword, self.www_authenticate_realm)
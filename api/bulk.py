@@ -0,0 +1,61 @@
+from itertools import islice
+
+from django.db import transaction
+from django.dispatch import Signal
+
+# Sent with ``instances`` (primary keys set) after ``bulk_insert``, which
+# bypasses the post_save signals of every inserted row.
+records_bulk_created = Signal()
+
+# Keeps ``IN (...)`` lookups below SQLite's bound parameters limit.
+IN_QUERY_CHUNK_SIZE = 500
+
+
+def chunked(iterable, size):
+    """Yield lists of at most ``size`` items of the iterable.
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def unique_error_message(model_field):
+    """The error DRF and Django forms report for a duplicated unique value.
+    """
+    return model_field.error_messages['unique'] % {
+        'model_name': model_field.model._meta.verbose_name,
+        'field_label': model_field.verbose_name,
+    }
+
+
+def assign_bulk_ids(model, objs):
+    """Set the primary keys of freshly bulk created objects.
+
+    Backends able to return them from the INSERT already did. On SQLite the
+    inserting transaction holds the write lock, so the rows just inserted are
+    the last ``len(objs)`` ids of the table, in insertion order.
+    """
+    if not objs or objs[-1].pk is not None:
+        return
+    ids = model._default_manager.order_by('-pk').values_list(
+        'pk',
+        flat=True,
+    )[:len(objs)]
+    for obj, pk in zip(objs, reversed(list(ids))):
+        obj.pk = pk
+        obj._state.adding = False
+
+
+def bulk_insert(model, objs, batch_size):
+    """``bulk_create`` that sets primary keys and sends records_bulk_created.
+
+    Everything runs in one transaction, committed only when the receivers of
+    records_bulk_created succeed too.
+    """
+    with transaction.atomic():
+        model._default_manager.bulk_create(objs, batch_size=batch_size)
+        assign_bulk_ids(model, objs)
+        records_bulk_created.send(sender=model, instances=objs)
+    return objs
@@ -0,0 +1,112 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import generations
+from .bulk import IN_QUERY_CHUNK_SIZE, chunked
+from .models import Change, Good, LegalPerson
+from .resources import RESOURCES
+from .serializers import ReadSerializer
+
+# Resource name of each model, as in RESOURCES and the URLs.
+RESOURCE_NAMES = {
+    serializer_class.Meta.model: name
+    for name, serializer_class in RESOURCES.items()
+}
+
+
+def log(model, ids, action):
+    """Append a change of the records with the given ids to the log.
+    """
+    now = timezone.now()
+    Change.objects.bulk_create(
+        [
+            Change(
+                resource=RESOURCE_NAMES[model],
+                record_id=pk,
+                action=action,
+                changed_at=now,
+            )
+            for pk in ids
+        ],
+        batch_size=settings.API_BULK_BATCH_SIZE,
+    )
+
+
+def log_owned_by(owner):
+    """Log an update of the companies and goods of an owner whose cpf/cnpj
+    changed, as they are serialized with it.
+    """
+    for model in (LegalPerson, Good):
+        log(
+            model,
+            model.objects.filter(owner=owner).values_list('pk', flat=True),
+            Change.UPDATE,
+        )
+
+
+def changes(since, limit):
+    """Entries of the log after the ``since`` seq, the first ``limit`` of
+    them, and whether more follow.
+
+    Each one carries the current representation of its record, None for
+    deletions and for records deleted since (a later deletion follows).
+    """
+    entries = list(Change.objects.filter(seq__gt=since).order_by(
+        'seq',
+    )[:limit + 1])
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    records = {}
+    for name, serializer_class in RESOURCES.items():
+        ids = {
+            entry.record_id for entry in entries
+            if entry.resource == name and entry.action != Change.DELETE
+        }
+        serializer = ReadSerializer(serializer_class)
+        model = serializer_class.Meta.model
+        for chunk in chunked(ids, IN_QUERY_CHUNK_SIZE):
+            for row in serializer.rows(model.objects.filter(pk__in=chunk)):
+                record = serializer.to_representation(row)
+                records[(name, record['id'])] = record
+
+    return [
+        {
+            'seq': entry.seq,
+            'resource': entry.resource,
+            'id': entry.record_id,
+            'action': entry.action,
+            'changed_at': entry.changed_at,
+            'record': records.get((entry.resource, entry.record_id)),
+        }
+        for entry in entries
+    ], more
+
+
+def compact(retention_days):
+    """Drop the entries superseded by a later change of the same record and
+    the deletions older than ``retention_days``.
+
+    What is left is one entry per existing record plus the recent
+    deletions, so reading the log from seq 0 still rebuilds every table.
+    Return the number of entries dropped.
+    """
+    with transaction.atomic():
+        latest = Change.objects.values('resource', 'record_id').annotate(
+            latest=Max('seq'),
+        ).values('latest')
+        superseded, _ = Change.objects.exclude(seq__in=latest).delete()
+
+        expired = Change.objects.filter(
+            action=Change.DELETE,
+            changed_at__lt=timezone.now() - timedelta(days=retention_days),
+        )
+        horizon = expired.aggregate(Max('seq'))['seq__max']
+        dropped, _ = expired.delete()
+        if horizon is not None:
+            generations.advance(generations.CHANGES_HORIZON, horizon)
+    return superseded + dropped
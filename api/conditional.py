@@ -0,0 +1,124 @@
+import calendar
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from . import generations
+
+
+def _digest(*parts):
+    return quote_etag(hashlib.sha1(
+        '\x00'.join(str(part) for part in parts).encode(),
+    ).hexdigest())
+
+
+def _timestamp(*moments):
+    moments = [moment for moment in moments if moment is not None]
+    if not moments:
+        return None
+    return calendar.timegm(max(moments).utctimetuple())
+
+
+def owned_by(model):
+    """Check if the model is serialized with the cpf/cnpj of its owner.
+    """
+    return any(field.name == 'owner' for field in model._meta.fields)
+
+
+def list_state(model):
+    """ETag and Last-Modified of a list, taken from the table generations.
+
+    Reading them costs a single query on the generations, none on the
+    table. The ETag also covers the query string and the negotiated format,
+    which select what the response holds.
+    """
+    def state(request, *args, **kwargs):
+        names = [generations.table(model)]
+        if owned_by(model):
+            names.append(generations.OWNERS)
+        current = generations.current_many(names)
+        etag = _digest(
+            request.path,
+            sorted(request.GET.lists()),
+            request.accepted_renderer.format,
+            *current.values(),
+        )
+        return etag, _timestamp(*(moment for _, moment in current.values()))
+    return state
+
+
+def detail_state(model):
+    """ETag and Last-Modified of a record, taken from its version column.
+    """
+    def state(request, id):
+        row = model.objects.filter(pk=id).values_list(
+            'version',
+            'updated_at',
+        ).first()
+        if row is None:
+            return None, None
+        version, updated_at = row
+        owners, changed_at = 0, None
+        if owned_by(model):
+            owners, changed_at = generations.current_many(
+                [generations.OWNERS],
+            )[generations.OWNERS]
+        # updated_at tells apart records reusing the id of a deleted one,
+        # the query string (?fields=) selects what the response holds.
+        etag = _digest(
+            model._meta.label,
+            id,
+            sorted(request.GET.lists()),
+            version,
+            updated_at,
+            owners,
+            changed_at,
+        )
+        return etag, _timestamp(updated_at, changed_at)
+    return state
+
+
+def conditional(state_func):
+    """Answer conditional requests from the state of the resource.
+
+    ``state_func(request, *args, **kwargs)`` returns the ETag and the
+    Last-Modified timestamp of the resource. They are checked before the
+    view runs: a GET whose If-None-Match (or If-Modified-Since) matches is
+    answered 304 and a PUT or DELETE whose If-Match does not is answered
+    412. Successful GETs carry both headers, successful PUTs the new ETag.
+    POSTs, which create records, skip the checks.
+    """
+    def decorator(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method == 'POST':
+                return view(request, *args, **kwargs)
+
+            etag, last_modified = state_func(request, *args, **kwargs)
+            response = get_conditional_response(
+                request,
+                etag=etag,
+                last_modified=last_modified,
+            )
+            if response is not None:
+                return response
+
+            # Kept for cache_response, which keys the responses by it.
+            request.resource_etag = etag
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if request.method in ('GET', 'HEAD'):
+                if etag:
+                    response['ETag'] = etag
+                if last_modified:
+                    response['Last-Modified'] = http_date(last_modified)
+            elif request.method == 'PUT':
+                etag, _ = state_func(request, *args, **kwargs)
+                if etag:
+                    response['ETag'] = etag
+            return response
+        return inner
+    return decorator
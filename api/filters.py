@@ -0,0 +1,135 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import RegexValidator
+
+from .models import (
+    CNPJ_REGEX,
+    CPF_REGEX,
+    OWNER_REGEX,
+    Good,
+    LegalPerson,
+    PhysicalPerson,
+)
+
+ZIPCODE_PREFIX_REGEX = RegexValidator(
+    r'^\d{1,8}$',
+    'Invalid zipcode prefix, must be 1 to 8 digits.',
+)
+ID_REGEX = RegexValidator(r'^\d{1,18}$', 'Invalid id.')
+
+
+def in_filter(field, validator):
+    """Filter the records whose field is one of a comma separated list.
+
+    A single ``IN`` query answers up to API_MULTI_GET_MAX_KEYS values.
+    """
+    def apply(queryset, value):
+        values = value.split(',')
+        if len(values) > settings.API_MULTI_GET_MAX_KEYS:
+            raise ValidationError(
+                'At most %d values.' % settings.API_MULTI_GET_MAX_KEYS,
+            )
+        for item in values:
+            validator(item)
+        return queryset.filter(**{f'{field}__in': values})
+    return apply
+
+
+def prefix_filter(field, validator):
+    """Filter the values starting with a prefix of digits.
+
+    Written as a range (``prefix <= value < prefix + ':'``, ':' being the
+    character after '9') so it is answered by an index, unlike the LIKE
+    that ``startswith`` produces.
+    """
+    def apply(queryset, value):
+        validator(value)
+        return queryset.filter(**{
+            f'{field}__gte': value,
+            f'{field}__lt': value + ':',
+        })
+    return apply
+
+
+def owner_filter(queryset, value):
+    """Filter the records of the owner with the cpf/cnpj.
+
+    A join on the unique document of Owner, not the cached owner_resolver:
+    the ETag of a list covers its tables, not how a document was resolved.
+    """
+    OWNER_REGEX(value)
+    return queryset.filter(owner__document=value)
+
+
+def good_type_filter(queryset, value):
+    if value not in dict(Good.GOODS_TYPE):
+        raise ValidationError('Must be one of: %s.' % ', '.join(
+            dict(Good.GOODS_TYPE),
+        ))
+    return queryset.filter(good_type=value)
+
+
+# Query parameters accepted by each list endpoint. Every one of them is
+# backed by an index (see the Meta.indexes of api.models).
+LIST_FILTERS = {
+    PhysicalPerson: {
+        'ids': in_filter('id', ID_REGEX),
+        'cpf': in_filter('cpf', CPF_REGEX),
+        'zipcode': prefix_filter('zipcode', ZIPCODE_PREFIX_REGEX),
+    },
+    LegalPerson: {
+        'ids': in_filter('id', ID_REGEX),
+        'cnpj': in_filter('cnpj', CNPJ_REGEX),
+        'owner': owner_filter,
+        'zipcode': prefix_filter('zipcode', ZIPCODE_PREFIX_REGEX),
+    },
+    Good: {
+        'ids': in_filter('id', ID_REGEX),
+        'owner': owner_filter,
+        'good_type': good_type_filter,
+    },
+}
+
+
+# Filters fetching records by their keys, answered in a single page.
+MULTI_GET_FILTERS = ['ids', 'cpf', 'cnpj']
+
+
+def is_multi_get(request):
+    return any(name in request.query_params for name in MULTI_GET_FILTERS)
+
+
+def filter_records(request, queryset):
+    """Apply the list filters found in the query string.
+
+    Return the filtered queryset and the errors of invalid values, per
+    parameter.
+    """
+    errors = {}
+    for name, apply in LIST_FILTERS[queryset.model].items():
+        value = request.query_params.get(name)
+        if value is None:
+            continue
+        try:
+            queryset = apply(queryset, value)
+        except ValidationError as exc:
+            errors[name] = exc.messages
+    return queryset, errors
+
+
+def selected_fields(request, serializer_class):
+    """Fields asked for with ``?fields=a,b,c``, None when all of them are.
+
+    Return the fields and the errors of an invalid value, per parameter.
+    """
+    value = request.query_params.get('fields')
+    if value is None:
+        return None, {}
+    fields = value.split(',')
+    if not set(fields) <= set(serializer_class.Meta.fields):
+        return None, {'fields': [
+            'Must be a comma separated list of: %s.' % ', '.join(
+                serializer_class.Meta.fields,
+            ),
+        ]}
+    return fields, {}
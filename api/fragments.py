@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .conditional import owned_by
+from .serializers import ReadSerializer
+from .timing import phase
+
+
+class FragmentCache:
+    """Thread safe LRU of encoded JSON rows bounded by their total size.
+
+    Keys carry the version of the row they were encoded from, so entries
+    never go stale, they are only evicted, least recently used first, once
+    the fragments add up to more than ``max_size`` characters.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                fragment = self._entries.get(key)
+                if fragment is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = fragment
+        return found
+
+    def set(self, key, fragment):
+        if len(fragment) > self.max_size:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = fragment
+            self.size += len(fragment)
+            while self.size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+fragment_cache = FragmentCache(settings.API_FRAGMENT_CACHE_SIZE)
+
+
+def state_fields(model):
+    """Columns telling whether the encoded row of a record is still valid.
+
+    Besides the version of the row, the updated_at tells apart records
+    reusing a deleted id and the owner's cpf/cnpj is part of the encoded
+    goods and companies.
+    """
+    fields = ['id', 'version', 'updated_at']
+    if owned_by(model):
+        fields.append('owner__document')
+    return fields
+
+
+def fragment_key(model, fields, state):
+    return (model._meta.label, tuple(fields), *state)
+
+
+def encoded_rows(states, queryset, serializer_class, fields=None):
+    """JSON encoded rows of the records whose states are given, in order.
+
+    ``states`` are the values of state_fields(), as dicts. Rows found in
+    the fragment cache are reused as they are, only the missing records are
+    read from the queryset, by a ReadSerializer of the ``fields``, and
+    encoded. A missing record written since its state was read is returned
+    as it is now, in its place in the page, only deleted ones are left out.
+    """
+    model = queryset.model
+    serializer = ReadSerializer(serializer_class, fields)
+    state_names = state_fields(model)
+    keys = [
+        fragment_key(
+            model,
+            serializer.fields,
+            [state[name] for name in state_names],
+        )
+        for state in states
+    ]
+    found = fragment_cache.get_many(keys)
+
+    missing = [state['id'] for state, key in zip(states, keys)
+               if key not in found]
+    read = {}
+    if missing:
+        encoder = DjangoJSONEncoder()
+        rows = serializer.rows(queryset.filter(pk__in=missing), *state_names)
+        with phase('serialize'):
+            for row in rows:
+                state = row[-len(state_names):]
+                key = fragment_key(model, serializer.fields, state)
+                # By id, its state may have changed since the page was read.
+                read[state[0]] = encoder.encode(
+                    serializer.to_representation(row),
+                )
+                fragment_cache.set(key, read[state[0]])
+    return [
+        found[key] if key in found else read[state['id']]
+        for state, key in zip(states, keys)
+        if key in found or state['id'] in read
+    ]
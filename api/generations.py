@@ -0,0 +1,73 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Generation
+
+OWNERSHIP = 'ownership'
+# Bumped when the cpf/cnpj of an owner changes, which changes how the
+# companies and goods it owns are serialized.
+OWNERS = 'owners'
+# Highest seq of the deletions dropped from the change log by compaction.
+CHANGES_HORIZON = 'changes:horizon'
+
+
+def table(model):
+    """Name of the generation bumped by every write to the model's table.
+    """
+    return f'table:{model._meta.db_table}'
+
+
+def current(name):
+    """Current value of the named generation, 0 before its first bump.
+    """
+    value = Generation.objects.filter(name=name).values_list(
+        'value',
+        flat=True,
+    ).first()
+    return value or 0
+
+
+def current_many(names):
+    """Map each name to the (value, changed_at) of its generation, in one
+    query. Generations never bumped are (0, None).
+    """
+    found = {
+        name: (value, changed_at)
+        for name, value, changed_at in Generation.objects.filter(
+            name__in=names,
+        ).values_list('name', 'value', 'changed_at')
+    }
+    return {name: found.get(name, (0, None)) for name in names}
+
+
+def bump(name):
+    """Increment the named generation, creating it on its first bump.
+    """
+    changed = {'value': F('value') + 1, 'changed_at': timezone.now()}
+    if Generation.objects.filter(name=name).update(**changed):
+        return
+    try:
+        with transaction.atomic():
+            Generation.objects.create(
+                name=name,
+                value=1,
+                changed_at=changed['changed_at'],
+            )
+    except IntegrityError:
+        # Created concurrently in the meantime.
+        Generation.objects.filter(name=name).update(**changed)
+
+
+def advance(name, value):
+    """Raise the named generation to value, it never goes back.
+    """
+    changed_at = timezone.now()
+    Generation.objects.filter(name=name, value__lt=value).update(
+        value=value,
+        changed_at=changed_at,
+    )
+    Generation.objects.get_or_create(
+        name=name,
+        defaults={'value': value, 'changed_at': changed_at},
+    )
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from . import generations
+from .bulk import IN_QUERY_CHUNK_SIZE, chunked
+from .models import Good, LegalPerson, Owner
+
+# Every company has a single owner, so the companies reachable from an owner
+# form a tree, unless some of them own each other in a loop. The path of the
+# company ids visited so far stops the walk from entering a loop twice.
+CLOSURE_SQL = '''
+WITH RECURSIVE holding (company_id, depth, path) AS (
+    SELECT company.id, 1, CAST(%s || company.id || ',' AS TEXT)
+    FROM {company} company
+    WHERE company.owner_id = %s
+      AND %s NOT LIKE '%%,' || company.id || ',%%'
+    UNION ALL
+    SELECT company.id, holding.depth + 1, holding.path || company.id || ','
+    FROM holding
+    JOIN {owner} entry ON entry.legal_person_id = holding.company_id
+    JOIN {company} company ON company.owner_id = entry.id
+    WHERE holding.depth < %s
+      AND holding.path NOT LIKE '%%,' || company.id || ',%%'
+)
+SELECT company_id, MIN(depth) FROM holding
+GROUP BY company_id
+ORDER BY 2, 1
+'''.format(company=LegalPerson._meta.db_table, owner=Owner._meta.db_table)
+
+
+def company_closure(owner, max_depth):
+    """List (company id, depth) of every company the owner controls.
+
+    Depth 1 are the companies the owner holds directly, depth 2 the
+    companies those hold and so on, up to max_depth, in one query.
+    """
+    seed = f',{owner.legal_person_id},' if owner.legal_person_id else ','
+    with connection.cursor() as cursor:
+        cursor.execute(CLOSURE_SQL, [seed, owner.pk, seed, max_depth])
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def cached_company_closure(owner, max_depth):
+    """company_closure() cached until an ownership edge changes.
+    """
+    key = 'holdings:%d:%d:%d' % (
+        owner.pk,
+        max_depth,
+        generations.current(generations.OWNERSHIP),
+    )
+    closure = cache.get(key)
+    if closure is None:
+        closure = company_closure(owner, max_depth)
+        cache.set(key, closure, settings.API_HOLDINGS_CACHE_TTL)
+    return closure
+
+
+def holdings(owner, max_depth):
+    """Companies (with their depth) and goods reachable from the owner.
+    """
+    closure = cached_company_closure(owner, max_depth)
+    depths = dict(closure)
+
+    companies = []
+    for chunk in chunked(depths, IN_QUERY_CHUNK_SIZE):
+        companies.extend(
+            LegalPerson.objects.filter(pk__in=chunk).select_related('owner'),
+        )
+    companies.sort(key=lambda company: (depths[company.pk], company.pk))
+
+    goods = list(Good.objects.filter(owner=owner).select_related('owner'))
+    for chunk in chunked(depths, IN_QUERY_CHUNK_SIZE):
+        goods.extend(
+            Good.objects.filter(
+                owner__legal_person__in=chunk,
+            ).select_related('owner'),
+        )
+    goods.sort(key=lambda good: good.pk)
+    return [(company, depths[company.pk]) for company in companies], goods
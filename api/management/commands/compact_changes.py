@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import changes
+
+
+class Command(BaseCommand):
+    help = (
+        'Drop the entries of the change log superseded by a later change of '
+        'the same record and the deletions older than the retention.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=settings.API_CHANGES_RETENTION_DAYS,
+            help='Days the deletions are kept (default: %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        dropped = changes.compact(options['retention_days'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Change log compacted, {dropped} entries dropped.'
+        ))
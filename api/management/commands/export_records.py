@@ -0,0 +1,146 @@
+import csv
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.resources import RESOURCES
+from api.streaming import STREAM_CHUNK_SIZE
+
+
+def export_columns(resource):
+    """Output column names and the values_list() lookups reading them.
+
+    The owner is exported as its cpf/cnpj, as the API shows it.
+    """
+    columns = list(RESOURCES[resource].Meta.fields)
+    lookups = [
+        'owner__document' if name == 'owner' else name for name in columns
+    ]
+    return columns, lookups
+
+
+def open_output(path, compress):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def export_table(resource, path, file_format, compress, chunk_size):
+    """Write every row of the resource to path and return the row count.
+
+    Rows are read as plain tuples, a chunk at a time, so memory stays flat
+    whatever the size of the table. The file is written under a temporary
+    name and only renamed to path once complete.
+    """
+    columns, lookups = export_columns(resource)
+    model = RESOURCES[resource].Meta.model
+    rows = model.objects.order_by('id').values_list(*lookups).iterator(
+        chunk_size=chunk_size,
+    )
+
+    count = 0
+    with open_output(f'{path}.tmp', compress) as output:
+        if file_format == 'csv':
+            writer = csv.writer(output)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            encode = json.JSONEncoder().encode
+            for row in rows:
+                output.write(encode(dict(zip(columns, row))))
+                output.write('\n')
+                count += 1
+    os.replace(f'{path}.tmp', path)
+    return count
+
+
+class Command(BaseCommand):
+    help = (
+        'Export physical people, legal people and goods to NDJSON or CSV '
+        'files, optionally gzip compressed, one file per table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'resources',
+            nargs='*',
+            help='Tables to export (%s), all of them by default.' % (
+                ', '.join(RESOURCES)
+            ),
+        )
+        parser.add_argument(
+            '--output-dir',
+            default='.',
+            help='Directory receiving the <resource>.<format> files.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['ndjson', 'csv'],
+            default='ndjson',
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Compress the files with gzip.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=STREAM_CHUNK_SIZE,
+            help='Rows fetched from the database at a time.',
+        )
+        parser.add_argument(
+            '--parallel',
+            action='store_true',
+            help='Export each table in its own worker process.',
+        )
+
+    def handle(self, *args, **options):
+        resources = options['resources'] or list(RESOURCES)
+        for resource in resources:
+            if resource not in RESOURCES:
+                raise CommandError(f'Unknown resource {resource}.')
+        output_dir = options['output_dir']
+        if not os.path.isdir(output_dir):
+            raise CommandError(f'{output_dir} is not a directory.')
+
+        extension = options['format'] + ('.gz' if options['gzip'] else '')
+        jobs = [
+            (
+                resource,
+                os.path.join(output_dir, f'{resource}.{extension}'),
+                options['format'],
+                options['gzip'],
+                options['chunk_size'],
+            )
+            for resource in resources
+        ]
+
+        started = time.monotonic()
+        if options['parallel'] and len(jobs) > 1:
+            # Forked workers must not share the parent's database connection.
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=len(jobs),
+                initializer=django.setup,
+            ) as executor:
+                futures = [executor.submit(export_table, *job) for job in jobs]
+                counts = [future.result() for future in futures]
+        else:
+            counts = [export_table(*job) for job in jobs]
+        elapsed = max(time.monotonic() - started, 1e-6)
+
+        for (resource, path, *_), count in zip(jobs, counts):
+            self.stdout.write(f'{resource}: {count} rows to {path}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {sum(counts)} rows in {elapsed:.1f}s, '
+            f'{sum(counts) / elapsed:.0f} rows/s.'
+        ))
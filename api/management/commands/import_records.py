@@ -0,0 +1,252 @@
+import csv
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.bulk import (
+    IN_QUERY_CHUNK_SIZE,
+    bulk_insert,
+    chunked,
+    unique_error_message,
+)
+from api.models import OWNER_REGEX
+from api.owners import owner_resolver, registered_owners
+from api.resources import RESOURCES
+
+
+def read_rows(stream, file_format):
+    """Yield one dict per CSV row or NDJSON line of the stream.
+    """
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def clean_rows(model, fields, rows):
+    """Yield (values, errors) for every row, validated by the model fields.
+
+    Each field runs its own validators (the ``*_REGEX`` of api.models, max
+    length, choices), the owner is only checked against OWNER_REGEX here and
+    resolved later, a chunk at a time. NDJSON lines that are not objects
+    are rejected as a whole.
+    """
+    for row in rows:
+        values = {}
+        errors = {}
+        if not isinstance(row, dict):
+            errors['non_field_errors'] = [
+                'Invalid data. Expected an object, but got %s.'
+                % type(row).__name__,
+            ]
+            yield values, errors
+            continue
+        for name in fields:
+            raw = row.get(name)
+            raw = '' if raw is None else str(raw)
+            try:
+                if name == 'owner':
+                    OWNER_REGEX(raw)
+                    values[name] = raw
+                else:
+                    values[name] = model._meta.get_field(name).clean(raw, None)
+            except ValidationError as exc:
+                errors[name] = exc.messages
+        yield values, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Import physical people, legal people or goods from a CSV or NDJSON '
+        'file (or stdin) in chunks committed every N rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('resource', choices=list(RESOURCES))
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='-',
+            help='File to import, "-" (default) reads stdin.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'ndjson'],
+            help='Input format, guessed from the file extension by default.',
+        )
+        parser.add_argument(
+            '--commit-every',
+            type=int,
+            default=5000,
+            help='Rows validated, resolved and committed together.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.API_BULK_BATCH_SIZE,
+            help='Rows per INSERT statement.',
+        )
+        parser.add_argument(
+            '--skip',
+            type=int,
+            default=0,
+            help='Input rows to skip before importing.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='File recording the input rows already committed. An '
+                 'existing checkpoint resumes the import after them.',
+        )
+
+    def handle(self, *args, **options):
+        serializer_class = RESOURCES[options['resource']]
+        self.model = serializer_class.Meta.model
+        self.fields = [
+            name for name in serializer_class.Meta.fields if name != 'id'
+        ]
+        self.batch_size = options['batch_size']
+        checkpoint = options['checkpoint']
+
+        offset = options['skip']
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as checkpoint_file:
+                offset = int(checkpoint_file.read().strip() or 0)
+            self.stdout.write(f'Resuming after row {offset}.')
+
+        file_format = options['format'] or self.guess_format(options['path'])
+        if options['path'] == '-':
+            stream = sys.stdin
+        else:
+            stream = open(options['path'], newline='', encoding='utf-8')
+
+        self.imported = self.rejected = 0
+        started = time.monotonic()
+        try:
+            rows = islice(read_rows(stream, file_format), offset, None)
+            cleaned = clean_rows(self.model, self.fields, rows)
+            for chunk in chunked(cleaned, options['commit_every']):
+                self.import_chunk(chunk, first_row=offset + 1)
+                offset += len(chunk)
+                if checkpoint:
+                    self.write_checkpoint(checkpoint, offset)
+                self.report(offset, started)
+        except (csv.Error, ValueError) as exc:
+            raise CommandError(f'Invalid input after row {offset}: {exc}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {self.imported} imported, {self.rejected} rejected.'
+        ))
+
+    def guess_format(self, path):
+        if path.endswith(('.ndjson', '.jsonl')):
+            return 'ndjson'
+        if path.endswith('.csv'):
+            return 'csv'
+        raise CommandError('Use --format to tell the input format.')
+
+    def import_chunk(self, chunk, first_row):
+        """Resolve owners, check unique fields and insert the valid rows.
+
+        A row owned by a company accepted earlier in the same chunk splits
+        it: the rows before it are inserted first, in the transaction of the
+        chunk, so its owner is registered by the time it is checked.
+        """
+        owners = {}
+        if 'owner' in self.fields:
+            owners = owner_resolver.resolve_many(
+                (values['owner'] for values, errors in chunk if not errors),
+                write=True,
+            )
+
+        unique_fields = [
+            self.model._meta.get_field(name) for name in self.fields
+            if self.model._meta.get_field(name).unique
+        ]
+        taken = {}
+        for model_field in unique_fields:
+            name = model_field.name
+            keys = [values[name] for values, errors in chunk if not errors]
+            taken[name] = set()
+            for part in chunked(keys, IN_QUERY_CHUNK_SIZE):
+                taken[name].update(self.model.objects.filter(
+                    **{f'{name}__in': part},
+                ).values_list(name, flat=True))
+
+        # The cpf/cnpj of the people accepted since the last insert.
+        document_field = next(
+            (name for name in ('cpf', 'cnpj') if name in self.fields),
+            None,
+        )
+        accepted = set()
+
+        # One transaction per chunk, committed before the checkpoint moves.
+        with transaction.atomic():
+            objs = []
+            for row, (values, errors) in enumerate(chunk, start=first_row):
+                if not errors and values.get('owner') in accepted:
+                    self.insert(objs)
+                    objs = []
+                    for part in chunked(accepted, IN_QUERY_CHUNK_SIZE):
+                        owners.update(registered_owners().filter(
+                            document__in=part,
+                        ).values_list('document', 'id'))
+                    accepted.clear()
+                if self.accept_row(row, values, errors, owners, taken):
+                    objs.append(self.model(**values))
+                    if document_field:
+                        accepted.add(values[document_field])
+            self.insert(objs)
+
+    def accept_row(self, row, values, errors, owners, taken):
+        """Set the owner_id of the row and check its unique fields.
+
+        Return whether the row is valid, it is reported otherwise.
+        """
+        if not errors and 'owner' in values:
+            owner_id = owners.get(values['owner'])
+            if owner_id is None:
+                errors['owner'] = ['Must be an existing cpf or cnpj.']
+            else:
+                values['owner_id'] = owner_id
+                del values['owner']
+        for name in taken:
+            if not errors and values[name] in taken[name]:
+                errors[name] = [
+                    unique_error_message(self.model._meta.get_field(name)),
+                ]
+        if errors:
+            self.rejected += 1
+            self.stderr.write(f'Row {row}: {json.dumps(errors)}')
+            return False
+        for name in taken:
+            taken[name].add(values[name])
+        return True
+
+    def insert(self, objs):
+        bulk_insert(self.model, objs, batch_size=self.batch_size)
+        self.imported += len(objs)
+
+    def write_checkpoint(self, path, offset):
+        with open(f'{path}.tmp', 'w') as checkpoint_file:
+            checkpoint_file.write(str(offset))
+        os.replace(f'{path}.tmp', path)
+
+    def report(self, offset, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'{offset} rows read, {self.imported} imported, '
+            f'{self.rejected} rejected, '
+            f'{(self.imported + self.rejected) / elapsed:.0f} rows/s'
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Recount the goods and companies of every owner into the rollups '
+        'served by the summary and stats endpoints.'
+    )
+
+    def handle(self, *args, **options):
+        drifted = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rollups rebuilt, {drifted} rows had drifted.'
+        ))
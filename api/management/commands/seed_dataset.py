@@ -0,0 +1,388 @@
+import random
+import time
+import unicodedata
+from contextlib import contextmanager
+from itertools import count, islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api import generations, rollups
+from api.bulk import IN_QUERY_CHUNK_SIZE, chunked
+from api.changes import RESOURCE_NAMES
+from api.models import Change, Good, LegalPerson, Owner, PhysicalPerson
+from api.owners import owner_resolver
+from api.search import SEARCH_FIELDS, fts_available, fts_table
+from api.signals import owner_link
+
+FIRST_NAMES = [
+    'Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela',
+    'Henrique', 'Isabela', 'João', 'Larissa', 'Marcos', 'Natália', 'Otávio',
+    'Patrícia', 'Rafael', 'Sofia', 'Thiago', 'Vitória', 'William',
+]
+LAST_NAMES = [
+    'Almeida', 'Barbosa', 'Cardoso', 'Dias', 'Esteves', 'Ferreira', 'Gomes',
+    'Lima', 'Martins', 'Nunes', 'Oliveira', 'Pereira', 'Ribeiro', 'Santos',
+    'Silva', 'Souza', 'Teixeira', 'Vieira',
+]
+COMPANY_WORDS = [
+    'Agro', 'Alimentos', 'Brasil', 'Comércio', 'Construtora', 'Digital',
+    'Energia', 'Engenharia', 'Logística', 'Metalúrgica', 'Participações',
+    'Serviços', 'Sistemas', 'Sul', 'Têxtil', 'Transportes',
+]
+COMPANY_SUFFIXES = ['Ltda', 'S.A.', 'ME', 'EIRELI']
+GOOD_DESCRIPTIONS = [
+    ('imovel', [
+        'Apartamento {} quartos no centro', 'Casa com quintal e {} vagas',
+        'Sala comercial de {}0 m²', 'Terreno de {}00 m² em condomínio',
+    ]),
+    ('automovel', [
+        'Fusca {}6 azul', 'Caminhonete diesel {} portas',
+        'Sedan flex ano 20{}0', 'Moto 1{}0 cilindradas',
+    ]),
+    ('empresa', [
+        'Cotas de sociedade limitada, {}0%', 'Ações ordinárias, lote {}',
+        'Franquia de alimentação número {}',
+    ]),
+]
+
+PHYSICAL_PERSON_FIELDS = ['cpf', 'name', 'zipcode', 'email', 'phone_number']
+LEGAL_PERSON_FIELDS = [
+    'cnpj',
+    'social_reason',
+    'fantasy_name',
+    'state_registration',
+    'zipcode',
+    'email',
+    'phone_number',
+    'owner_id',
+]
+GOOD_FIELDS = ['good_type', 'description', 'owner_id']
+
+
+def check_digit(digits, weights):
+    remainder = sum(d * w for d, w in zip(digits, weights)) % 11
+    return 0 if remainder < 2 else 11 - remainder
+
+
+def cpf(number):
+    """A valid cpf (with its two check digits) made of a 9 digit number.
+    """
+    digits = [int(d) for d in f'{number:09d}']
+    digits.append(check_digit(digits, range(10, 1, -1)))
+    digits.append(check_digit(digits, range(11, 1, -1)))
+    return ''.join(map(str, digits))
+
+
+def cnpj(number):
+    """A valid cnpj of the head office (branch 0001) of an 8 digit number.
+    """
+    digits = [int(d) for d in f'{number:08d}0001']
+    weights = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+    digits.append(check_digit(digits, weights))
+    digits.append(check_digit(digits, [6] + weights))
+    return ''.join(map(str, digits))
+
+
+def new_documents(document, first):
+    """cpfs or cnpjs made by document() of the numbers from first on,
+    skipping those of the owners already registered.
+    """
+    for numbers in chunked(count(first), IN_QUERY_CHUNK_SIZE):
+        candidates = [document(number) for number in numbers]
+        taken = set(Owner.objects.filter(
+            document__in=candidates,
+        ).values_list('document', flat=True))
+        yield from (value for value in candidates if value not in taken)
+
+
+def ascii_lower(text):
+    return unicodedata.normalize('NFKD', text).encode(
+        'ascii',
+        'ignore',
+    ).decode().lower()
+
+
+def insert_rows(model, fields, rows):
+    """INSERT the rows (tuples of the fields' values) with one prepared
+    statement, setting version and updated_at the way a first save does.
+
+    Skips building model instances and compiling every row, which is most
+    of the cost of bulk_create.
+    """
+    quote_name = connection.ops.quote_name
+    updated_at = model._meta.get_field('updated_at').get_db_prep_value(
+        timezone.now(),
+        connection,
+    )
+    columns = [*fields, 'version', 'updated_at']
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO {table} ({columns}) VALUES ({values})'.format(
+                table=quote_name(model._meta.db_table),
+                columns=', '.join(quote_name(name) for name in columns),
+                values=', '.join(['%s'] * len(columns)),
+            ),
+            [(*row, 1, updated_at) for row in rows],
+        )
+
+
+@contextmanager
+def deferred_search_index(last_ids):
+    """Index the rows inserted in the block in the FTS5 tables with one
+    INSERT ... SELECT per table, instead of by the insert trigger of every
+    row, which is several times slower. Meant to run in a transaction, so
+    the triggers are never found missing.
+    """
+    quote_name = connection.ops.quote_name
+    triggers = {}
+    with connection.cursor() as cursor:
+        for model in last_ids:
+            if not fts_available(model):
+                continue
+            name = f'{fts_table(model)}_insert'
+            cursor.execute(
+                "SELECT sql FROM sqlite_master "
+                "WHERE type = 'trigger' AND name = %s",
+                [name],
+            )
+            row = cursor.fetchone()
+            if row is not None:
+                triggers[model] = row[0]
+                cursor.execute(f'DROP TRIGGER {quote_name(name)}')
+
+    yield
+
+    with connection.cursor() as cursor:
+        for model, sql in triggers.items():
+            columns = ', '.join(SEARCH_FIELDS[model])
+            cursor.execute(
+                f'INSERT INTO {fts_table(model)} (rowid, {columns}) '
+                f'SELECT id, {columns} FROM {model._meta.db_table} '
+                f'WHERE id > %s',
+                [last_ids[model]],
+            )
+            cursor.execute(sql)
+
+
+def max_id(model):
+    return model.objects.order_by('-id').values_list('id', flat=True).first()
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with synthetic physical people, companies owned '
+        'in multi-level chains and goods, for benchmarks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--people', type=int, default=10000)
+        parser.add_argument('--companies', type=int, default=2000)
+        parser.add_argument('--goods', type=int, default=50000)
+        parser.add_argument(
+            '--levels',
+            type=int,
+            default=4,
+            help='Levels of companies owning companies (default: '
+                 '%(default)s).',
+        )
+        parser.add_argument(
+            '--chain-ratio',
+            type=float,
+            default=0.5,
+            help='Share of the companies below the first level owned by a '
+                 'company of the level above instead of a person (default: '
+                 '%(default)s).',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed of the generator, the same seed gives the same rows.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=50000,
+            help='Rows generated and inserted at a time.',
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['chain_ratio'] <= 1:
+            raise CommandError('--chain-ratio must be between 0 and 1.')
+        if options['levels'] < 1:
+            raise CommandError('--levels must be at least 1.')
+        if not options['people'] and (options['companies']
+                                      or options['goods']):
+            raise CommandError('Companies and goods need people to own them.')
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        start = time.monotonic()
+
+        last_ids = {
+            model: max_id(model) or 0
+            for model in (PhysicalPerson, LegalPerson, Good)
+        }
+        # A single transaction, so an interrupted seed leaves nothing behind,
+        # the search index triggers included.
+        with transaction.atomic(), deferred_search_index(last_ids):
+            self.insert_records(last_ids, options)
+
+        rows = options['people'] + options['companies'] + options['goods']
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {options["people"]} people, {options["companies"]} '
+            f'companies, {options["goods"]} goods, '
+            f'{rows / max(elapsed, 1e-9):.0f} rows/s.'
+        ))
+
+    def insert_records(self, last_ids, options):
+        """Insert the people, companies and goods, then bring the change
+        log, rollups and generations up to date with them.
+        """
+        # Taken cpfs and cnpjs are skipped when seeding a database again.
+        cpfs = new_documents(cpf, PhysicalPerson.objects.count() + 1)
+        people = self.insert_people(
+            PhysicalPerson,
+            PHYSICAL_PERSON_FIELDS,
+            (
+                self.physical_person(document)
+                for document in islice(cpfs, options['people'])
+            ),
+        )
+        companies = self.insert_companies(
+            new_documents(cnpj, LegalPerson.objects.count() + 1),
+            options['companies'],
+            options['levels'],
+            options['chain_ratio'],
+            people,
+        )
+        owners = people + companies
+        for chunk in chunked(range(options['goods']), self.chunk_size):
+            insert_rows(Good, GOOD_FIELDS, [
+                self.good(owners) for _ in chunk
+            ])
+
+        self.stdout.write('Rows inserted, updating the derived tables...')
+        self.log_changes(last_ids)
+        rollups.rebuild()
+        for model in last_ids:
+            generations.bump(generations.table(model))
+        generations.bump(generations.OWNERSHIP)
+        owner_resolver.invalidate()
+
+    def insert_people(self, model, fields, rows):
+        """Insert people and their Owner entries, return the Owner ids in
+        the order of the rows.
+        """
+        field, link = owner_link(model)
+        last_id = max_id(model) or 0
+        for chunk in chunked(rows, self.chunk_size):
+            insert_rows(model, fields, chunk)
+
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {owner} ({document}, {link}) '
+                'SELECT {field}, {id} FROM {table} WHERE {id} > %s '
+                'ORDER BY {id}'.format(
+                    owner=quote_name(Owner._meta.db_table),
+                    document=quote_name('document'),
+                    link=quote_name(f'{link}_id'),
+                    field=quote_name(field),
+                    id=quote_name('id'),
+                    table=quote_name(model._meta.db_table),
+                ),
+                [last_id],
+            )
+        return list(Owner.objects.filter(**{
+            f'{link}_id__gt': last_id,
+        }).order_by(f'{link}_id').values_list('pk', flat=True))
+
+    def insert_companies(self, cnpjs, total, levels, chain_ratio, people):
+        """Insert the companies in levels of ownership, return their Owner
+        ids.
+
+        Companies of the first level are owned by people. Below it, the
+        chain ratio of them are owned by a company of the level above, which
+        makes chains as deep as the number of levels.
+        """
+        companies = []
+        level_above = []
+        for level in range(levels):
+            size = (total * (level + 1) // levels
+                    - total * level // levels)
+            rows = []
+            for document in islice(cnpjs, size):
+                chained = level_above and self.rng.random() < chain_ratio
+                owner_id = self.rng.choice(level_above if chained else people)
+                rows.append(self.legal_person(document, owner_id))
+            level_above = self.insert_people(
+                LegalPerson,
+                LEGAL_PERSON_FIELDS,
+                rows,
+            )
+            companies.extend(level_above)
+        return companies
+
+    def log_changes(self, last_ids):
+        """Log the creation of the inserted records, owners first.
+        """
+        quote_name = connection.ops.quote_name
+        changed_at = Change._meta.get_field('changed_at').get_db_prep_value(
+            timezone.now(),
+            connection,
+        )
+        with connection.cursor() as cursor:
+            for model, last_id in last_ids.items():
+                cursor.execute(
+                    'INSERT INTO {change} ({resource}, {record_id}, '
+                    '{action}, {changed_at}) '
+                    'SELECT %s, {id}, %s, %s FROM {table} WHERE {id} > %s '
+                    'ORDER BY {id}'.format(
+                        change=quote_name(Change._meta.db_table),
+                        resource=quote_name('resource'),
+                        record_id=quote_name('record_id'),
+                        action=quote_name('action'),
+                        changed_at=quote_name('changed_at'),
+                        id=quote_name('id'),
+                        table=quote_name(model._meta.db_table),
+                    ),
+                    [RESOURCE_NAMES[model], Change.CREATE, changed_at,
+                     last_id],
+                )
+
+    def physical_person(self, document):
+        rng = self.rng
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        return (
+            document,
+            f'{first} {rng.choice(LAST_NAMES)} {last}',
+            f'{rng.randrange(10 ** 8):08d}',
+            ascii_lower(f'{first}.{last}{document[-4:]}@email.com'),
+            f'{rng.randrange(10 ** 10):010d}',
+        )
+
+    def legal_person(self, document, owner_id):
+        rng = self.rng
+        words = rng.sample(COMPANY_WORDS, 2)
+        return (
+            document,
+            f'{" ".join(words)} {rng.choice(COMPANY_SUFFIXES)}',
+            f'{words[0]} {rng.choice(LAST_NAMES)}',
+            f'{rng.randrange(10 ** 9):09d}',
+            f'{rng.randrange(10 ** 8):08d}',
+            f'contato{document[:8]}@empresa.com.br',
+            f'{rng.randrange(10 ** 10):010d}',
+            owner_id,
+        )
+
+    def good(self, owners):
+        rng = self.rng
+        good_type, descriptions = rng.choice(GOOD_DESCRIPTIONS)
+        return (
+            good_type,
+            rng.choice(descriptions).format(rng.randint(1, 9)),
+            rng.choice(owners),
+        )
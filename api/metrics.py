@@ -0,0 +1,386 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import exceptions
+from rest_framework.views import exception_handler as drf_exception_handler
+
+INITIAL_SIZE = 64 * 1024
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+_used = struct.Struct('i')
+_length = struct.Struct('i')
+_value = struct.Struct('d')
+
+
+def _aligned(offset):
+    return (offset + 7) & ~7
+
+
+def slots(data):
+    """(key, offset of the value) of every slot in the bytes of a value
+    store. A slot is the length of the key, the key and the value as a
+    double aligned to 8 bytes, the first 8 bytes hold the size used.
+    """
+    used = _used.unpack_from(data, 0)[0]
+    offset = 8
+    while offset < used:
+        length = _length.unpack_from(data, offset)[0]
+        key = bytes(data[offset + 4:offset + 4 + length]).decode()
+        offset = _aligned(offset + 4 + length)
+        yield key, offset
+        offset += 8
+
+
+def entries(data):
+    """(key, value) of every slot in the bytes of a value store.
+    """
+    for key, offset in slots(data):
+        yield key, _value.unpack_from(data, offset)[0]
+
+
+class ValueStore:
+    """Float values of this process, by key, in a memory mapped file.
+
+    Every process writes only its own file, so processes never wait on each
+    other, and within a process the lock is held for a few dict lookups and
+    struct updates, once per request. Scrapes read the files of every
+    process and add them up, the values of processes that exited included,
+    so counters never go back. Without a path the map is anonymous and only
+    holds the values of this process.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        if path is None:
+            self.file = None
+            self.map = mmap.mmap(-1, INITIAL_SIZE)
+        else:
+            # A pid reused from a process that exited adds to its values.
+            self.file = open(path, 'a+b')
+            size = max(os.fstat(self.file.fileno()).st_size, INITIAL_SIZE)
+            self.file.truncate(size)
+            self.map = mmap.mmap(self.file.fileno(), size)
+        self.used = _used.unpack_from(self.map, 0)[0] or 8
+        _used.pack_into(self.map, 0, self.used)
+        self.offsets = dict(slots(self.map))
+
+    def _grow(self, needed):
+        size = len(self.map)
+        while size < needed:
+            size *= 2
+        if self.file is None:
+            grown = mmap.mmap(-1, size)
+            grown[:self.used] = self.map[:self.used]
+        else:
+            self.map.flush()
+            self.file.truncate(size)
+            grown = mmap.mmap(self.file.fileno(), size)
+        self.map.close()
+        self.map = grown
+
+    def _allocate(self, key):
+        encoded = key.encode()
+        offset = _aligned(self.used + 4 + len(encoded))
+        if offset + 8 > len(self.map):
+            self._grow(offset + 8)
+        _length.pack_into(self.map, self.used, len(encoded))
+        self.map[self.used + 4:self.used + 4 + len(encoded)] = encoded
+        _value.pack_into(self.map, offset, 0.0)
+        # Written last, readers only parse up to it.
+        self.used = offset + 8
+        _used.pack_into(self.map, 0, self.used)
+        self.offsets[key] = offset
+        return offset
+
+    def add(self, updates):
+        """Add each amount of the (key, amount) pairs to its value.
+        """
+        with self.lock:
+            for key, amount in updates:
+                offset = self.offsets.get(key)
+                if offset is None:
+                    offset = self._allocate(key)
+                value = _value.unpack_from(self.map, offset)[0]
+                _value.pack_into(self.map, offset, value + amount)
+
+    def read(self):
+        # Under the lock: _grow() closes the map it replaces.
+        with self.lock:
+            return bytes(self.map[:self.used])
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def store():
+    """Value store of this process, in API_METRICS_DIR when set.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                directory = settings.API_METRICS_DIR
+                _store = ValueStore(
+                    os.path.join(directory, f'values_{os.getpid()}.db')
+                    if directory else None,
+                )
+    return _store
+
+
+def _forget_store():
+    # A forked worker writes its own file, not the one of its parent.
+    global _store
+    _store = None
+
+
+os.register_at_fork(after_in_child=_forget_store)
+
+
+def totals():
+    """Every value summed over the processes.
+    """
+    directory = settings.API_METRICS_DIR
+    if not directory:
+        return dict(entries(store().read()))
+    summed = defaultdict(float)
+    for name in os.listdir(directory):
+        if name.startswith('values_') and name.endswith('.db'):
+            with open(os.path.join(directory, name), 'rb') as values:
+                for key, value in entries(values.read()):
+                    summed[key] += value
+    return summed
+
+
+def format_value(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+@lru_cache(maxsize=4096)
+def sample_key(name, labels):
+    return json.dumps([name, labels])
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def labels(self, values):
+        return tuple(zip(self.labelnames, map(str, values)))
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def increment(self, *labels, amount=1):
+        """(key, amount) updates counting amount more.
+        """
+        return [(sample_key(self.name, self.labels(labels)), amount)]
+
+    def inc(self, *labels, amount=1):
+        store().add(self.increment(*labels, amount=amount))
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames, buckets):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.bounds = [format_value(bound) for bound in buckets] + ['+Inf']
+
+    def observation(self, value, *labels):
+        """(key, amount) updates of an observed value: its bucket, the sum
+        and the count.
+        """
+        labels = self.labels(labels)
+        bound = self.bounds[bisect_left(self.buckets, value)]
+        return [
+            (sample_key(f'{self.name}_bucket', labels + (('le', bound),)), 1),
+            (sample_key(f'{self.name}_sum', labels), value),
+            (sample_key(f'{self.name}_count', labels), 1),
+        ]
+
+    def observe(self, value, *labels):
+        store().add(self.observation(value, *labels))
+
+
+REGISTRY = []
+
+REQUESTS = Counter(
+    'api_requests_total',
+    'Requests answered, by route, method and status.',
+    ['route', 'method', 'status'],
+)
+REQUEST_DURATION = Histogram(
+    'api_request_duration_seconds',
+    'Time to answer a request, by route, method and status.',
+    ['route', 'method', 'status'],
+    LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'api_db_queries_per_request',
+    'SQL queries run by a request, by route.',
+    ['route'],
+    QUERY_BUCKETS,
+)
+DB_DURATION = Histogram(
+    'api_db_duration_seconds',
+    'Time a request spent in SQL queries, by route.',
+    ['route'],
+    LATENCY_BUCKETS,
+)
+AUTH_FAILURES = Counter(
+    'api_auth_failures_total',
+    'Requests refused for missing or invalid credentials, by reason.',
+    ['reason'],
+)
+RESPONSE_CACHE = Counter(
+    'api_response_cache_total',
+    'GET responses served from the response cache or built by the views.',
+    ['result'],
+)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, value.replace('\\', r'\\').replace(
+            '"',
+            r'\"',
+        ).replace('\n', r'\n'))
+        for name, value in labels
+    )
+
+
+def exposition(gauges=()):
+    """Every metric in the Prometheus text format, followed by the gauges
+    given as (name, documentation, [(labels, value), ...]).
+    """
+    samples = defaultdict(list)
+    for key, value in totals().items():
+        name, labels = json.loads(key)
+        samples[name].append((tuple(map(tuple, labels)), value))
+
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        if metric.kind == 'counter':
+            for labels, value in sorted(samples[metric.name]):
+                lines.append(
+                    f'{metric.name}{format_labels(labels)} '
+                    f'{format_value(value)}',
+                )
+            continue
+
+        buckets = defaultdict(dict)
+        for labels, value in samples[f'{metric.name}_bucket']:
+            buckets[labels[:-1]][labels[-1][1]] = value
+        sums = dict(samples[f'{metric.name}_sum'])
+        for labels, value in sorted(samples[f'{metric.name}_count']):
+            cumulative = 0
+            for bound in metric.bounds:
+                cumulative += buckets[labels].get(bound, 0)
+                lines.append(
+                    f'{metric.name}_bucket'
+                    f'{format_labels(labels + (("le", bound),))} '
+                    f'{format_value(cumulative)}',
+                )
+            lines.append(
+                f'{metric.name}_sum{format_labels(labels)} '
+                f'{format_value(sums.get(labels, 0))}',
+            )
+            lines.append(
+                f'{metric.name}_count{format_labels(labels)} '
+                f'{format_value(value)}',
+            )
+
+    for name, documentation, values in gauges:
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in values:
+            lines.append(
+                f'{name}{format_labels(labels)} {format_value(value)}',
+            )
+    return '\n'.join(lines) + '\n'
+
+
+def route(request):
+    """URL pattern the request matched, which keeps the label values few.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None or match.route is None:
+        return 'unmatched'
+    return '/' + match.route
+
+
+class MetricsMiddleware:
+    """Count every request and observe its latency and SQL queries.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        db = [0, 0.0]
+
+        def execute(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                db[0] += 1
+                db[1] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(execute))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        labels = (
+            route(request),
+            request.method if request.method in METHODS else 'OTHER',
+            response.status_code,
+        )
+        store().add(
+            REQUESTS.increment(*labels)
+            + REQUEST_DURATION.observation(duration, *labels)
+            + DB_QUERIES.observation(db[0], labels[0])
+            + DB_DURATION.observation(db[1], labels[0]),
+        )
+        return response
+
+
+def exception_handler(exc, context):
+    """DRF's exception handler, counting the authentication failures.
+    """
+    if isinstance(exc, (exceptions.AuthenticationFailed,
+                        exceptions.NotAuthenticated)):
+        AUTH_FAILURES.inc(exc.default_code)
+    return drf_exception_handler(exc, context)
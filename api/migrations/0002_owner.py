@@ -0,0 +1,196 @@
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 1000
+
+
+def id_ranges(queryset):
+    """Yield (start, end] primary key ranges of at most BATCH_SIZE ids."""
+    last = queryset.aggregate(last=models.Max("id"))["last"] or 0
+    for start in range(0, last, BATCH_SIZE):
+        yield start, start + BATCH_SIZE
+
+
+def create_owners(apps, schema_editor):
+    """Register every cpf/cnpj as an Owner and point the FKs at them."""
+    Owner = apps.get_model("api", "Owner")
+    PhysicalPerson = apps.get_model("api", "PhysicalPerson")
+    LegalPerson = apps.get_model("api", "LegalPerson")
+    Good = apps.get_model("api", "Good")
+
+    for model, field, link in (
+        (PhysicalPerson, "cpf", "physical_person_id"),
+        (LegalPerson, "cnpj", "legal_person_id"),
+    ):
+        for start, end in id_ranges(model.objects):
+            rows = model.objects.filter(id__gt=start, id__lte=end)
+            Owner.objects.bulk_create(
+                [
+                    Owner(document=document, **{link: pk})
+                    for pk, document in rows.values_list("id", field)
+                ]
+            )
+
+    for model in (LegalPerson, Good):
+        # Owners referenced without a registered person are kept as
+        # entries without a person instead of losing the data.
+        dangling = (
+            model.objects.exclude(owner__in=Owner.objects.values("document"))
+            .values_list("owner", flat=True)
+            .distinct()
+        )
+        Owner.objects.bulk_create(
+            [Owner(document=document) for document in dangling.iterator()],
+            batch_size=BATCH_SIZE,
+        )
+
+        for start, end in id_ranges(model.objects):
+            model.objects.filter(id__gt=start, id__lte=end).update(
+                owner_ref=Subquery(
+                    Owner.objects.filter(document=OuterRef("owner")).values(
+                        "id"
+                    )[:1]
+                )
+            )
+
+
+def restore_owner_documents(apps, schema_editor):
+    """Copy the owner cpf/cnpj back into the text columns."""
+    Owner = apps.get_model("api", "Owner")
+    for model_name in ("LegalPerson", "Good"):
+        model = apps.get_model("api", model_name)
+        for start, end in id_ranges(model.objects):
+            model.objects.filter(id__gt=start, id__lte=end).update(
+                owner=Subquery(
+                    Owner.objects.filter(id=OuterRef("owner_ref")).values(
+                        "document"
+                    )[:1]
+                )
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Owner",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "document",
+                    models.CharField(
+                        max_length=14,
+                        unique=True,
+                        validators=[
+                            django.core.validators.RegexValidator(
+                                "^\\d{11,14}$", "Invalid owner, must be a cpf or cnpj."
+                            )
+                        ],
+                    ),
+                ),
+                (
+                    "legal_person",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="owner_entry",
+                        to="api.legalperson",
+                    ),
+                ),
+                (
+                    "physical_person",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="owner_entry",
+                        to="api.physicalperson",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="good",
+            name="owner_ref",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="api.owner",
+            ),
+        ),
+        migrations.AddField(
+            model_name="legalperson",
+            name="owner_ref",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="api.owner",
+            ),
+        ),
+        # The text columns become nullable before the data migration so that
+        # unapplying it can re-add them before restoring their values.
+        migrations.AlterField(
+            model_name="good",
+            name="owner",
+            field=models.CharField(max_length=14, null=True),
+        ),
+        migrations.AlterField(
+            model_name="legalperson",
+            name="owner",
+            field=models.CharField(max_length=14, null=True),
+        ),
+        migrations.RunPython(create_owners, restore_owner_documents),
+        migrations.RemoveField(
+            model_name="good",
+            name="owner",
+        ),
+        migrations.RemoveField(
+            model_name="legalperson",
+            name="owner",
+        ),
+        migrations.RenameField(
+            model_name="good",
+            old_name="owner_ref",
+            new_name="owner",
+        ),
+        migrations.RenameField(
+            model_name="legalperson",
+            old_name="owner_ref",
+            new_name="owner",
+        ),
+        migrations.AlterField(
+            model_name="good",
+            name="owner",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="goods",
+                to="api.owner",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="legalperson",
+            name="owner",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="companies",
+                to="api.owner",
+            ),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 3.1.7 on 2026-10-17 22:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def count_holdings(apps, schema_editor):
+    """Fill the rollups with the goods and companies already registered."""
+    Good = apps.get_model("api", "Good")
+    LegalPerson = apps.get_model("api", "LegalPerson")
+    Rollup = apps.get_model("api", "Rollup")
+
+    counts = {}
+    goods = (
+        Good.objects.values_list("owner_id", "good_type")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    companies = (
+        LegalPerson.objects.values_list("owner_id")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    rows = list(goods) + [
+        (owner_id, "companies", count) for owner_id, count in companies
+    ]
+    for owner_id, key, count in rows:
+        for owner in (owner_id, None):
+            counts[(owner, key)] = counts.get((owner, key), 0) + count
+
+    Rollup.objects.bulk_create(
+        [
+            Rollup(owner_id=owner_id, key=key, count=count)
+            for (owner_id, key), count in counts.items()
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_generation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Rollup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=9)),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rollups",
+                        to="api.owner",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="rollup",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "key"), name="unique_owner_rollup"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="rollup",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(owner=None),
+                fields=("key",),
+                name="unique_total_rollup",
+            ),
+        ),
+        migrations.RunPython(count_holdings, migrations.RunPython.noop),
+    ]
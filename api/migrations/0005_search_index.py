@@ -0,0 +1,81 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# Text columns of each table indexed for the ?q= search (see api.search).
+SEARCH_FIELDS = {
+    "api_physicalperson": ["name"],
+    "api_legalperson": ["social_reason", "fantasy_name"],
+    "api_good": ["description"],
+}
+
+
+def trigger_statements(table, fields):
+    """SQL creating the triggers keeping the FTS5 index of a table in sync."""
+    fts = f"{table}_fts"
+    columns = ", ".join(fields)
+    new = ", ".join(f"new.{field}" for field in fields)
+    old = ", ".join(f"old.{field}" for field in fields)
+    insert = f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new});"
+    delete = (
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old});"
+    )
+    return [
+        f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} "
+        f"BEGIN {insert} END",
+        f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} "
+        f"BEGIN {delete} END",
+        f"CREATE TRIGGER {fts}_update AFTER UPDATE OF {columns} ON {table} "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+
+def index_statements(table, fields):
+    """SQL creating and filling the FTS5 index of a table."""
+    fts = f"{table}_fts"
+    columns = ", ".join(fields)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({columns}, "
+        f"content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        *trigger_statements(table, fields),
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def create_search_index(apps, schema_editor):
+    """Index the text columns with FTS5 when this SQLite build has it."""
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE fts5_probe USING fts5(text)")
+        except OperationalError:
+            return
+        cursor.execute("DROP TABLE fts5_probe")
+        for table, fields in SEARCH_FIELDS.items():
+            for statement in index_statements(table, fields):
+                cursor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for table in SEARCH_FIELDS:
+            for trigger in ("insert", "delete", "update"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{trigger}")
+            cursor.execute(f"DROP TABLE IF EXISTS {table}_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_rollup"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.7 on 2026-10-17 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="good",
+            index=models.Index(
+                fields=["owner", "good_type"], name="good_owner_type_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="good",
+            index=models.Index(fields=["good_type"], name="good_type_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="legalperson",
+            index=models.Index(fields=["zipcode"], name="legal_zipcode_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="physicalperson",
+            index=models.Index(fields=["zipcode"], name="physical_zipcode_idx"),
+        ),
+    ]
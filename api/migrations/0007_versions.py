@@ -0,0 +1,72 @@
+# Generated by Django 3.1.7 on 2026-10-17 22:53
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+search_index = import_module("api.migrations.0005_search_index")
+
+
+def recreate_search_triggers(apps, schema_editor):
+    """Restore the FTS5 triggers lost when SQLite remade the tables."""
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    tables = connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        for table, fields in search_index.SEARCH_FIELDS.items():
+            if f"{table}_fts" not in tables:
+                continue
+            for trigger in ("insert", "delete", "update"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{trigger}")
+            for statement in search_index.trigger_statements(table, fields):
+                cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_filter_indexes"),
+    ]
+
+    operations = [
+        # Adding or removing a column on SQLite copies the table into a new
+        # one, which drops the triggers of the old table.
+        migrations.RunPython(migrations.RunPython.noop, recreate_search_triggers),
+        migrations.AddField(
+            model_name="generation",
+            name="changed_at",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name="good",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="good",
+            name="version",
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name="legalperson",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="legalperson",
+            name="version",
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name="physicalperson",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="physicalperson",
+            name="version",
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.RunPython(recreate_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 3.1.7 on 2026-10-17 23:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# Resource names of the models, owners before what they own.
+RESOURCES = [
+    ("physical-people", "PhysicalPerson"),
+    ("legal-people", "LegalPerson"),
+    ("goods", "Good"),
+]
+
+
+def log_existing_records(apps, schema_editor):
+    """Log the creation of the records already registered, so reading the
+    log from seq 0 rebuilds every table."""
+    Change = apps.get_model("api", "Change")
+    now = django.utils.timezone.now()
+    for resource, model_name in RESOURCES:
+        ids = (
+            apps.get_model("api", model_name)
+            .objects.order_by("id")
+            .values_list("id", flat=True)
+        )
+        batch = []
+        for pk in ids.iterator():
+            batch.append(
+                Change(
+                    resource=resource,
+                    record_id=pk,
+                    action="create",
+                    changed_at=now,
+                )
+            )
+            if len(batch) == BATCH_SIZE:
+                Change.objects.bulk_create(batch)
+                batch = []
+        Change.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_versions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Change",
+            fields=[
+                ("seq", models.BigAutoField(primary_key=True, serialize=False)),
+                ("resource", models.CharField(max_length=20)),
+                ("record_id", models.BigIntegerField()),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("create", "create"),
+                            ("update", "update"),
+                            ("delete", "delete"),
+                        ],
+                        max_length=6,
+                    ),
+                ),
+                (
+                    "changed_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="change",
+            index=models.Index(
+                fields=["resource", "record_id"], name="change_record_idx"
+            ),
+        ),
+        migrations.RunPython(log_existing_records, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,7 @@
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
 
 CPF_REGEX = RegexValidator(r'^\d{11}$', 'Invalid CPF format.')
 CNPJ_REGEX = RegexValidator(r'^\d{14}$', 'Invalid CNPJ format.')
@@ -11,8 +13,35 @@ OWNER_REGEX = RegexValidator(
     'Invalid owner, must be a cpf or cnpj.',
 )
 
+# Sent by VersionedModel.save() with the instance, before its transaction.
+record_saving = Signal()
 
-class PhysicalPerson(models.Model):
+
+class VersionedModel(models.Model):
+    """A model whose rows carry a version, incremented by every save, and
+    the time of their last save. Both back the ETag and Last-Modified
+    headers of the API.
+    """
+    version = models.PositiveIntegerField(default=1, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+        # Reads go before the transaction. A deferred SQLite transaction that
+        # reads first fails at once with "database is locked" when another
+        # connection writes, instead of waiting for the lock.
+        record_saving.send(sender=type(self), instance=self)
+        # The post_save receivers (change log, rollups...) write in the same
+        # transaction as the row.
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+
+
+class PhysicalPerson(VersionedModel):
     cpf = models.CharField(
         max_length=11,
         unique=True,
@@ -29,8 +58,13 @@ class PhysicalPerson(models.Model):
         validators=[PHONE_NUMBER_REGEX],
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['zipcode'], name='physical_zipcode_idx'),
+        ]
 
-class LegalPerson(models.Model):
+
+class LegalPerson(VersionedModel):
     cnpj = models.CharField(
         max_length=14,
         unique=True,
@@ -51,10 +85,19 @@ class LegalPerson(models.Model):
         max_length=12,
         validators=[PHONE_NUMBER_REGEX],
     )
-    owner = models.CharField(max_length=14, validators=[OWNER_REGEX])
+    owner = models.ForeignKey(
+        'Owner',
+        on_delete=models.PROTECT,
+        related_name='companies',
+    )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['zipcode'], name='legal_zipcode_idx'),
+        ]
 
-class Good(models.Model):
+
+class Good(VersionedModel):
     GOODS_TYPE = [
         ('imovel', 'imovel'),
         ('automovel', 'automovel'),
@@ -62,4 +105,119 @@ class Good(models.Model):
     ]
     good_type = models.CharField(max_length=9, choices=GOODS_TYPE)
     description = models.TextField()
-    owner = models.CharField(max_length=14, validators=[OWNER_REGEX])
+    owner = models.ForeignKey(
+        'Owner',
+        on_delete=models.PROTECT,
+        related_name='goods',
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['owner', 'good_type'],
+                name='good_owner_type_idx',
+            ),
+            models.Index(fields=['good_type'], name='good_type_idx'),
+        ]
+
+
+class Owner(models.Model):
+    """A cpf or cnpj that may own companies and goods.
+
+    Every physical and legal person has exactly one entry, kept in sync by
+    api.signals. Entries without a person only come from owners referenced
+    before this table existed.
+    """
+    document = models.CharField(
+        max_length=14,
+        unique=True,
+        validators=[OWNER_REGEX],
+    )
+    physical_person = models.OneToOneField(
+        PhysicalPerson,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='owner_entry',
+    )
+    legal_person = models.OneToOneField(
+        LegalPerson,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='owner_entry',
+    )
+
+
+class Generation(models.Model):
+    """A counter bumped whenever the data it names changes.
+
+    Cached values are stored under the generation they were computed at, so
+    bumping it invalidates them in every process at once.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(null=True)
+
+
+class Rollup(models.Model):
+    """Running count of the goods of one good_type, or of the companies, an
+    owner holds. Rows without an owner hold the totals of every owner.
+
+    Kept up to date by api.signals, rebuilt by ``manage.py rebuild_rollups``.
+    """
+    COMPANIES = 'companies'
+
+    owner = models.ForeignKey(
+        Owner,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name='rollups',
+    )
+    key = models.CharField(max_length=9)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['owner', 'key'],
+                name='unique_owner_rollup',
+            ),
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=models.Q(owner=None),
+                name='unique_total_rollup',
+            ),
+        ]
+
+
+class Change(models.Model):
+    """Entry of the log of the records created, updated and deleted.
+
+    Written by api.signals in the transaction of the change. ``seq`` is an
+    AUTOINCREMENT key, so it only grows and is never reused, even after
+    ``manage.py compact_changes`` drops the entries superseded by a later
+    change of the same record.
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTIONS = [
+        (CREATE, 'create'),
+        (UPDATE, 'update'),
+        (DELETE, 'delete'),
+    ]
+
+    seq = models.BigAutoField(primary_key=True)
+    resource = models.CharField(max_length=20)
+    record_id = models.BigIntegerField()
+    action = models.CharField(max_length=6, choices=ACTIONS)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['resource', 'record_id'],
+                name='change_record_idx',
+            ),
+        ]
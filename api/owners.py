@@ -0,0 +1,167 @@
+import hashlib
+import math
+
+from django.conf import settings
+from django.db.models import Q
+
+from .bulk import IN_QUERY_CHUNK_SIZE, chunked
+from .lru import LRUCache
+from .models import Owner
+
+
+class BloomFilter:
+    """Fixed size Bloom filter of strings.
+
+    ``in`` never answers False for an added key, and answers True for a
+    missing key with a probability close to ``error_rate`` while the filter
+    holds at most ``capacity`` keys.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        # Optimal sizes: m = -n ln(p) / ln(2)^2 bits and k = m / n ln(2).
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate)
+                               / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class OwnerResolver:
+    """Maps a cpf/cnpj to the id of its Owner entry.
+
+    Lookups are a single seek on the unique index of ``Owner.document`` and
+    both hits and misses are cached for ``ttl`` seconds. The signal handlers
+    of ``api.signals`` keep the cache in sync with the writes of this process,
+    the TTL bounds how long writes of other processes go unnoticed.
+
+    An optional Bloom filter of every cpf/cnpj, built on first use, rejects
+    unknown owners without touching the database. Keys written by other
+    processes never reach it, so only enable it when this process is the only
+    writer of people (e.g. bulk imports).
+
+    Writes resolve with ``write=True``: a cached answer may lag behind the
+    writes of other processes, and a stale miss would reject a valid owner
+    while a stale hit would insert a dangling owner_id. Unless the Bloom
+    filter is on (this process being the only writer), they skip the cache
+    and only cache the owners found.
+    """
+
+    def __init__(self, max_entries, ttl, use_bloom_filter=False):
+        self.cache = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.use_bloom_filter = use_bloom_filter
+        self.bloom_filter = None
+
+    def resolve(self, document, write=False):
+        """Return the Owner id of a registered cpf/cnpj, None otherwise.
+        """
+        if self.use_bloom_filter:
+            if self.bloom_filter is None:
+                self.warm_bloom_filter()
+            if document not in self.bloom_filter:
+                return None
+
+        cached = not write or self.use_bloom_filter
+        owner_id = self.cache.get(document) if cached else None
+        if owner_id is None:
+            # Misses are cached as 0, ids start at 1.
+            owner_id = self.query(document) or 0
+            if owner_id or cached:
+                self.cache.set(document, owner_id)
+        return owner_id or None
+
+    def resolve_many(self, documents, write=False):
+        """Resolve many cpf/cnpj with ``IN (...)`` queries, priming the cache.
+
+        Returns a dict mapping every registered document to its Owner id.
+        """
+        cached = not write or self.use_bloom_filter
+        found = {}
+        missing = []
+        for document in set(documents):
+            owner_id = self.cache.get(document) if cached else None
+            if owner_id is None:
+                missing.append(document)
+            elif owner_id:
+                found[document] = owner_id
+
+        for chunk in chunked(missing, IN_QUERY_CHUNK_SIZE):
+            rows = dict(registered_owners().filter(
+                document__in=chunk,
+            ).values_list('document', 'id'))
+            for document in chunk:
+                if document in rows or cached:
+                    self.cache.set(document, rows.get(document, 0))
+            found.update(rows)
+        return found
+
+    def exists(self, document):
+        return self.resolve(document) is not None
+
+    def query(self, document):
+        """Look the cpf/cnpj up in the database with a single query.
+        """
+        return registered_owners().filter(document=document).values_list(
+            'id',
+            flat=True,
+        ).first()
+
+    def warm_bloom_filter(self):
+        """(Re)build the Bloom filter from every registered cpf and cnpj.
+        """
+        owners = registered_owners()
+        bloom_filter = BloomFilter(capacity=max(owners.count() * 2, 1024))
+        documents = owners.values_list('document', flat=True)
+        for document in documents.iterator(chunk_size=10000):
+            bloom_filter.add(document)
+        self.bloom_filter = bloom_filter
+
+    def added(self, document, owner_id):
+        """Record a newly registered cpf/cnpj.
+        """
+        if self.bloom_filter is not None:
+            self.bloom_filter.add(document)
+        self.cache.set(document, owner_id)
+
+    def added_many(self, documents):
+        """Record many newly registered cpf/cnpj.
+        """
+        for document in documents:
+            if self.bloom_filter is not None:
+                self.bloom_filter.add(document)
+            self.cache.discard(document)
+
+    def invalidate(self):
+        """Forget every cached answer, e.g. after a cpf/cnpj was removed.
+        """
+        self.cache.clear()
+
+
+def registered_owners():
+    """Owner entries belonging to a physical or legal person.
+    """
+    return Owner.objects.filter(
+        Q(physical_person__isnull=False) | Q(legal_person__isnull=False),
+    )
+
+
+owner_resolver = OwnerResolver(
+    max_entries=settings.API_OWNER_CACHE_SIZE,
+    ttl=settings.API_OWNER_CACHE_TTL,
+    use_bloom_filter=settings.API_OWNER_BLOOM_FILTER,
+)
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset pagination ordered by the primary key.
+
+    Every page is fetched with ``WHERE id > <cursor> ORDER BY id LIMIT n``,
+    which is an index range scan, so the cost of a page does not grow with
+    how deep the client is paging the way ``OFFSET`` does. The cursor sent to
+    the client is opaque (base64 encoded).
+    """
+    ordering = 'id'
+    page_size_query_param = 'limit'
+    max_page_size = 1000
@@ -0,0 +1,136 @@
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('api.query_budget', default=None)
+_placeholder_list = re.compile(r'%s(?:, %s)+')
+_row_list = re.compile(r'\(%s, \.\.\.\)(?:, \(%s, \.\.\.\))+')
+_union_list = re.compile(r'(?: UNION ALL SELECT %s, \.\.\.)+')
+# Sent by transaction.atomic(), BEGIN in production but SAVEPOINT inside
+# the transaction of a TestCase.
+_transaction_control = re.compile(
+    r'(?:BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE SAVEPOINT)\b',
+)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised instead of the warning when API_QUERY_BUDGET_STRICT is on.
+    """
+
+
+def sql_shape(sql):
+    """The SQL with its lists of placeholders and of inserted rows
+    collapsed, so a query has a single shape whatever the length of its
+    IN (...) lists or the number of rows it inserts.
+    """
+    sql = _placeholder_list.sub('%s, ...', sql)
+    sql = _row_list.sub('(%s, ...), ...', sql)
+    return _union_list.sub(' UNION ALL SELECT %s, ...', sql)
+
+
+class QueryLog:
+    """Execute wrapper counting the queries run, by SQL shape, leaving out
+    the statements controlling transactions.
+    """
+
+    def __init__(self):
+        self.shapes = Counter()
+        self.exempt = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.exempt and not _transaction_control.match(sql):
+            self.shapes[sql_shape(sql)] += 1
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return sum(self.shapes.values())
+
+    def repeated(self, limit):
+        """Shapes run more than limit times, the mark of a query per row.
+        """
+        return {
+            shape: count
+            for shape, count in self.shapes.most_common()
+            if count > limit
+        }
+
+
+@contextmanager
+def unbudgeted():
+    """Leave the queries of the block out of the budget of the view.
+
+    For work batched by design, whose queries grow with the size of the
+    request rather than with the data, such as the inserts of a bulk
+    creation.
+    """
+    log = _current.get()
+    if log is None or log.exempt:
+        yield
+        return
+    log.exempt = True
+    try:
+        yield
+    finally:
+        log.exempt = False
+
+
+def problems(log, max_queries):
+    found = []
+    if max_queries is not None and log.count > max_queries:
+        found.append(f'{log.count} queries, over its budget of {max_queries}')
+    for shape, count in log.repeated(
+        settings.API_QUERY_REPEAT_LIMIT,
+    ).items():
+        found.append(f'{count} runs of the same query (N+1?): {shape}')
+    return found
+
+
+def query_budget(**budgets):
+    """Declare the most queries the view may run to answer a request, by
+    method, e.g. ``@query_budget(GET=3, POST=10)``. HEAD shares the budget
+    of GET.
+
+    A request over the budget, or running the same SQL shape more than
+    API_QUERY_REPEAT_LIMIT times, is logged as a warning, or raises
+    QueryBudgetExceeded when API_QUERY_BUDGET_STRICT is on, as in the tests.
+    Applied below ``api_view``, so the queries of the authentication are
+    not counted, nor those of a streamed body, run after the view returns.
+    """
+    def decorator(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            log = QueryLog()
+            token = _current.set(log)
+            try:
+                with ExitStack() as stack:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(log))
+                    response = view(request, *args, **kwargs)
+            finally:
+                _current.reset(token)
+
+            method = 'GET' if request.method == 'HEAD' else request.method
+            found = problems(log, budgets.get(method))
+            if found:
+                message = '%s %s: %s' % (
+                    request.method,
+                    request.path,
+                    '; '.join(found),
+                )
+                if settings.API_QUERY_BUDGET_STRICT:
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+
+        inner.query_budgets = budgets
+        return inner
+    return decorator
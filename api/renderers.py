@@ -0,0 +1,25 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline delimited JSON, one record per line.
+
+    Registering it lets clients ask for ``Accept: application/x-ndjson``
+    (or ``?format=ndjson``) on the list endpoints, which then stream records.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, list):
+            data = [data]
+        return b''.join(
+            json.dumps(item, cls=DjangoJSONEncoder).encode() + b'\n'
+            for item in data
+        )
@@ -0,0 +1,13 @@
+from .serializers import (
+    GoodSerializer,
+    LegalPersonSerializer,
+    PhysicalPersonSerializer,
+)
+
+# The resources of the API by their URL name, in the order they must be
+# loaded (owners before what they own).
+RESOURCES = {
+    'physical-people': PhysicalPersonSerializer,
+    'legal-people': LegalPersonSerializer,
+    'goods': GoodSerializer,
+}
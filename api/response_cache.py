@@ -0,0 +1,67 @@
+import threading
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .metrics import RESPONSE_CACHE
+
+counters = Counter()
+_counters_lock = threading.Lock()
+
+
+def count(name):
+    with _counters_lock:
+        counters[name] += 1
+    RESPONSE_CACHE.inc(name)
+
+
+def cache_key(request, etag):
+    """Key of a response: the authenticated user and the resource state.
+
+    The ETag already covers the path, the query string, the format and the
+    generation of every table the response is built from, so a write makes
+    the entries of the tables it touched unreachable, and only those.
+    """
+    user = request.user
+    principal = user.pk if user.is_authenticated else 'anonymous'
+    return 'api.response:%s:%s' % (principal, etag.strip('"'))
+
+
+def cache_response(view):
+    """Serve successful GETs from the cache framework.
+
+    Must be applied below ``conditional``, which computes the ETag of the
+    resource before the view runs. Responses carry an X-Cache header telling
+    HIT from MISS, streamed responses are never cached.
+    """
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        etag = getattr(request, 'resource_etag', None)
+        if (request.method != 'GET' or etag is None
+                or not settings.API_RESPONSE_CACHE_TTL):
+            return view(request, *args, **kwargs)
+
+        cache = caches[settings.API_RESPONSE_CACHE]
+        key = cache_key(request, etag)
+        cached = cache.get(key)
+        if cached is not None:
+            count('hits')
+            content_type, content = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        count('misses')
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            cache.set(
+                key,
+                (response['Content-Type'], response.content),
+                settings.API_RESPONSE_CACHE_TTL,
+            )
+        response['X-Cache'] = 'MISS'
+        return response
+    return inner
@@ -0,0 +1,180 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+
+from .bulk import IN_QUERY_CHUNK_SIZE, chunked
+from .models import Good, LegalPerson, Rollup
+
+GOOD_TYPES = [good_type for good_type, _ in Good.GOODS_TYPE]
+
+# Below this many owner rows a change is applied row by row.
+BULK_ADD_THRESHOLD = 8
+
+
+def rollup_key(instance):
+    """The (owner id, key) rollup a good or a company is counted in.
+    """
+    if isinstance(instance, Good):
+        return instance.owner_id, instance.good_type
+    return instance.owner_id, Rollup.COMPANIES
+
+
+def stored_rollup_key(model, pk):
+    """rollup_key() of a good or company as currently stored, if any.
+    """
+    if model is Good:
+        return model.objects.filter(pk=pk).values_list(
+            'owner_id',
+            'good_type',
+        ).first()
+    owner_id = model.objects.filter(pk=pk).values_list(
+        'owner_id',
+        flat=True,
+    ).first()
+    return None if owner_id is None else (owner_id, Rollup.COMPANIES)
+
+
+def increment(owner_id, key, delta):
+    """Add delta to one rollup row, creating it on its first change.
+    """
+    rows = Rollup.objects.filter(owner_id=owner_id, key=key)
+    if rows.update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            Rollup.objects.create(owner_id=owner_id, key=key, count=delta)
+    except IntegrityError:
+        # Created concurrently in the meantime.
+        rows.update(count=F('count') + delta)
+
+
+def bulk_increment(deltas):
+    """increment() many owner rows with a query per chunk of owners.
+
+    Existing rows are updated by one prepared statement run for every row
+    (``executemany``) and the missing ones are inserted with bulk_create.
+    """
+    existing = set()
+    owner_ids = {owner_id for owner_id, _ in deltas}
+    for chunk in chunked(owner_ids, IN_QUERY_CHUNK_SIZE):
+        existing.update(Rollup.objects.filter(owner_id__in=chunk).values_list(
+            'owner_id',
+            'key',
+        ))
+
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'UPDATE {table} SET {count} = {count} + %s '
+            'WHERE {owner} = %s AND {key} = %s'.format(
+                table=quote_name(Rollup._meta.db_table),
+                count=quote_name('count'),
+                owner=quote_name('owner_id'),
+                key=quote_name('key'),
+            ),
+            [
+                (delta, owner_id, key)
+                for (owner_id, key), delta in deltas.items()
+                if (owner_id, key) in existing
+            ],
+        )
+
+    missing = [
+        Rollup(owner_id=owner_id, key=key, count=delta)
+        for (owner_id, key), delta in deltas.items()
+        if (owner_id, key) not in existing
+    ]
+    try:
+        with transaction.atomic():
+            Rollup.objects.bulk_create(
+                missing,
+                batch_size=settings.API_BULK_BATCH_SIZE,
+            )
+    except IntegrityError:
+        # Some were created concurrently in the meantime.
+        for rollup in missing:
+            increment(rollup.owner_id, rollup.key, rollup.count)
+
+
+def add(deltas):
+    """Apply a Counter of {(owner id, key): delta} to the rollups.
+
+    The totals (rows without an owner) move along with the owners' rows.
+    """
+    totals = Counter()
+    for (owner_id, key), delta in deltas.items():
+        totals[(None, key)] += delta
+
+    owned = {item: delta for item, delta in deltas.items() if delta}
+    if len(owned) < BULK_ADD_THRESHOLD:
+        for (owner_id, key), delta in owned.items():
+            increment(owner_id, key, delta)
+    else:
+        bulk_increment(owned)
+    for (owner_id, key), delta in totals.items():
+        if delta:
+            increment(owner_id, key, delta)
+
+
+def count_all():
+    """Count every rollup from scratch, as {(owner id, key): count}.
+    """
+    counts = Counter()
+    goods = Good.objects.values_list('owner_id', 'good_type').annotate(
+        count=Count('id'),
+    ).order_by()
+    companies = LegalPerson.objects.values_list('owner_id').annotate(
+        count=Count('id'),
+    ).order_by()
+    for owner_id, good_type, count in goods:
+        counts[(owner_id, good_type)] += count
+        counts[(None, good_type)] += count
+    for owner_id, count in companies:
+        counts[(owner_id, Rollup.COMPANIES)] += count
+        counts[(None, Rollup.COMPANIES)] += count
+    return counts
+
+
+def rebuild():
+    """Replace the rollups with fresh counts, return the rows that drifted.
+    """
+    with transaction.atomic():
+        counts = count_all()
+        stored = {
+            (owner_id, key): count
+            for owner_id, key, count in Rollup.objects.values_list(
+                'owner_id',
+                'key',
+                'count',
+            )
+        }
+        drifted = sum(
+            1 for item in counts.keys() | stored.keys()
+            if counts.get(item, 0) != stored.get(item, 0)
+        )
+        Rollup.objects.all().delete()
+        Rollup.objects.bulk_create(
+            [
+                Rollup(owner_id=owner_id, key=key, count=count)
+                for (owner_id, key), count in counts.items()
+            ],
+            batch_size=settings.API_BULK_BATCH_SIZE,
+        )
+    return drifted
+
+
+def summary(owner_id=None):
+    """Goods per good_type and companies held by the owner, or by everyone.
+    """
+    counts = dict(Rollup.objects.filter(owner_id=owner_id).values_list(
+        'key',
+        'count',
+    ))
+    goods = {good_type: counts.get(good_type, 0) for good_type in GOOD_TYPES}
+    return {
+        'goods': goods,
+        'goods_total': sum(goods.values()),
+        'companies': counts.get(Rollup.COMPANIES, 0),
+    }
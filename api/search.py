@@ -0,0 +1,107 @@
+import re
+import sqlite3
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Good, LegalPerson, PhysicalPerson
+
+# Text columns indexed by the FTS5 tables of migration 0005.
+SEARCH_FIELDS = {
+    PhysicalPerson: ['name'],
+    LegalPerson: ['social_reason', 'fantasy_name'],
+    Good: ['description'],
+}
+
+_fts_tables = {}
+
+
+def search_terms(q):
+    """Words of the query, the same way the FTS5 unicode61 tokenizer splits
+    them.
+    """
+    return re.findall(r'\w+', q)
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def fts_available(model):
+    """Check if the FTS5 index of the model exists in the database.
+
+    It is only created on SQLite builds with FTS5, other databases fall back
+    to contains_search().
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _fts_tables:
+        _fts_tables[connection.alias] = set(
+            connection.introspection.table_names(),
+        )
+    return fts_table(model) in _fts_tables[connection.alias]
+
+
+def connect_fts_tables(connection):
+    """Load the FTS5 tables in a new SQLite connection.
+
+    FTS5 reads its configuration the first time a connection uses a table.
+    When that first use is an insert trigger, the read happens inside the
+    write transaction, and SQLite fails the write at once with "database is
+    locked" under concurrency instead of waiting for the lock.
+    """
+    tables = ', '.join(fts_table(model) for model in SEARCH_FIELDS)
+    try:
+        connection.connection.execute(f'SELECT 1 FROM {tables} WHERE 0')
+    except sqlite3.DatabaseError:
+        # Not migrated yet, or SQLite built without FTS5.
+        pass
+
+
+def fts_search(queryset, terms, limit):
+    """Best ranked (bm25) records matching every term as a word prefix.
+
+    The filters of the queryset are applied in the ranked query, before the
+    limit, so the best matching records of the filtered set are returned.
+    """
+    table = fts_table(queryset.model)
+    match = ' '.join('"%s"*' % term for term in terms)
+    condition, params = '', []
+    if queryset.query.has_filters():
+        ids = queryset.order_by().values('pk').query
+        ids_sql, params = ids.sql_with_params()
+        condition = f'AND rowid IN ({ids_sql}) '
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {table} WHERE {table} MATCH %s '
+            f'{condition}ORDER BY rank LIMIT %s',
+            [match, *params, limit],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    records = queryset.in_bulk(ids)
+    return [records[pk] for pk in ids if pk in records]
+
+
+def contains_search(queryset, terms, limit):
+    """Records with every term in one of their text fields, unranked.
+
+    A full scan of the table, only used without an FTS5 index.
+    """
+    condition = Q()
+    for term in terms:
+        term_condition = Q()
+        for field in SEARCH_FIELDS[queryset.model]:
+            term_condition |= Q(**{f'{field}__icontains': term})
+        condition &= term_condition
+    return list(queryset.filter(condition).order_by('id')[:limit])
+
+
+def search(queryset, q, limit):
+    """Records of the queryset matching the free text query q, best first.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return []
+    if fts_available(queryset.model):
+        return fts_search(queryset, terms, limit)
+    return contains_search(queryset, terms, limit)
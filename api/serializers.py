@@ -1,16 +1,188 @@
-from .models import Good, PhysicalPerson, LegalPerson
+from django.conf import settings
+
+from .bulk import (
+    IN_QUERY_CHUNK_SIZE,
+    bulk_insert,
+    chunked,
+    unique_error_message,
+)
+from .models import OWNER_REGEX, Good, LegalPerson, Owner, PhysicalPerson
+from .owners import owner_resolver
+from .timing import phase
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+
+
+class OwnerField(serializers.RelatedField):
+    """An owner written and read as its cpf/cnpj.
+
+    Keeps the JSON shape of the former free text column while the model
+    holds a foreign key to Owner. Lookups go through the owner resolver.
+    """
+    default_error_messages = {
+        'does_not_exist': 'Must be an existing cpf or cnpj.',
+        'incorrect_type': 'Must be a cpf or cnpj string.',
+    }
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', Owner.objects.all())
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def document(data):
+        """The cpf/cnpj sent, coerced as the former CharField did: numbers
+        are accepted as their str(). None for any other type.
+        """
+        if isinstance(data, bool) or not isinstance(data, (str, int, float)):
+            return None
+        return str(data).strip()
+
+    def to_internal_value(self, data):
+        data = self.document(data)
+        if data is None:
+            self.fail('incorrect_type')
+        OWNER_REGEX(data)
+        # Owners of a bulk creation are resolved at once by the list.
+        resolved = getattr(self.root, 'resolved_owners', None)
+        if resolved is None:
+            owner_id = owner_resolver.resolve(data, write=True)
+        else:
+            owner_id = resolved.get(data)
+        if owner_id is None:
+            self.fail('does_not_exist')
+        owner = Owner(pk=owner_id, document=data)
+        owner._state.adding = False
+        return owner
+
+    def to_representation(self, value):
+        # Plain data (e.g. dicts) may already hold the cpf/cnpj.
+        return getattr(value, 'document', value)
+
+
+class TimedDataMixin:
+    """Time building ``.data`` in the serialize phase of the request.
+    """
+
+    @property
+    def data(self):
+        with phase('serialize'):
+            return super().data
+
+
+class BulkListSerializer(TimedDataMixin, serializers.ListSerializer):
+    """Validates and inserts many records with a bounded number of queries.
+
+    Owners of every row are resolved up front with ``IN (...)`` queries,
+    unique fields are checked for the whole list at once instead of one
+    query per row, and valid rows are inserted with ``bulk_create`` in
+    batches of API_BULK_BATCH_SIZE. Errors are reported per row, in the
+    order of the input.
+
+    As owners are resolved before anything is inserted, a company cannot
+    be owned by another company of the same list: create the owner in an
+    earlier request (``import_records`` handles such rows).
+    """
+
+    def prepare_unique_checks(self, rows):
+        """Fetch the taken values of every unique field in the rows.
+
+        Returns a dict mapping each unique field name to the set of values
+        already taken and the error message for a duplicate.
+        """
+        model = self.child.Meta.model
+        checks = {}
+        for name, field in self.child.fields.items():
+            model_field = model._meta.get_field(name)
+            if field.read_only or not model_field.unique:
+                continue
+            # Replaces the query per row of the field's UniqueValidator.
+            field.validators = [
+                validator for validator in field.validators
+                if not isinstance(validator, UniqueValidator)
+            ]
+
+            values = {row[name] for row in rows if isinstance(
+                row.get(name), str)}
+            taken = set()
+            for chunk in chunked(values, IN_QUERY_CHUNK_SIZE):
+                taken.update(model.objects.filter(
+                    **{f'{name}__in': chunk},
+                ).values_list(name, flat=True))
+
+            checks[name] = (taken, unique_error_message(model_field))
+        return checks
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
 
+        rows = [item for item in data if isinstance(item, dict)]
+        if 'owner' in self.child.fields:
+            documents = (OwnerField.document(row.get('owner')) for row in rows)
+            self.resolved_owners = owner_resolver.resolve_many(
+                (document for document in documents if document),
+                write=True,
+            )
+        unique_checks = self.prepare_unique_checks(rows)
 
-class PhysicalPersonSerializer(serializers.ModelSerializer):
+        validated_rows = []
+        errors = []
+        for item in data:
+            try:
+                validated = self.child.run_validation(item)
+            except serializers.ValidationError as exc:
+                errors.append(exc.detail)
+                continue
+
+            row_errors = {}
+            for name, (taken, message) in unique_checks.items():
+                if validated[name] in taken:
+                    row_errors[name] = [message]
+                taken.add(validated[name])
+            errors.append(row_errors)
+            validated_rows.append(validated)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return validated_rows
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        return bulk_insert(
+            model,
+            [model(**attrs) for attrs in validated_data],
+            batch_size=settings.API_BULK_BATCH_SIZE,
+        )
+
+
+class SparseFieldsMixin:
+    """Serialize only the ``fields`` given, all of Meta.fields by default.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class PhysicalPersonSerializer(SparseFieldsMixin,
+                               TimedDataMixin,
+                               serializers.ModelSerializer):
     class Meta:
         model = PhysicalPerson
+        list_serializer_class = BulkListSerializer
         fields = ['id', 'cpf', 'name', 'zipcode', 'email', 'phone_number']
 
 
-class LegalPersonSerializer(serializers.ModelSerializer):
+class LegalPersonSerializer(SparseFieldsMixin,
+                            TimedDataMixin,
+                            serializers.ModelSerializer):
+    owner = OwnerField()
+
     class Meta:
         model = LegalPerson
+        list_serializer_class = BulkListSerializer
         fields = [
             'id',
             'cnpj',
@@ -24,12 +196,65 @@ class LegalPersonSerializer(serializers.ModelSerializer):
         ]
 
 
-class GoodSerializer(serializers.ModelSerializer):
+class GoodSerializer(SparseFieldsMixin,
+                     TimedDataMixin,
+                     serializers.ModelSerializer):
+    owner = OwnerField()
+
     class Meta:
         model = Good
+        list_serializer_class = BulkListSerializer
         fields = [
             'id',
             'good_type',
             'description',
             'owner',
         ]
+
+
+class ReadSerializer:
+    """Read only serializer of the rows of a model serializer.
+
+    Produces the same dicts as ``serializer_class().to_representation()``
+    from plain ``values_list()`` rows: the columns are selected in the
+    order of ``Meta.fields``, owners as the joined cpf/cnpj column, and each
+    row is zipped with the field names instead of going through a field
+    object per attribute. Only meant for the GET responses, writes keep
+    going through the model serializers, which validate.
+
+    Given ``fields``, only those are read from the database and returned,
+    still in the order of Meta.fields.
+    """
+
+    def __init__(self, serializer_class, fields=None):
+        owner_fields = {
+            name for name, field in serializer_class._declared_fields.items()
+            if isinstance(field, OwnerField)
+        }
+        self.fields = [
+            name for name in serializer_class.Meta.fields
+            if fields is None or name in fields
+        ]
+        self.relations = [name for name in self.fields if name in owner_fields]
+        self.columns = [
+            f'{name}__document' if name in owner_fields else name
+            for name in self.fields
+        ]
+
+    def rows(self, queryset, *extra):
+        """The queryset as values_list() rows, followed by extra columns.
+        """
+        return queryset.values_list(*self.columns, *extra)
+
+    def only(self, queryset):
+        """The queryset loading model instances with the fields' columns only.
+        """
+        queryset = queryset.select_related(None)
+        if self.relations:
+            queryset = queryset.select_related(*self.relations)
+        return queryset.only(*self.columns)
+
+    def to_representation(self, row):
+        """The fields of a row, extra columns at its end are left out.
+        """
+        return dict(zip(self.fields, row))
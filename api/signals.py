@@ -0,0 +1,182 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import changes, generations, rollups
+from .bulk import IN_QUERY_CHUNK_SIZE, chunked, records_bulk_created
+from .models import (
+    Change,
+    Good,
+    LegalPerson,
+    Owner,
+    PhysicalPerson,
+    record_saving,
+)
+from .owners import owner_resolver
+from .search import connect_fts_tables
+
+
+def owner_link(model):
+    """Natural key field of a person model and its link field on Owner.
+    """
+    if model is PhysicalPerson:
+        return 'cpf', 'physical_person'
+    return 'cnpj', 'legal_person'
+
+
+@receiver(post_save, sender=PhysicalPerson)
+@receiver(post_save, sender=LegalPerson)
+def person_saved(sender, instance, created, **kwargs):
+    """Keep the person's Owner entry and the owner cache in sync.
+    """
+    field, link = owner_link(sender)
+    document = getattr(instance, field)
+
+    if created:
+        # An entry left by the migration of an unregistered owner is adopted.
+        owner, _ = Owner.objects.update_or_create(
+            document=document,
+            defaults={link: instance},
+        )
+        transaction.on_commit(
+            lambda: owner_resolver.added(document, owner.pk),
+        )
+    else:
+        owner = Owner.objects.filter(**{link: instance})
+        changed = owner.exclude(document=document).update(document=document)
+        if changed:
+            # The previous cpf/cnpj is not known here.
+            owner_resolver.invalidate()
+            generations.bump(generations.OWNERS)
+            changes.log_owned_by(owner.get())
+
+    if sender is LegalPerson:
+        generations.bump(generations.OWNERSHIP)
+
+
+@receiver(post_delete, sender=PhysicalPerson)
+@receiver(post_delete, sender=LegalPerson)
+def person_deleted(sender, instance, **kwargs):
+    owner_resolver.invalidate()
+    if sender is LegalPerson:
+        generations.bump(generations.OWNERSHIP)
+
+
+@receiver(records_bulk_created, sender=PhysicalPerson)
+@receiver(records_bulk_created, sender=LegalPerson)
+def people_bulk_created(sender, instances, **kwargs):
+    """Create the Owner entries of bulk inserted people.
+    """
+    field, link = owner_link(sender)
+    people = {getattr(person, field): person.pk for person in instances}
+
+    adopted = set()
+    for chunk in chunked(people, IN_QUERY_CHUNK_SIZE):
+        adopted.update(Owner.objects.filter(
+            document__in=chunk,
+            physical_person=None,
+            legal_person=None,
+        ).values_list('document', flat=True))
+    for document in adopted:
+        Owner.objects.filter(document=document).update(
+            **{link: people[document]},
+        )
+
+    Owner.objects.bulk_create(
+        [
+            Owner(document=document, **{f'{link}_id': pk})
+            for document, pk in people.items()
+            if document not in adopted
+        ],
+        batch_size=IN_QUERY_CHUNK_SIZE,
+    )
+    transaction.on_commit(lambda: owner_resolver.added_many(people))
+    if sender is LegalPerson:
+        generations.bump(generations.OWNERSHIP)
+
+
+@receiver(record_saving, sender=Good)
+@receiver(record_saving, sender=LegalPerson)
+def holding_saving(sender, instance, **kwargs):
+    """Remember the rollup an updated good or company was counted in.
+    """
+    if not instance._state.adding:
+        instance._stored_rollup_key = rollups.stored_rollup_key(
+            sender,
+            instance.pk,
+        )
+
+
+@receiver(post_save, sender=Good)
+@receiver(post_save, sender=LegalPerson)
+def holding_saved(sender, instance, created, **kwargs):
+    """Move a good or company to the rollup of its current owner and type.
+    """
+    deltas = Counter({rollups.rollup_key(instance): 1})
+    stored = getattr(instance, '_stored_rollup_key', None)
+    if not created and stored is not None:
+        deltas[stored] -= 1
+    rollups.add(deltas)
+
+
+@receiver(post_delete, sender=Good)
+@receiver(post_delete, sender=LegalPerson)
+def holding_deleted(sender, instance, **kwargs):
+    rollups.add(Counter({rollups.rollup_key(instance): -1}))
+
+
+@receiver(records_bulk_created, sender=Good)
+@receiver(records_bulk_created, sender=LegalPerson)
+def holdings_bulk_created(sender, instances, **kwargs):
+    rollups.add(Counter(rollups.rollup_key(obj) for obj in instances))
+
+
+@receiver(post_save, sender=PhysicalPerson)
+@receiver(post_save, sender=LegalPerson)
+@receiver(post_save, sender=Good)
+@receiver(post_delete, sender=PhysicalPerson)
+@receiver(post_delete, sender=LegalPerson)
+@receiver(post_delete, sender=Good)
+@receiver(records_bulk_created, sender=PhysicalPerson)
+@receiver(records_bulk_created, sender=LegalPerson)
+@receiver(records_bulk_created, sender=Good)
+def table_changed(sender, **kwargs):
+    """Bump the generation of the table, changing the ETags of its lists.
+    """
+    generations.bump(generations.table(sender))
+
+
+@receiver(post_save, sender=PhysicalPerson)
+@receiver(post_save, sender=LegalPerson)
+@receiver(post_save, sender=Good)
+def record_saved(sender, instance, created, **kwargs):
+    """Append the write to the change log read by /v1/changes/.
+    """
+    changes.log(
+        sender,
+        [instance.pk],
+        Change.CREATE if created else Change.UPDATE,
+    )
+
+
+@receiver(post_delete, sender=PhysicalPerson)
+@receiver(post_delete, sender=LegalPerson)
+@receiver(post_delete, sender=Good)
+def record_deleted(sender, instance, **kwargs):
+    changes.log(sender, [instance.pk], Change.DELETE)
+
+
+@receiver(records_bulk_created, sender=PhysicalPerson)
+@receiver(records_bulk_created, sender=LegalPerson)
+@receiver(records_bulk_created, sender=Good)
+def records_logged(sender, instances, **kwargs):
+    changes.log(sender, [obj.pk for obj in instances], Change.CREATE)
+
+
+@receiver(connection_created)
+def database_connected(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        connect_fts_tables(connection)
@@ -0,0 +1,75 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .serializers import ReadSerializer
+
+# Rows fetched from the database cursor (and sent to the client) at a time.
+STREAM_CHUNK_SIZE = 2000
+
+
+def wants_stream(request):
+    """Check if the client asked for the whole collection as a stream.
+    """
+    return (
+        request.query_params.get('stream') in ('1', 'true')
+        or request.accepted_renderer.format == 'ndjson'
+    )
+
+
+def _encoded_chunks(queryset, serializer_class, chunk_size, fields):
+    """Yield lists of JSON encoded rows, reading the table chunk by chunk.
+
+    Rows are read as values_list() tuples by a ReadSerializer, so no model
+    instances or per-row field objects are built, and at most
+    ``chunk_size`` rows live in memory.
+    """
+    serializer = ReadSerializer(serializer_class, fields)
+    encoder = DjangoJSONEncoder()
+    rows = serializer.rows(queryset.order_by('id'))
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(encoder.encode(serializer.to_representation(row)))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_json_array(queryset, serializer_class,
+                      chunk_size=STREAM_CHUNK_SIZE, fields=None):
+    """Stream the rows as one JSON array, equal to ``json.dumps(rows)``.
+    """
+    yield '['
+    first = True
+    chunks = _encoded_chunks(queryset, serializer_class, chunk_size, fields)
+    for chunk in chunks:
+        yield ('' if first else ', ') + ', '.join(chunk)
+        first = False
+    yield ']'
+
+
+def stream_ndjson(queryset, serializer_class, chunk_size=STREAM_CHUNK_SIZE,
+                  fields=None):
+    """Stream the rows as newline delimited JSON.
+    """
+    chunks = _encoded_chunks(queryset, serializer_class, chunk_size, fields)
+    for chunk in chunks:
+        yield '\n'.join(chunk) + '\n'
+
+
+def streaming_response(request, queryset, serializer_class, fields=None):
+    """Build a response streaming every row of the queryset.
+
+    The format follows content negotiation: NDJSON when the client accepts
+    ``application/x-ndjson``, a plain JSON array otherwise.
+    """
+    if request.accepted_renderer.format == 'ndjson':
+        return StreamingHttpResponse(
+            stream_ndjson(queryset, serializer_class, fields=fields),
+            content_type='application/x-ndjson',
+        )
+    return StreamingHttpResponse(
+        stream_json_array(queryset, serializer_class, fields=fields),
+        content_type='application/json',
+    )
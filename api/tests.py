@@ -1,18 +1,60 @@
+import base64
+import csv
+import gzip
 import json
+import os
+import tempfile
+import threading
+from io import StringIO
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection, connections, transaction
+from django.http import JsonResponse
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from model_bakery import baker
 from rest_framework import status
-from rest_framework.test import APIClient
-
-from .models import Good, LegalPerson, PhysicalPerson
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import changes
+from .authentication import SignedTokenAuthentication, credential_cache
+from .fragments import (
+    FragmentCache,
+    encoded_rows,
+    fragment_cache,
+    state_fields,
+)
+from .lru import LRUCache
+from .metrics import ValueStore, totals
+from .management.commands.seed_dataset import cnpj, cpf
+from .models import (
+    Change,
+    Generation,
+    Good,
+    LegalPerson,
+    Owner,
+    PhysicalPerson,
+    Rollup,
+)
+from .owners import BloomFilter, OwnerResolver, owner_resolver
+from .query_budget import (
+    QueryBudgetExceeded,
+    query_budget,
+    sql_shape,
+    unbudgeted,
+)
 from .serializers import (
     GoodSerializer,
     LegalPersonSerializer,
-    PhysicalPersonSerializer
+    PhysicalPersonSerializer,
+    ReadSerializer,
 )
+from .search import contains_search, search
+from .streaming import stream_json_array
 
 
 PHYSICAL_PERSON_DATA = {
@@ -40,6 +82,11 @@ GOOD_DATA = {
 }
 
 
+def with_owner(data):
+    """Model fields for API data whose owner is given as a cpf/cnpj."""
+    return {**data, "owner": Owner.objects.get(document=data["owner"])}
+
+
 class TestAPIModels(TestCase):
     """Tests to validade the API models."""
 
@@ -63,11 +110,28 @@ class TestAPIModels(TestCase):
             zipcode="1234567A",
             email="fulano@email.com",
             phone_number="1123456789A",
-            owner="123456789",
+            owner=baker.make(Owner),
         )
         with self.assertRaises(ValidationError):
             legal_person.full_clean()
 
+    def test_owner_entry_follows_person(self):
+        physical_person = PhysicalPerson.objects.create(
+            **PHYSICAL_PERSON_DATA,
+        )
+        owner = Owner.objects.get(physical_person=physical_person)
+        self.assertEquals(owner.document, physical_person.cpf)
+
+        physical_person.cpf = '11122233344'
+        physical_person.save()
+        owner.refresh_from_db()
+        self.assertEquals(owner.document, '11122233344')
+
+    def test_owner_serialized_as_document(self):
+        legal_person = baker.make(LegalPerson)
+        data = LegalPersonSerializer(legal_person).data
+        self.assertEquals(data['owner'], legal_person.owner.document)
+
 
 class TestAPIAuthentication(TestCase):
     """Tests the authentication access behavior."""
@@ -101,10 +165,243 @@ class TestAPIAuthentication(TestCase):
         self.assertEquals(request.status_code, status.HTTP_200_OK)
 
 
+class TestAPICachedBasicAuthentication(TestCase):
+    """Tests the verified credential cache of the Basic authentication."""
+
+    def setUp(self):
+        credential_cache.clear()
+        self.admin = get_user_model().objects.create(username='admin')
+        self.admin.set_password('asdf!@#$')
+        self.admin.save()
+        self.client = APIClient()
+
+    def get_with_credentials(self, password):
+        credentials = base64.b64encode(f'admin:{password}'.encode())
+        self.client.credentials(
+            HTTP_AUTHORIZATION='Basic ' + credentials.decode(),
+        )
+        return self.client.get('/v1/goods/')
+
+    def test_verified_credentials_are_cached(self):
+        request = self.get_with_credentials('asdf!@#$')
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        self.assertEquals(len(credential_cache), 1)
+
+        request = self.get_with_credentials('asdf!@#$')
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        self.assertEquals(len(credential_cache), 1)
+
+    def test_wrong_password_is_not_cached(self):
+        request = self.get_with_credentials('wrong-password')
+        self.assertEquals(request.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEquals(len(credential_cache), 0)
+
+    def test_password_change_invalidates_entry(self):
+        self.get_with_credentials('asdf!@#$')
+        self.admin.set_password('new-password')
+        self.admin.save()
+
+        request = self.get_with_credentials('asdf!@#$')
+        self.assertEquals(request.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEquals(len(credential_cache), 0)
+
+    def test_deactivation_invalidates_entry(self):
+        self.get_with_credentials('asdf!@#$')
+        self.admin.is_active = False
+        self.admin.save()
+
+        request = self.get_with_credentials('asdf!@#$')
+        self.assertEquals(request.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cache_is_bounded(self):
+        cache = LRUCache(max_entries=2, ttl=60)
+        for key in (b'a', b'b', b'c'):
+            cache.set(key, (1, 'hash'))
+
+        self.assertEquals(len(cache), 2)
+        self.assertIsNone(cache.get(b'a'))
+        self.assertEquals(cache.get(b'c'), (1, 'hash'))
+
+    def test_cache_entries_expire(self):
+        cache = LRUCache(max_entries=2, ttl=0)
+        cache.set(b'a', (1, 'hash'))
+        self.assertIsNone(cache.get(b'a'))
+
+
+class TestAPISignedTokenAuthentication(TestCase):
+    """Tests the signed bearer tokens."""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create(username='admin')
+        self.admin.set_password('asdf!@#$')
+        self.admin.save()
+
+    def obtain_token(self):
+        client = APIClient()
+        self.assertTrue(client.login(username='admin', password='asdf!@#$'))
+        request = client.post('/v1/token/')
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        return json.loads(request.content)['token']
+
+    def get_with_token(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+        return client.get('/v1/goods/')
+
+    def test_obtain_token_requires_credentials(self):
+        request = APIClient().post('/v1/token/')
+        self.assertEquals(request.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_access_with_token(self):
+        request = self.get_with_token(self.obtain_token())
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+
+    def test_token_authentication_without_queries(self):
+        token = self.obtain_token()
+        request = Request(APIRequestFactory().get(
+            '/v1/goods/',
+            HTTP_AUTHORIZATION='Bearer ' + token,
+        ))
+        with self.assertNumQueries(0):
+            user, _ = SignedTokenAuthentication().authenticate(request)
+
+        self.assertEquals(user.pk, self.admin.pk)
+        self.assertEquals(user.username, 'admin')
+
+    def test_tampered_token(self):
+        request = self.get_with_token(self.obtain_token() + 'x')
+        self.assertEquals(request.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_expired_token(self):
+        token = self.obtain_token()
+        with override_settings(API_TOKEN_TTL=-1):
+            request = self.get_with_token(token)
+        self.assertEquals(request.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_key_rotation(self):
+        with override_settings(API_TOKEN_SIGNING_KEYS=['old-key']):
+            token = self.obtain_token()
+
+        with override_settings(API_TOKEN_SIGNING_KEYS=['new-key', 'old-key']):
+            request = self.get_with_token(token)
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+
+        with override_settings(API_TOKEN_SIGNING_KEYS=['new-key']):
+            request = self.get_with_token(token)
+        self.assertEquals(request.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TestOwnerResolver(TestCase):
+    """Tests the cached cpf/cnpj owner existence checks."""
+
+    def setUp(self):
+        self.resolver = OwnerResolver(max_entries=100, ttl=60)
+        self.physical_person = PhysicalPerson.objects.create(
+            **PHYSICAL_PERSON_DATA,
+        )
+        self.legal_person = LegalPerson.objects.create(
+            **with_owner(LEGAL_PERSON_DATA),
+        )
+
+    def test_single_query_then_cached(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(self.resolver.exists(self.physical_person.cpf))
+        with self.assertNumQueries(1):
+            self.assertTrue(self.resolver.exists(self.legal_person.cnpj))
+        with self.assertNumQueries(1):
+            self.assertFalse(self.resolver.exists('99999999999'))
+
+        with self.assertNumQueries(0):
+            self.assertTrue(self.resolver.exists(self.physical_person.cpf))
+            self.assertTrue(self.resolver.exists(self.legal_person.cnpj))
+            self.assertFalse(self.resolver.exists('99999999999'))
+
+    def test_invalidated_on_delete(self):
+        owner_resolver.invalidate()
+        self.assertTrue(owner_resolver.exists(self.legal_person.cnpj))
+        self.legal_person.delete()
+        self.assertFalse(owner_resolver.exists(self.legal_person.cnpj))
+
+    def test_invalidated_on_update(self):
+        owner_resolver.invalidate()
+        self.assertTrue(owner_resolver.exists(self.physical_person.cpf))
+        self.physical_person.cpf = '11122233344'
+        self.physical_person.save()
+
+        self.assertFalse(owner_resolver.exists(PHYSICAL_PERSON_DATA['cpf']))
+        self.assertTrue(owner_resolver.exists('11122233344'))
+
+    def test_write_skips_stale_cache(self):
+        # Another process registers and removes people behind its cache.
+        self.assertIsNone(self.resolver.resolve('52998224725'))
+        person = PhysicalPerson.objects.create(
+            **dict(PHYSICAL_PERSON_DATA, cpf='52998224725'),
+        )
+        owner_id = Owner.objects.get(document=person.cpf).id
+        self.assertIsNone(self.resolver.resolve(person.cpf))
+        self.assertEquals(self.resolver.resolve(person.cpf, write=True),
+                          owner_id)
+        self.assertEquals(
+            self.resolver.resolve_many([person.cpf], write=True),
+            {person.cpf: owner_id},
+        )
+
+        person.delete()
+        self.assertEquals(self.resolver.resolve(person.cpf), owner_id)
+        self.assertIsNone(self.resolver.resolve(person.cpf, write=True))
+        self.assertEquals(
+            self.resolver.resolve_many([person.cpf], write=True),
+            {},
+        )
+
+    def test_write_with_stale_cache(self):
+        admin = get_user_model().objects.create(username='admin')
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        Good.objects.create(**with_owner(GOOD_DATA))
+        owner_resolver.cache.set(self.legal_person.cnpj, 0)
+        owner_resolver.cache.set('52998224725', self.legal_person.pk)
+
+        request = client.post('/v1/goods/', GOOD_DATA, format='json')
+        self.assertEquals(request.status_code, status.HTTP_201_CREATED)
+
+        request = client.post(
+            '/v1/goods/',
+            [dict(GOOD_DATA, owner='52998224725')],
+            format='json',
+        )
+        self.assertEquals(request.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(request.json(), [
+            {'owner': ['Must be an existing cpf or cnpj.']},
+        ])
+
+    def test_bloom_filter_rejects_without_queries(self):
+        resolver = OwnerResolver(max_entries=100, ttl=60,
+                                 use_bloom_filter=True)
+        resolver.warm_bloom_filter()
+
+        with self.assertNumQueries(0):
+            self.assertFalse(resolver.exists('99999999999'))
+        self.assertTrue(resolver.exists(self.physical_person.cpf))
+
+    def test_bloom_filter_membership(self):
+        bloom_filter = BloomFilter(capacity=1000)
+        keys = [f'{number:011d}' for number in range(1000)]
+        for key in keys:
+            bloom_filter.add(key)
+
+        self.assertTrue(all(key in bloom_filter for key in keys))
+        false_positives = sum(
+            f'{number:014d}' in bloom_filter for number in range(1000)
+        )
+        self.assertLess(false_positives, 50)
+
+
 class TestAPIEndpoints(TestCase):
     """Tests the API endpoints."""
 
     def setUp(self):
+        owner_resolver.invalidate()
         admin = get_user_model().objects.create(username='admin')
         self.client = APIClient()
         self.client.force_authenticate(user=admin)
@@ -115,11 +412,11 @@ class TestAPIEndpoints(TestCase):
         )
 
         self.legal_person = LegalPerson.objects.create(
-            **LEGAL_PERSON_DATA,
+            **with_owner(LEGAL_PERSON_DATA),
         )
 
         self.good = Good.objects.create(
-            **GOOD_DATA,
+            **with_owner(GOOD_DATA),
         )
 
     def test_physical_people_get_list(self):
@@ -127,7 +424,10 @@ class TestAPIEndpoints(TestCase):
         request = self.client.get('/v1/physical-people/')
 
         self.assertEquals(request.status_code, status.HTTP_200_OK)
-        self.assertEquals(len(json.loads(request.content)), len(records))
+        self.assertEquals(
+            len(json.loads(request.content)['results']),
+            len(records),
+        )
 
     def test_physical_people_post(self):
         new_record = {
@@ -201,19 +501,32 @@ class TestAPIEndpoints(TestCase):
         self.assertEquals(request.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_physical_people_delete(self):
+        Good.objects.all().delete()
+        LegalPerson.objects.all().delete()
         record = PhysicalPerson.objects.get(pk=1)
         request = self.client.delete(f'/v1/physical-people/{record.id}/')
 
         self.assertEquals(request.status_code, status.HTTP_200_OK)
         records = PhysicalPerson.objects.filter(pk=1)
         self.assertEquals(len(records), 0)
+        self.assertFalse(Owner.objects.filter(document=record.cpf).exists())
+
+    def test_physical_people_delete_owner_of_company(self):
+        record = PhysicalPerson.objects.get(pk=1)
+        request = self.client.delete(f'/v1/physical-people/{record.id}/')
+
+        self.assertEquals(request.status_code, status.HTTP_409_CONFLICT)
+        self.assertTrue(PhysicalPerson.objects.filter(pk=1).exists())
 
     def test_legal_people_get_list(self):
         records = LegalPerson.objects.all()
         request = self.client.get('/v1/legal-people/')
 
         self.assertEquals(request.status_code, status.HTTP_200_OK)
-        self.assertEquals(len(json.loads(request.content)), len(records))
+        self.assertEquals(
+            len(json.loads(request.content)['results']),
+            len(records),
+        )
 
     def test_legal_people_post(self):
         new_record = LegalPersonSerializer({
@@ -278,7 +591,7 @@ class TestAPIEndpoints(TestCase):
             record.state_registration,
             data['state_registration'],
         )
-        self.assertEquals(record.owner, data['owner'])
+        self.assertEquals(record.owner.document, data['owner'])
         self.assertEquals(record.zipcode, data['zipcode'])
         self.assertEquals(record.email, data['email'])
         self.assertEquals(record.phone_number, data['phone_number'])
@@ -316,6 +629,7 @@ class TestAPIEndpoints(TestCase):
         self.assertEquals(request.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_legal_people_delete(self):
+        Good.objects.all().delete()
         record = LegalPerson.objects.get(pk=1)
         request = self.client.delete(f'/v1/legal-people/{record.id}/')
 
@@ -323,12 +637,22 @@ class TestAPIEndpoints(TestCase):
         records = LegalPerson.objects.filter(pk=1)
         self.assertEquals(len(records), 0)
 
+    def test_legal_people_delete_owner_of_good(self):
+        record = LegalPerson.objects.get(pk=1)
+        request = self.client.delete(f'/v1/legal-people/{record.id}/')
+
+        self.assertEquals(request.status_code, status.HTTP_409_CONFLICT)
+        self.assertTrue(LegalPerson.objects.filter(pk=1).exists())
+
     def test_goods_get_list(self):
         records = Good.objects.all()
         request = self.client.get('/v1/goods/')
 
         self.assertEquals(request.status_code, status.HTTP_200_OK)
-        self.assertEquals(len(json.loads(request.content)), len(records))
+        self.assertEquals(
+            len(json.loads(request.content)['results']),
+            len(records),
+        )
 
     def test_goods_post(self):
         new_record = GoodSerializer({
@@ -378,7 +702,7 @@ class TestAPIEndpoints(TestCase):
         self.assertEquals(record.id, data['id'])
         self.assertEquals(record.good_type, data['good_type'])
         self.assertEquals(record.description, data['description'])
-        self.assertEquals(record.owner, data['owner'])
+        self.assertEquals(record.owner.document, data['owner'])
 
     def test_goods_non_existent_id(self):
         request = self.client.get(f'/v1/goods/{999}/')
@@ -395,7 +719,7 @@ class TestAPIEndpoints(TestCase):
         )
         self.assertEquals(request.status_code, status.HTTP_200_OK)
         record = Good.objects.get(pk=1)
-        self.assertEquals(record.owner, data['owner'])
+        self.assertEquals(record.owner.document, data['owner'])
 
     def test_goods_put_invalid_owner(self):
         record = Good.objects.get(pk=1)
@@ -415,3 +739,1959 @@ class TestAPIEndpoints(TestCase):
         self.assertEquals(request.status_code, status.HTTP_200_OK)
         records = Good.objects.filter(pk=1)
         self.assertEquals(len(records), 0)
+
+
+class TestAPIPagination(TestCase):
+    """Tests the keyset pagination of the list endpoints."""
+
+    def setUp(self):
+        admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=admin)
+        baker.make(Good, _quantity=5)
+
+    def test_limit_and_next_cursor(self):
+        request = self.client.get('/v1/goods/?limit=2')
+        data = json.loads(request.content)
+
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        self.assertEquals(len(data['results']), 2)
+        self.assertIsNone(data['previous'])
+        self.assertIn('cursor=', data['next'])
+
+    def test_walk_all_pages(self):
+        ids = []
+        url = '/v1/goods/?limit=2'
+        while url:
+            data = json.loads(self.client.get(url).content)
+            ids.extend(record['id'] for record in data['results'])
+            url = data['next']
+
+        self.assertEquals(
+            ids,
+            list(Good.objects.order_by('id').values_list('id', flat=True)),
+        )
+
+    def test_invalid_cursor(self):
+        request = self.client.get('/v1/goods/?cursor=invalid')
+        self.assertEquals(request.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TestAPIStreaming(TestCase):
+    """Tests the streaming mode of the list endpoints."""
+
+    def setUp(self):
+        admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=admin)
+        baker.make(Good, _quantity=5)
+
+    def test_stream_json_array(self):
+        request = self.client.get('/v1/goods/?stream=1')
+        content = b''.join(request.streaming_content)
+        expected = GoodSerializer(Good.objects.order_by('id'), many=True).data
+
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        self.assertEquals(request['Content-Type'], 'application/json')
+        self.assertEquals(json.loads(content), expected)
+        self.assertEquals(content, json.dumps(expected).encode())
+
+    def test_stream_ndjson(self):
+        request = self.client.get(
+            '/v1/goods/',
+            HTTP_ACCEPT='application/x-ndjson',
+        )
+        lines = b''.join(request.streaming_content).splitlines()
+        expected = GoodSerializer(Good.objects.order_by('id'), many=True).data
+
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        self.assertEquals(request['Content-Type'], 'application/x-ndjson')
+        self.assertEquals([json.loads(line) for line in lines], expected)
+
+    def test_stream_across_chunks(self):
+        content = ''.join(
+            stream_json_array(Good.objects.all(), GoodSerializer, 2),
+        )
+        expected = GoodSerializer(Good.objects.order_by('id'), many=True).data
+        self.assertEquals(content, json.dumps(expected))
+
+    def test_stream_empty_table(self):
+        Good.objects.all().delete()
+        request = self.client.get('/v1/goods/?stream=1')
+        self.assertEquals(b''.join(request.streaming_content), b'[]')
+
+
+def physical_people_rows(quantity, start=0):
+    return [
+        {
+            'cpf': f'{number:011d}',
+            'name': f'Person {number}',
+            'zipcode': '88000000',
+            'email': f'person{number}@email.com',
+            'phone_number': '4899999999',
+        }
+        for number in range(start, start + quantity)
+    ]
+
+
+class TestAPIBulkCreate(TestCase):
+    """Tests the bulk creation of records through JSON arrays."""
+
+    def setUp(self):
+        owner_resolver.invalidate()
+        admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=admin)
+
+    def post(self, url, rows):
+        return self.client.post(
+            url,
+            json.dumps(rows),
+            content_type='application/json',
+        )
+
+    def test_bulk_create_physical_people(self):
+        rows = physical_people_rows(3)
+        request = self.post('/v1/physical-people/', rows)
+        data = json.loads(request.content)
+
+        self.assertEquals(request.status_code, status.HTTP_201_CREATED)
+        self.assertEquals([record['cpf'] for record in data],
+                          [row['cpf'] for row in rows])
+        for record in data:
+            person = PhysicalPerson.objects.get(pk=record['id'])
+            self.assertEquals(person.cpf, record['cpf'])
+            self.assertEquals(person.owner_entry.document, person.cpf)
+
+    def test_bulk_create_goods(self):
+        self.post('/v1/physical-people/', physical_people_rows(2))
+        rows = [
+            {'good_type': 'imovel', 'description': 'House', 'owner': cpf}
+            for cpf in ('00000000000', '00000000001', '00000000000')
+        ]
+        request = self.post('/v1/goods/', rows)
+
+        self.assertEquals(request.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(
+            list(Good.objects.order_by('id').values_list(
+                'owner__document', flat=True)),
+            [row['owner'] for row in rows],
+        )
+
+    def test_queries_do_not_grow_with_rows(self):
+        # The first write also creates the generation rows it bumps.
+        self.post('/v1/physical-people/', physical_people_rows(1, 200))
+        with CaptureQueriesContext(connection) as few:
+            self.post('/v1/physical-people/', physical_people_rows(5))
+        with CaptureQueriesContext(connection) as many:
+            self.post('/v1/physical-people/', physical_people_rows(100, 5))
+
+        self.assertEquals(PhysicalPerson.objects.count(), 106)
+        self.assertEquals(len(few), len(many))
+
+    @override_settings(API_BULK_BATCH_SIZE=7)
+    def test_batched_inserts(self):
+        request = self.post('/v1/physical-people/', physical_people_rows(20))
+        data = json.loads(request.content)
+
+        self.assertEquals(request.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(
+            [record['id'] for record in data],
+            list(PhysicalPerson.objects.order_by('id').values_list(
+                'id', flat=True)),
+        )
+
+    def test_errors_per_row(self):
+        PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        rows = physical_people_rows(4)
+        rows[1]['cpf'] = 'invalid'
+        rows[2]['cpf'] = rows[0]['cpf']
+        rows[3]['cpf'] = PHYSICAL_PERSON_DATA['cpf']
+        request = self.post('/v1/physical-people/', rows)
+        errors = json.loads(request.content)
+
+        self.assertEquals(request.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(errors[0], {})
+        self.assertEquals(list(errors[1]), ['cpf'])
+        self.assertEquals(list(errors[2]), ['cpf'])
+        self.assertEquals(list(errors[3]), ['cpf'])
+        self.assertEquals(PhysicalPerson.objects.count(), 1)
+
+    def test_unknown_owner_per_row(self):
+        self.post('/v1/physical-people/', physical_people_rows(1))
+        rows = [
+            {'good_type': 'imovel', 'description': 'A', 'owner': cpf}
+            for cpf in ('00000000000', '99999999999')
+        ]
+        request = self.post('/v1/goods/', rows)
+        errors = json.loads(request.content)
+
+        self.assertEquals(request.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(errors[0], {})
+        self.assertEquals(errors[1],
+                          {'owner': ['Must be an existing cpf or cnpj.']})
+        self.assertEquals(Good.objects.count(), 0)
+
+    def test_numeric_owner(self):
+        self.post('/v1/physical-people/',
+                  physical_people_rows(1, start=12345678901))
+        good = {
+            'good_type': 'imovel',
+            'description': 'A',
+            'owner': 12345678901,
+        }
+
+        self.assertEquals(self.post('/v1/goods/', good).status_code,
+                          status.HTTP_201_CREATED)
+        self.assertEquals(self.post('/v1/goods/', [good] * 2).status_code,
+                          status.HTTP_201_CREATED)
+        self.assertEquals(
+            set(Good.objects.values_list('owner__document', flat=True)),
+            {'12345678901'},
+        )
+        request = self.post('/v1/goods/', dict(good, owner=True))
+        self.assertEquals(json.loads(request.content),
+                          {'owner': ['Must be a cpf or cnpj string.']})
+
+    @override_settings(API_BULK_MAX_RECORDS=2)
+    def test_too_many_records(self):
+        request = self.post('/v1/physical-people/', physical_people_rows(3))
+        self.assertEquals(request.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(PhysicalPerson.objects.count(), 0)
+
+
+class TestImportRecords(TransactionTestCase):
+    """Tests the import_records management command."""
+
+    def setUp(self):
+        owner_resolver.invalidate()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_csv(self, name, rows):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def write_ndjson(self, name, rows):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as ndjson_file:
+            for row in rows:
+                ndjson_file.write(json.dumps(row) + '\n')
+        return path
+
+    def import_records(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_records', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import_csv_in_chunks(self):
+        path = self.write_csv('people.csv', physical_people_rows(25))
+        stdout, stderr = self.import_records(
+            'physical-people', path, '--commit-every', '10',
+        )
+
+        self.assertEquals(PhysicalPerson.objects.count(), 25)
+        self.assertEquals(Owner.objects.count(), 25)
+        self.assertEquals(stderr, '')
+        self.assertIn('10 rows read, 10 imported, 0 rejected', stdout)
+        self.assertIn('25 rows read, 25 imported, 0 rejected', stdout)
+        self.assertIn('rows/s', stdout)
+
+    def test_import_ndjson_resolves_owners(self):
+        self.import_records(
+            'physical-people',
+            self.write_csv('people.csv', physical_people_rows(3)),
+        )
+        rows = [
+            {'good_type': 'imovel', 'description': f'House {number}',
+             'owner': f'{number % 4:011d}'}
+            for number in range(8)
+        ]
+        stdout, stderr = self.import_records(
+            'goods', self.write_ndjson('goods.ndjson', rows),
+            '--commit-every', '3',
+        )
+
+        self.assertEquals(Good.objects.count(), 6)
+        self.assertEquals(stderr.count('Must be an existing cpf or cnpj.'), 2)
+        self.assertIn('Row 4: ', stderr)
+        self.assertIn('Row 8: ', stderr)
+
+    def test_invalid_rows_are_rejected(self):
+        PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        rows = physical_people_rows(4)
+        rows[1]['cpf'] = 'invalid'
+        rows[2]['cpf'] = rows[0]['cpf']
+        rows[3]['cpf'] = PHYSICAL_PERSON_DATA['cpf']
+        stdout, stderr = self.import_records(
+            'physical-people', self.write_ndjson('people.jsonl', rows),
+        )
+
+        self.assertEquals(PhysicalPerson.objects.count(), 2)
+        self.assertIn('1 imported, 3 rejected', stdout)
+        self.assertEquals(
+            [line.split(':')[0] for line in stderr.splitlines()],
+            ['Row 2', 'Row 3', 'Row 4'],
+        )
+
+    def test_ndjson_lines_must_be_objects(self):
+        path = os.path.join(self.directory.name, 'people.ndjson')
+        with open(path, 'w') as ndjson_file:
+            ndjson_file.write('[1, 2]\n')
+            ndjson_file.write(json.dumps(physical_people_rows(1)[0]) + '\n')
+            ndjson_file.write('"text"\n')
+
+        stdout, stderr = self.import_records('physical-people', path)
+
+        self.assertEquals(PhysicalPerson.objects.count(), 1)
+        self.assertIn('1 imported, 2 rejected', stdout)
+        self.assertIn('Row 1: ', stderr)
+        self.assertIn('Expected an object, but got list.', stderr)
+        self.assertIn('Row 3: ', stderr)
+
+    def test_companies_owned_by_companies_of_the_chunk(self):
+        PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        owner = PHYSICAL_PERSON_DATA['cpf']
+        rows = []
+        for number in range(5):
+            rows.append(dict(
+                LEGAL_PERSON_DATA,
+                cnpj=f'{number:014d}',
+                state_registration='123456789',
+                owner=owner,
+            ))
+            owner = rows[-1]['cnpj']
+        rows.append(dict(rows[0], cnpj=f'{9:014d}', owner=f'{8:014d}'))
+        stdout, stderr = self.import_records(
+            'legal-people', self.write_ndjson('companies.ndjson', rows),
+        )
+
+        self.assertIn('5 imported, 1 rejected', stdout)
+        self.assertIn('Row 6: {"owner": ', stderr)
+        self.assertEquals(
+            list(LegalPerson.objects.order_by('id').values_list(
+                'owner__document', flat=True)),
+            [PHYSICAL_PERSON_DATA['cpf']]
+            + [f'{number:014d}' for number in range(4)],
+        )
+
+    def test_resume_from_checkpoint(self):
+        path = self.write_csv('people.csv', physical_people_rows(10))
+        checkpoint = os.path.join(self.directory.name, 'checkpoint')
+        with open(checkpoint, 'w') as checkpoint_file:
+            checkpoint_file.write('6')
+
+        stdout, stderr = self.import_records(
+            'physical-people', path, '--checkpoint', checkpoint,
+        )
+
+        self.assertIn('Resuming after row 6.', stdout)
+        self.assertEquals(
+            list(PhysicalPerson.objects.order_by('cpf').values_list(
+                'cpf', flat=True)),
+            [f'{number:011d}' for number in range(6, 10)],
+        )
+        with open(checkpoint) as checkpoint_file:
+            self.assertEquals(checkpoint_file.read(), '10')
+
+
+class TestExportRecords(TestCase):
+    """Tests the export_records management command."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        LegalPerson.objects.create(**with_owner(LEGAL_PERSON_DATA))
+        Good.objects.create(**with_owner(GOOD_DATA))
+
+    def export_records(self, *args):
+        call_command(
+            'export_records', *args,
+            '--output-dir', self.directory.name,
+            stdout=StringIO(),
+        )
+
+    def test_export_ndjson(self):
+        self.export_records()
+
+        for resource, serializer_class in (
+            ('physical-people', PhysicalPersonSerializer),
+            ('legal-people', LegalPersonSerializer),
+            ('goods', GoodSerializer),
+        ):
+            path = os.path.join(self.directory.name, f'{resource}.ndjson')
+            with open(path) as ndjson_file:
+                rows = [json.loads(line) for line in ndjson_file]
+            model = serializer_class.Meta.model
+            self.assertEquals(
+                rows,
+                serializer_class(model.objects.all(), many=True).data,
+            )
+
+    def test_export_gzip_csv(self):
+        self.export_records('goods', '--format', 'csv', '--gzip')
+
+        path = os.path.join(self.directory.name, 'goods.csv.gz')
+        with gzip.open(path, 'rt', newline='') as csv_file:
+            rows = list(csv.DictReader(csv_file))
+        self.assertEquals(rows, [{
+            'id': str(Good.objects.get().id),
+            **GOOD_DATA,
+        }])
+        self.assertEquals(os.listdir(self.directory.name), ['goods.csv.gz'])
+
+
+class TestAPIHoldings(TestCase):
+    """Tests the transitive holdings of an owner."""
+
+    def setUp(self):
+        cache.clear()
+        owner_resolver.invalidate()
+        admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=admin)
+        self.person = PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        # person -> first -> second -> third
+        self.first = self.company('10000000000001', self.person.cpf)
+        self.second = self.company('10000000000002', self.first.cnpj)
+        self.third = self.company('10000000000003', self.second.cnpj)
+        self.house = self.good('House', self.person.cpf)
+        self.car = self.good('Car', self.second.cnpj)
+
+    def company(self, cnpj, owner):
+        return LegalPerson.objects.create(**with_owner({
+            **LEGAL_PERSON_DATA,
+            'cnpj': cnpj,
+            'owner': owner,
+        }))
+
+    def good(self, description, owner):
+        return Good.objects.create(**with_owner({
+            **GOOD_DATA,
+            'description': description,
+            'owner': owner,
+        }))
+
+    def get_holdings(self, document, query=''):
+        return self.client.get(f'/v1/owners/{document}/holdings/{query}')
+
+    def test_holdings_tree(self):
+        request = self.get_holdings(self.person.cpf)
+        data = json.loads(request.content)
+
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        self.assertEquals(data['owner'], self.person.cpf)
+        self.assertEquals(
+            [(company['cnpj'], company['depth'])
+             for company in data['companies']],
+            [(self.first.cnpj, 1), (self.second.cnpj, 2),
+             (self.third.cnpj, 3)],
+        )
+        self.assertEquals(data['companies'][1]['owner'], self.first.cnpj)
+        self.assertEquals([good['id'] for good in data['goods']],
+                          [self.house.id, self.car.id])
+
+    def test_holdings_of_a_company(self):
+        request = self.get_holdings(self.second.cnpj)
+        data = json.loads(request.content)
+
+        self.assertEquals([company['cnpj'] for company in data['companies']],
+                          [self.third.cnpj])
+        self.assertEquals([good['id'] for good in data['goods']],
+                          [self.car.id])
+
+    def test_depth_limit(self):
+        request = self.get_holdings(self.person.cpf, '?depth=1')
+        data = json.loads(request.content)
+
+        self.assertEquals([company['cnpj'] for company in data['companies']],
+                          [self.first.cnpj])
+        self.assertEquals([good['id'] for good in data['goods']],
+                          [self.house.id])
+
+    def test_invalid_depth(self):
+        for depth in ('0', 'x', '1000'):
+            request = self.get_holdings(self.person.cpf, f'?depth={depth}')
+            self.assertEquals(request.status_code,
+                              status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_owner(self):
+        request = self.get_holdings('99999999999')
+        self.assertEquals(request.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_ownership_cycle(self):
+        # first and second end up owning each other.
+        self.first.owner = self.second.owner_entry
+        self.first.save()
+
+        data = json.loads(self.get_holdings(self.first.cnpj).content)
+
+        self.assertEquals(
+            [(company['cnpj'], company['depth'])
+             for company in data['companies']],
+            [(self.second.cnpj, 1), (self.third.cnpj, 2)],
+        )
+        data = json.loads(self.get_holdings(self.person.cpf).content)
+        self.assertEquals(data['companies'], [])
+
+    def test_closure_cached_until_ownership_changes(self):
+        self.get_holdings(self.person.cpf)
+        with CaptureQueriesContext(connection) as cached:
+            self.get_holdings(self.person.cpf)
+        self.assertFalse(any('RECURSIVE' in query['sql']
+                             for query in cached.captured_queries))
+
+        fourth = self.company('10000000000004', self.third.cnpj)
+        generation = Generation.objects.get(name='ownership').value
+        data = json.loads(self.get_holdings(self.person.cpf).content)
+
+        self.assertEquals(data['companies'][-1]['cnpj'], fourth.cnpj)
+        fourth.delete()
+        self.assertGreater(Generation.objects.get(name='ownership').value,
+                           generation)
+
+
+class TestAPIRollups(TestCase):
+    """Tests the goods and companies counts kept per owner."""
+
+    def setUp(self):
+        owner_resolver.invalidate()
+        admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=admin)
+        self.person = PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        self.company = LegalPerson.objects.create(
+            **with_owner(LEGAL_PERSON_DATA),
+        )
+
+    def get_json(self, url):
+        request = self.client.get(url)
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        return json.loads(request.content)
+
+    def post_goods(self, owner, good_type, quantity):
+        return self.client.post(
+            '/v1/goods/',
+            json.dumps([
+                {'good_type': good_type, 'description': 'Good',
+                 'owner': owner}
+                for _ in range(quantity)
+            ]),
+            content_type='application/json',
+        )
+
+    def test_owner_summary(self):
+        self.post_goods(self.person.cpf, 'imovel', 2)
+        self.post_goods(self.person.cpf, 'automovel', 1)
+        self.post_goods(self.company.cnpj, 'imovel', 1)
+
+        self.assertEquals(
+            self.get_json(f'/v1/owners/{self.person.cpf}/summary/'),
+            {
+                'owner': self.person.cpf,
+                'goods': {'imovel': 2, 'automovel': 1, 'empresa': 0},
+                'goods_total': 3,
+                'companies': 1,
+            },
+        )
+        self.assertEquals(
+            self.get_json('/v1/goods/stats/'),
+            {
+                'goods': {'imovel': 3, 'automovel': 1, 'empresa': 0},
+                'goods_total': 4,
+                'companies': 1,
+            },
+        )
+
+    def test_unknown_owner_summary(self):
+        request = self.client.get('/v1/owners/99999999999/summary/')
+        self.assertEquals(request.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_updates_and_deletes_move_counts(self):
+        good = Good.objects.create(**with_owner(GOOD_DATA))
+        good.good_type = 'imovel'
+        good.owner = self.person.owner_entry
+        good.save()
+        self.company.owner = self.company.owner_entry
+        self.company.save()
+
+        person = self.get_json(f'/v1/owners/{self.person.cpf}/summary/')
+        company = self.get_json(f'/v1/owners/{self.company.cnpj}/summary/')
+        self.assertEquals(person['goods']['imovel'], 1)
+        self.assertEquals(person['companies'], 0)
+        self.assertEquals(company['goods_total'], 0)
+        self.assertEquals(company['companies'], 1)
+
+        good.delete()
+        stats = self.get_json('/v1/goods/stats/')
+        self.assertEquals(stats['goods_total'], 0)
+        self.assertEquals(stats['companies'], 1)
+
+    def test_reads_do_not_grow_with_goods(self):
+        self.post_goods(self.person.cpf, 'imovel', 1)
+        with CaptureQueriesContext(connection) as few:
+            self.get_json('/v1/goods/stats/')
+        self.post_goods(self.person.cpf, 'imovel', 50)
+        with CaptureQueriesContext(connection) as many:
+            self.get_json('/v1/goods/stats/')
+
+        self.assertEquals(len(few), 1)
+        self.assertEquals(len(many), 1)
+
+    def test_bulk_create_many_owners(self):
+        self.client.post(
+            '/v1/physical-people/',
+            json.dumps(physical_people_rows(20)),
+            content_type='application/json',
+        )
+        rows = [
+            {'good_type': 'imovel', 'description': 'Good',
+             'owner': person['cpf']}
+            for person in physical_people_rows(20)
+        ]
+        self.client.post('/v1/goods/', json.dumps(rows[:10]),
+                         content_type='application/json')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/v1/goods/', json.dumps(rows + rows),
+                             content_type='application/json')
+
+        self.assertLess(len(queries), 20)
+        first = self.get_json(f'/v1/owners/{rows[0]["owner"]}/summary/')
+        last = self.get_json(f'/v1/owners/{rows[-1]["owner"]}/summary/')
+        self.assertEquals(first['goods']['imovel'], 3)
+        self.assertEquals(last['goods']['imovel'], 2)
+        stats = self.get_json('/v1/goods/stats/')
+        self.assertEquals(stats['goods']['imovel'], 50)
+        stdout = StringIO()
+        call_command('rebuild_rollups', stdout=stdout)
+        self.assertIn('0 rows had drifted', stdout.getvalue())
+
+    def test_rebuild_rollups(self):
+        self.post_goods(self.person.cpf, 'imovel', 3)
+        # Queryset updates skip the signals and let the rollups drift.
+        Good.objects.update(good_type='automovel')
+
+        stdout = StringIO()
+        call_command('rebuild_rollups', stdout=stdout)
+
+        self.assertIn('4 rows had drifted', stdout.getvalue())
+        stats = self.get_json('/v1/goods/stats/')
+        self.assertEquals(stats['goods'],
+                          {'imovel': 0, 'automovel': 3, 'empresa': 0})
+        self.assertFalse(Rollup.objects.filter(key='imovel').exists())
+
+
+class TestAPISearch(TestCase):
+    """Tests the full-text ?q= search of the list endpoints."""
+
+    def setUp(self):
+        admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=admin)
+        PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        self.company = LegalPerson.objects.create(
+            **with_owner(LEGAL_PERSON_DATA),
+        )
+        for description in ('Casa na praia', 'Fusca azul 1966',
+                            'Casa de campo com piscina', 'Apartamento'):
+            Good.objects.create(**with_owner({
+                **GOOD_DATA,
+                'description': description,
+            }))
+
+    def search_results(self, url):
+        request = self.client.get(url)
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        return json.loads(request.content)['results']
+
+    def test_search_goods(self):
+        results = self.search_results('/v1/goods/?q=casa')
+        self.assertEquals(
+            sorted(good['description'] for good in results),
+            ['Casa de campo com piscina', 'Casa na praia'],
+        )
+        self.assertEquals(results[0]['owner'], self.company.cnpj)
+
+    def test_every_term_as_prefix(self):
+        results = self.search_results('/v1/goods/?q=cas+pisc')
+        self.assertEquals([good['description'] for good in results],
+                          ['Casa de campo com piscina'])
+
+    def test_ranking(self):
+        Good.objects.create(**with_owner({
+            **GOOD_DATA,
+            'description': 'Casa casa casa',
+        }))
+        results = self.search_results('/v1/goods/?q=casa&limit=1')
+        self.assertEquals([good['description'] for good in results],
+                          ['Casa casa casa'])
+
+    def test_search_people(self):
+        results = self.search_results('/v1/physical-people/?q=fulano')
+        self.assertEquals([person['cpf'] for person in results],
+                          [PHYSICAL_PERSON_DATA['cpf']])
+        results = self.search_results('/v1/legal-people/?q=fantasy')
+        self.assertEquals([company['cnpj'] for company in results],
+                          [self.company.cnpj])
+
+    def test_index_follows_changes(self):
+        good = Good.objects.get(description='Apartamento')
+        good.description = 'Cobertura'
+        good.save()
+        Good.objects.filter(description='Casa na praia').delete()
+
+        self.assertEquals(self.search_results('/v1/goods/?q=apartamento'), [])
+        self.assertEquals(len(self.search_results('/v1/goods/?q=cobertura')),
+                          1)
+        self.assertEquals(len(self.search_results('/v1/goods/?q=casa')), 1)
+
+    def test_empty_query(self):
+        self.assertEquals(self.search_results('/v1/goods/?q=%20!'), [])
+
+    def test_contains_fallback(self):
+        records = Good.objects.all()
+        self.assertEquals(
+            [good.description
+             for good in contains_search(records, ['casa', 'PRAIA'], 10)],
+            [good.description for good in search(records, 'casa praia', 10)],
+        )
+
+
+class TestAPIFilters(TestCase):
+    """Tests the filters of the list endpoints and the indexes behind them."""
+
+    def setUp(self):
+        owner_resolver.invalidate()
+        admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=admin)
+        self.person = PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        self.company = LegalPerson.objects.create(
+            **with_owner(LEGAL_PERSON_DATA),
+        )
+        self.car = Good.objects.create(**with_owner(GOOD_DATA))
+        self.house = Good.objects.create(**with_owner({
+            **GOOD_DATA,
+            'good_type': 'imovel',
+        }))
+        self.farm = Good.objects.create(**with_owner({
+            **GOOD_DATA,
+            'good_type': 'imovel',
+            'owner': self.person.cpf,
+        }))
+
+    def result_ids(self, url):
+        request = self.client.get(url)
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        return [record['id'] for record in json.loads(request.content)[
+            'results']]
+
+    def list_query_plan(self, url, table):
+        """EXPLAIN QUERY PLAN of the query listing the table for url."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        sql = next(
+            query['sql'] for query in queries.captured_queries
+            if f'FROM "{table}"' in query['sql']
+            and 'ORDER BY' in query['sql']
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def test_filter_goods(self):
+        cnpj = self.company.cnpj
+        self.assertEquals(self.result_ids(f'/v1/goods/?owner={cnpj}'),
+                          [self.car.id, self.house.id])
+        self.assertEquals(self.result_ids('/v1/goods/?good_type=imovel'),
+                          [self.house.id, self.farm.id])
+        self.assertEquals(
+            self.result_ids(f'/v1/goods/?owner={cnpj}&good_type=imovel'),
+            [self.house.id],
+        )
+        self.assertEquals(self.result_ids('/v1/goods/?owner=99999999999'),
+                          [])
+
+    def test_owner_filter_ignores_the_resolver_cache(self):
+        # A miss cached by a worker before the company was registered.
+        owner_resolver.cache.set(self.company.cnpj, 0)
+        self.addCleanup(owner_resolver.invalidate)
+
+        self.assertEquals(
+            self.result_ids(f'/v1/goods/?owner={self.company.cnpj}'),
+            [self.car.id, self.house.id],
+        )
+
+    def test_filter_people(self):
+        self.assertEquals(
+            self.result_ids(f'/v1/physical-people/?cpf={self.person.cpf}'),
+            [self.person.id],
+        )
+        self.assertEquals(
+            self.result_ids('/v1/physical-people/?zipcode=5563'),
+            [self.person.id],
+        )
+        self.assertEquals(
+            self.result_ids('/v1/physical-people/?zipcode=5564'),
+            [],
+        )
+        self.assertEquals(
+            self.result_ids(f'/v1/legal-people/?owner={self.person.cpf}'
+                            f'&zipcode=12345678'),
+            [self.company.id],
+        )
+        self.assertEquals(
+            self.result_ids(f'/v1/legal-people/?cnpj={self.company.cnpj}'),
+            [self.company.id],
+        )
+
+    def test_invalid_filters(self):
+        for url in ('/v1/goods/?good_type=barco',
+                    '/v1/goods/?owner=abc',
+                    '/v1/physical-people/?zipcode=88-0',
+                    '/v1/physical-people/?cpf=123',
+                    '/v1/legal-people/?cnpj=123'):
+            request = self.client.get(url)
+            self.assertEquals(request.status_code,
+                              status.HTTP_400_BAD_REQUEST)
+
+    def test_filters_with_search_and_stream(self):
+        self.assertEquals(
+            self.result_ids('/v1/goods/?good_type=imovel&q=fusca'),
+            [self.house.id, self.farm.id],
+        )
+        request = self.client.get('/v1/goods/?good_type=automovel&stream=1')
+        self.assertEquals(
+            [good['id'] for good in json.loads(
+                b''.join(request.streaming_content))],
+            [self.car.id],
+        )
+
+    def test_filters_with_search_beyond_limit(self):
+        # More matches for other owners than the page holds.
+        for _ in range(20):
+            Good.objects.create(**with_owner({
+                **GOOD_DATA,
+                'description': 'Fusca fusca azul',
+            }))
+
+        self.assertEquals(
+            self.result_ids(
+                f'/v1/goods/?q=fusca&owner={self.person.cpf}&limit=5',
+            ),
+            [self.farm.id],
+        )
+        self.assertEquals(
+            len(self.result_ids(
+                f'/v1/goods/?q=fusca&owner={self.company.cnpj}&limit=5',
+            )),
+            5,
+        )
+
+    def test_filters_use_indexes(self):
+        cnpj = self.company.cnpj
+        for url, table, index in (
+            (f'/v1/goods/?owner={cnpj}&good_type=imovel', 'api_good',
+             'good_owner_type_idx'),
+            ('/v1/goods/?good_type=imovel', 'api_good', 'good_type_idx'),
+            ('/v1/physical-people/?zipcode=8801', 'api_physicalperson',
+             'physical_zipcode_idx'),
+            ('/v1/legal-people/?zipcode=8801', 'api_legalperson',
+             'legal_zipcode_idx'),
+        ):
+            plan = self.list_query_plan(url, table)
+            self.assertIn(f'SEARCH {table} USING INDEX {index}', plan)
+
+        for url, table in (
+            (f'/v1/goods/?owner={cnpj}', 'api_good'),
+            (f'/v1/legal-people/?owner={cnpj}', 'api_legalperson'),
+            (f'/v1/legal-people/?cnpj={cnpj}', 'api_legalperson'),
+            (f'/v1/physical-people/?cpf={self.person.cpf}',
+             'api_physicalperson'),
+        ):
+            plan = self.list_query_plan(url, table)
+            self.assertIn(f'SEARCH {table} USING INDEX', plan)
+            self.assertNotIn(f'SCAN {table}', plan)
+
+
+class TestAPIKeyLookups(TestCase):
+    """Tests the lookups by natural key and the multi-get of records."""
+
+    def setUp(self):
+        owner_resolver.invalidate()
+        admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=admin)
+        self.people = [
+            PhysicalPerson.objects.create(**row)
+            for row in physical_people_rows(5)
+        ]
+        self.company = LegalPerson.objects.create(**with_owner({
+            **LEGAL_PERSON_DATA,
+            'owner': self.people[0].cpf,
+        }))
+
+    def get_json(self, url, expected_status=status.HTTP_200_OK):
+        request = self.client.get(url)
+        self.assertEquals(request.status_code, expected_status)
+        return json.loads(request.content)
+
+    def test_physical_person_by_cpf(self):
+        person = self.people[2]
+        data = self.get_json(f'/v1/physical-people/by-cpf/{person.cpf}/')
+        self.assertEquals(data['id'], person.id)
+
+        request = self.client.get('/v1/physical-people/by-cpf/99999999999/')
+        self.assertEquals(request.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_legal_person_by_cnpj(self):
+        data = self.get_json(
+            f'/v1/legal-people/by-cnpj/{self.company.cnpj}/',
+        )
+        self.assertEquals(data['id'], self.company.id)
+        self.assertEquals(data['owner'], self.people[0].cpf)
+
+        request = self.client.get('/v1/legal-people/by-cnpj/123/')
+        self.assertEquals(request.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_multi_get_by_ids(self):
+        ids = [self.people[3].id, self.people[1].id, 999999]
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get_json('/v1/physical-people/?ids=%s&limit=1'
+                                 % ','.join(map(str, ids)))
+
+        self.assertEquals([person['id'] for person in data['results']],
+                          [self.people[1].id, self.people[3].id])
+        self.assertIsNone(data['next'])
+        self.assertEquals(
+            len([query for query in queries.captured_queries
+                 if 'FROM "api_physicalperson"' in query['sql']]),
+            1,
+        )
+
+    def test_multi_get_by_natural_keys(self):
+        cpfs = ','.join(person.cpf for person in self.people)
+        data = self.get_json(f'/v1/physical-people/?cpf={cpfs}')
+        self.assertEquals(len(data['results']), 5)
+
+        data = self.get_json(
+            f'/v1/legal-people/?cnpj={self.company.cnpj},99999999999999',
+        )
+        self.assertEquals([company['id'] for company in data['results']],
+                          [self.company.id])
+
+    @override_settings(API_MULTI_GET_MAX_KEYS=3)
+    def test_multi_get_limits(self):
+        data = self.get_json('/v1/goods/?ids=1,2,3,4',
+                             status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(data, {'ids': ['At most 3 values.']})
+        data = self.get_json('/v1/goods/?ids=1,x',
+                             status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(data, {'ids': ['Invalid id.']})
+
+
+class TestAPIConditionalRequests(TestCase):
+    """Tests the ETag and Last-Modified headers and the conditional
+    requests they allow."""
+
+    def setUp(self):
+        owner_resolver.invalidate()
+        admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=admin)
+        self.person = PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        self.company = LegalPerson.objects.create(
+            **with_owner(LEGAL_PERSON_DATA),
+        )
+        self.good = Good.objects.create(**with_owner(GOOD_DATA))
+
+    def test_version_incremented_on_save(self):
+        self.assertEquals(self.good.version, 1)
+        self.good.save()
+        self.good.refresh_from_db()
+        self.assertEquals(self.good.version, 2)
+
+    def test_list_not_modified(self):
+        request = self.client.get('/v1/goods/')
+        etag = request['ETag']
+        self.assertIn('Last-Modified', request)
+
+        with CaptureQueriesContext(connection) as queries:
+            request = self.client.get('/v1/goods/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(request.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(any('FROM "api_good"' in query['sql']
+                             for query in queries.captured_queries))
+
+        request = self.client.get('/v1/goods/?limit=1',
+                                  HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+
+    def test_list_etag_follows_writes(self):
+        etag = self.client.get('/v1/goods/')['ETag']
+
+        PhysicalPerson.objects.create(**physical_people_rows(1)[0])
+        self.assertEquals(self.client.get('/v1/goods/')['ETag'], etag)
+
+        self.good.description = 'Fusca 67'
+        self.good.save()
+        changed = self.client.get('/v1/goods/')['ETag']
+        self.assertNotEquals(changed, etag)
+
+        # The goods are serialized with the cnpj of their owner.
+        self.company.cnpj = '99999999999999'
+        self.company.save()
+        self.assertNotEquals(self.client.get('/v1/goods/')['ETag'], changed)
+
+    def test_detail_not_modified(self):
+        url = f'/v1/goods/{self.good.id}/'
+        etag = self.client.get(url)['ETag']
+
+        request = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(request.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Good.objects.create(**with_owner(GOOD_DATA))
+        request = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(request.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_put_if_match(self):
+        url = f'/v1/goods/{self.good.id}/'
+        etag = self.client.get(url)['ETag']
+        data = json.dumps({**GOOD_DATA, 'description': 'Fusca 67'})
+
+        request = self.client.put(url, data, content_type='application/json',
+                                  HTTP_IF_MATCH=etag)
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        new_etag = request['ETag']
+        self.assertNotEquals(new_etag, etag)
+
+        request = self.client.put(url, data, content_type='application/json',
+                                  HTTP_IF_MATCH=etag)
+        self.assertEquals(request.status_code,
+                          status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEquals(self.client.get(url)['ETag'], new_etag)
+
+    def test_delete_if_match(self):
+        url = f'/v1/goods/{self.good.id}/'
+        request = self.client.delete(url, HTTP_IF_MATCH='"stale"')
+        self.assertEquals(request.status_code,
+                          status.HTTP_412_PRECONDITION_FAILED)
+        self.assertTrue(Good.objects.filter(pk=self.good.id).exists())
+
+        etag = self.client.get(url)['ETag']
+        request = self.client.delete(url, HTTP_IF_MATCH=etag)
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        self.assertFalse(Good.objects.filter(pk=self.good.id).exists())
+
+
+class TestAPIResponseCache(TestCase):
+    """Tests the cache of the GET responses."""
+
+    def setUp(self):
+        cache.clear()
+        owner_resolver.invalidate()
+        self.admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+        self.person = PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        self.company = LegalPerson.objects.create(
+            **with_owner(LEGAL_PERSON_DATA),
+        )
+        self.good = Good.objects.create(**with_owner(GOOD_DATA))
+
+    def test_hit_skips_the_view(self):
+        first = self.client.get('/v1/goods/')
+        self.assertEquals(first['X-Cache'], 'MISS')
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get('/v1/goods/')
+        self.assertEquals(second['X-Cache'], 'HIT')
+        self.assertEquals(second.content, first.content)
+        self.assertEquals(second['ETag'], first['ETag'])
+        self.assertEquals(second['Content-Type'], 'application/json')
+        self.assertFalse(any('FROM "api_good"' in query['sql']
+                             for query in queries.captured_queries))
+
+    def test_writes_invalidate_their_tables_only(self):
+        url = f'/v1/goods/{self.good.id}/'
+        self.client.get('/v1/goods/')
+        self.client.get(url)
+
+        PhysicalPerson.objects.create(**physical_people_rows(1)[0])
+        self.assertEquals(self.client.get('/v1/goods/')['X-Cache'], 'HIT')
+        self.assertEquals(self.client.get(url)['X-Cache'], 'HIT')
+
+        self.client.put(url, json.dumps({**GOOD_DATA, 'description': 'New'}),
+                        content_type='application/json')
+        request = self.client.get(url)
+        self.assertEquals(request['X-Cache'], 'MISS')
+        self.assertEquals(json.loads(request.content)['description'], 'New')
+        self.assertEquals(self.client.get('/v1/goods/')['X-Cache'], 'MISS')
+
+    def test_keyed_by_query_and_user(self):
+        self.client.get('/v1/goods/')
+        self.assertEquals(self.client.get('/v1/goods/?limit=5')['X-Cache'],
+                          'MISS')
+
+        other = get_user_model().objects.create(username='other')
+        self.client.force_authenticate(user=other)
+        self.assertEquals(self.client.get('/v1/goods/')['X-Cache'], 'MISS')
+
+    def test_streams_not_cached(self):
+        self.client.get('/v1/goods/?stream=1')
+        request = self.client.get('/v1/goods/?stream=1')
+        self.assertEquals(request['X-Cache'], 'MISS')
+        self.assertTrue(request.streaming)
+
+    @override_settings(API_RESPONSE_CACHE_TTL=0)
+    def test_disabled(self):
+        self.client.get('/v1/goods/')
+        self.assertNotIn('X-Cache', self.client.get('/v1/goods/'))
+
+    def test_stats(self):
+        before = json.loads(self.client.get('/v1/cache/stats/').content)
+        self.client.get('/v1/goods/')
+        self.client.get('/v1/goods/')
+        after = json.loads(self.client.get('/v1/cache/stats/').content)
+
+        self.assertEquals(after['hits'] - before['hits'], 1)
+        self.assertEquals(after['misses'] - before['misses'], 1)
+
+
+class TestAPIFragmentCache(TestCase):
+    """Tests the list pages joined from the rows kept encoded."""
+
+    def setUp(self):
+        fragment_cache.clear()
+        owner_resolver.invalidate()
+        admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=admin)
+        self.person = PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        self.company = LegalPerson.objects.create(
+            **with_owner(LEGAL_PERSON_DATA),
+        )
+        baker.make(
+            Good,
+            owner=Owner.objects.get(document=LEGAL_PERSON_DATA['cnpj']),
+            _quantity=5,
+        )
+
+    def assertSerializedPage(self, url, queryset, serializer_class):
+        request = self.client.get(url)
+        data = json.loads(request.content)
+        ids = [record['id'] for record in data['results']]
+        records = queryset.filter(id__in=ids)
+        expected = JsonResponse({
+            'next': data['next'],
+            'previous': data['previous'],
+            'results': serializer_class(records.order_by('id'),
+                                        many=True).data,
+        })
+        self.assertEquals(request.content, expected.content)
+        self.assertEquals(request['Content-Type'], expected['Content-Type'])
+
+    @override_settings(API_RESPONSE_CACHE_TTL=0)
+    def test_same_bytes_as_the_serializer(self):
+        Good.objects.create(**with_owner({**GOOD_DATA,
+                                          'description': 'Fusca "66" é'}))
+        for _ in range(2):
+            self.assertSerializedPage('/v1/goods/?limit=3',
+                                      Good.objects.all(), GoodSerializer)
+            self.assertSerializedPage('/v1/legal-people/',
+                                      LegalPerson.objects.all(),
+                                      LegalPersonSerializer)
+            self.assertSerializedPage('/v1/physical-people/',
+                                      PhysicalPerson.objects.all(),
+                                      PhysicalPersonSerializer)
+
+    @override_settings(API_RESPONSE_CACHE_TTL=0)
+    def test_cached_rows_are_not_loaded(self):
+        self.client.get('/v1/goods/')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/v1/goods/')
+        goods = [query['sql'] for query in queries.captured_queries
+                 if 'FROM "api_good"' in query['sql']]
+        self.assertEquals(len(goods), 1)
+        self.assertNotIn('"description"', goods[0])
+
+    def test_row_written_after_the_page_is_kept(self):
+        goods = Good.objects.order_by('id')
+        states = list(goods.values(*state_fields(Good))[:3])
+        good = goods.first()
+        good.description = 'New'
+        good.save()
+
+        rows = encoded_rows(states, goods, GoodSerializer)
+
+        self.assertEquals(
+            [json.loads(row)['id'] for row in rows],
+            [state['id'] for state in states],
+        )
+        self.assertEquals(json.loads(rows[0])['description'], 'New')
+
+    @override_settings(API_RESPONSE_CACHE_TTL=0)
+    def test_changed_rows_are_encoded_again(self):
+        good = Good.objects.first()
+        self.client.get('/v1/goods/')
+
+        good.description = 'New'
+        good.save()
+        results = json.loads(self.client.get('/v1/goods/').content)['results']
+
+        self.assertEquals(results[0]['description'], 'New')
+        self.assertEquals(
+            [record['owner'] for record in results],
+            [LEGAL_PERSON_DATA['cnpj']] * 5,
+        )
+        self.company.cnpj = '99999999999999'
+        self.company.save()
+        results = json.loads(self.client.get('/v1/goods/').content)['results']
+        self.assertEquals(
+            [record['owner'] for record in results],
+            ['99999999999999'] * 5,
+        )
+
+    def test_evicts_least_recently_used_by_size(self):
+        fragments = FragmentCache(10)
+        fragments.set('a', '1234')
+        fragments.set('b', '1234')
+        fragments.get_many(['a'])
+        fragments.set('c', '1234')
+        fragments.set('d', '12345678901')
+
+        self.assertEquals(fragments.get_many(['a', 'b', 'c', 'd']),
+                          {'a': '1234', 'c': '1234'})
+        self.assertEquals(fragments.size, 8)
+
+
+class TestReadSerializer(TestCase):
+    """Tests the read only serializer against the model serializers."""
+
+    def setUp(self):
+        PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        person = PhysicalPerson.objects.create(**{
+            **physical_people_rows(1)[0],
+            'name': 'José "Zé" D\\Ávila ☃',
+        })
+        LegalPerson.objects.create(**with_owner(LEGAL_PERSON_DATA))
+        LegalPerson.objects.create(**{
+            **LEGAL_PERSON_DATA,
+            'cnpj': '98765432100011',
+            'fantasy_name': '',
+            'owner': Owner.objects.get(document=person.cpf),
+        })
+        for good_type, _ in Good.GOODS_TYPE:
+            Good.objects.create(**with_owner({
+                **GOOD_DATA,
+                'good_type': good_type,
+                'description': 'Linha 1\nLinha 2\t<fim>',
+            }))
+
+    def assertSameRepresentation(self, queryset, serializer_class):
+        serializer = ReadSerializer(serializer_class)
+        rows = [serializer.to_representation(row)
+                for row in serializer.rows(queryset.order_by('id'))]
+        expected = serializer_class(queryset.order_by('id'), many=True).data
+
+        self.assertEquals(len(rows), queryset.count())
+        self.assertEquals(json.dumps(rows), json.dumps(expected))
+
+    def test_physical_people(self):
+        self.assertSameRepresentation(PhysicalPerson.objects.all(),
+                                      PhysicalPersonSerializer)
+
+    def test_legal_people(self):
+        self.assertSameRepresentation(LegalPerson.objects.all(),
+                                      LegalPersonSerializer)
+
+    def test_goods(self):
+        self.assertSameRepresentation(Good.objects.all(), GoodSerializer)
+
+    def test_extra_columns_are_left_out(self):
+        serializer = ReadSerializer(GoodSerializer)
+        row = serializer.rows(Good.objects.all(), 'version').first()
+
+        self.assertEquals(row[-1], 1)
+        self.assertEquals(list(serializer.to_representation(row)),
+                          GoodSerializer.Meta.fields)
+
+    def test_owner_read_with_a_join(self):
+        serializer = ReadSerializer(GoodSerializer)
+        with CaptureQueriesContext(connection) as queries:
+            list(serializer.rows(Good.objects.all()))
+        self.assertEquals(len(queries.captured_queries), 1)
+
+
+@override_settings(API_RESPONSE_CACHE_TTL=0)
+class TestAPISparseFields(TestCase):
+    """Tests the ?fields= selection of the GET endpoints."""
+
+    def setUp(self):
+        fragment_cache.clear()
+        owner_resolver.invalidate()
+        admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=admin)
+        self.person = PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        self.company = LegalPerson.objects.create(
+            **with_owner(LEGAL_PERSON_DATA),
+        )
+        self.good = Good.objects.create(**with_owner(GOOD_DATA))
+
+    def get_results(self, url):
+        request = self.client.get(url)
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        if request.streaming:
+            return json.loads(b''.join(request.streaming_content))
+        return json.loads(request.content)['results']
+
+    def test_list_reads_the_fields_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.get_results('/v1/goods/?fields=owner,id')
+
+        self.assertEquals(results, [{
+            'id': self.good.id,
+            'owner': LEGAL_PERSON_DATA['cnpj'],
+        }])
+        self.assertFalse(any('"description"' in query['sql']
+                             for query in queries.captured_queries))
+
+    def test_every_kind_of_list(self):
+        url = '/v1/physical-people/?fields=id,name'
+        expected = [{'id': self.person.id, 'name': self.person.name}]
+        for query in ('', '&stream=1', '&ids=%d' % self.person.id, '&q=sem'):
+            self.assertEquals(self.get_results(url + query), expected)
+
+    def test_search_defers_the_other_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.get_results('/v1/goods/?q=fusca&fields=id')
+
+        self.assertEquals(results, [{'id': self.good.id}])
+        self.assertFalse(any(
+            'description' in query['sql'].split(' FROM ')[0]
+            for query in queries.captured_queries
+        ))
+
+    def test_fragments_kept_per_selection(self):
+        url = '/v1/legal-people/'
+        self.assertEquals(len(self.get_results(url)[0]), 9)
+        self.assertEquals(self.get_results(url + '?fields=cnpj'),
+                          [{'cnpj': LEGAL_PERSON_DATA['cnpj']}])
+        self.assertEquals(len(self.get_results(url)[0]), 9)
+
+    def test_detail(self):
+        for url in (f'/v1/physical-people/{self.person.id}/?fields=cpf',
+                    '/v1/physical-people/by-cpf/%s/?fields=cpf'
+                    % self.person.cpf):
+            request = self.client.get(url)
+            self.assertEquals(json.loads(request.content),
+                              {'cpf': self.person.cpf})
+
+        request = self.client.get(
+            f'/v1/goods/{self.good.id}/?fields=description,owner',
+        )
+        self.assertEquals(json.loads(request.content), {
+            'description': GOOD_DATA['description'],
+            'owner': LEGAL_PERSON_DATA['cnpj'],
+        })
+
+    def test_detail_etag_depends_on_the_fields(self):
+        url = f'/v1/goods/{self.good.id}/'
+        etag = self.client.get(url)['ETag']
+        request = self.client.get(url + '?fields=id', HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        self.assertEquals(json.loads(request.content), {'id': self.good.id})
+
+    def test_unknown_fields(self):
+        for url in ('/v1/goods/?fields=id,cpf',
+                    f'/v1/goods/{self.good.id}/?fields=',
+                    '/v1/legal-people/by-cnpj/%s/?fields=name'
+                    % self.company.cnpj):
+            request = self.client.get(url)
+            self.assertEquals(request.status_code,
+                              status.HTTP_400_BAD_REQUEST)
+            self.assertIn('fields', json.loads(request.content))
+
+
+class TestAPIChanges(TestCase):
+    """Tests the change log and its /v1/changes/ endpoint."""
+
+    def setUp(self):
+        owner_resolver.invalidate()
+        admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=admin)
+
+    def get_changes(self, since=0, limit=100):
+        request = self.client.get(f'/v1/changes/?since={since}&limit={limit}')
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        return json.loads(request.content)
+
+    def test_writes_are_logged_in_order(self):
+        self.client.post('/v1/physical-people/', PHYSICAL_PERSON_DATA,
+                         format='json')
+        person = PhysicalPerson.objects.get()
+        url = f'/v1/physical-people/{person.id}/'
+        self.client.put(url, {**PHYSICAL_PERSON_DATA, 'name': 'Novo Nome'},
+                        format='json')
+        self.client.delete(url)
+
+        data = self.get_changes()
+        self.assertEquals(
+            [(change['resource'], change['id'], change['action'])
+             for change in data['results']],
+            [('physical-people', person.id, action)
+             for action in ('create', 'update', 'delete')],
+        )
+        self.assertEquals(data['last_seq'], data['results'][-1]['seq'])
+        self.assertFalse(data['more'])
+        self.assertTrue(all(change['record'] is None
+                            for change in data['results']))
+
+    def test_records_and_paging(self):
+        PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        LegalPerson.objects.create(**with_owner(LEGAL_PERSON_DATA))
+        good = Good.objects.create(**with_owner(GOOD_DATA))
+
+        first = self.get_changes(limit=2)
+        self.assertTrue(first['more'])
+        self.assertEquals(len(first['results']), 2)
+        rest = self.get_changes(since=first['last_seq'], limit=2)
+        self.assertFalse(rest['more'])
+        self.assertEquals(rest['results'][0]['record'],
+                          GoodSerializer(good).data)
+        self.assertEquals(
+            self.get_changes(since=rest['last_seq'])['results'],
+            [],
+        )
+
+    def test_bulk_created_records_are_logged(self):
+        self.client.post('/v1/physical-people/', physical_people_rows(3),
+                         format='json')
+        self.assertEquals(
+            [change['action'] for change in self.get_changes()['results']],
+            ['create'] * 3,
+        )
+
+    def test_owner_change_logs_what_it_owns(self):
+        person = PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        good = Good.objects.create(**with_owner({
+            **GOOD_DATA,
+            'owner': PHYSICAL_PERSON_DATA['cpf'],
+        }))
+        since = self.get_changes()['last_seq']
+
+        person.cpf = '11122233344'
+        person.save()
+        results = self.get_changes(since=since)['results']
+        self.assertIn(('goods', good.id, 'update'), [
+            (change['resource'], change['id'], change['action'])
+            for change in results
+        ])
+        self.assertEquals(results[0]['record']['owner'], '11122233344')
+
+    def test_failed_log_rolls_back_the_write(self):
+        def fail(*args, **kwargs):
+            raise RuntimeError('log unavailable')
+
+        log = changes.log
+        changes.log = fail
+        try:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        finally:
+            changes.log = log
+        self.assertFalse(PhysicalPerson.objects.exists())
+
+    def test_compaction(self):
+        person = PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        person.name = 'Novo Nome'
+        person.save()
+        deleted = PhysicalPerson.objects.create(**physical_people_rows(1)[0])
+        deleted_id = deleted.id
+        deleted.delete()
+        since = Change.objects.order_by('seq').first().seq
+
+        out = StringIO()
+        call_command('compact_changes', stdout=out)
+        self.assertIn('2 entries dropped', out.getvalue())
+        self.assertEquals(
+            [(change['id'], change['action'])
+             for change in self.get_changes()['results']],
+            [(person.id, 'update'), (deleted_id, 'delete')],
+        )
+
+        call_command('compact_changes', retention_days=0, stdout=out)
+        self.assertEquals(len(self.get_changes()['results']), 1)
+        request = self.client.get(f'/v1/changes/?since={since}')
+        self.assertEquals(request.status_code, status.HTTP_410_GONE)
+
+    def test_invalid_since(self):
+        request = self.client.get('/v1/changes/?since=-1')
+        self.assertEquals(request.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestConcurrentWrites(TransactionTestCase):
+    """Tests that concurrent writes wait for the SQLite lock."""
+
+    def setUp(self):
+        # New connections, made by the threads, open a database file: the
+        # in-memory test database has table locks that never wait.
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        name = connection.settings_dict['NAME']
+        connection.settings_dict['NAME'] = os.path.join(
+            directory.name,
+            'db.sqlite3',
+        )
+        self.addCleanup(connection.settings_dict.__setitem__, 'NAME', name)
+        self.addCleanup(owner_resolver.invalidate)
+        self.addCleanup(fragment_cache.clear)
+        self.addCleanup(cache.clear)
+
+    def in_thread(self, target, *args):
+        errors = []
+
+        def run():
+            try:
+                target(*args)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread, errors
+
+    def migrate(self):
+        call_command('migrate', verbosity=0)
+        person = PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        LegalPerson.objects.create(**with_owner(LEGAL_PERSON_DATA))
+        self.owners = [
+            Owner.objects.get(document=person.cpf),
+            Owner.objects.get(document=LEGAL_PERSON_DATA['cnpj']),
+        ]
+
+    def write(self):
+        for _ in range(20):
+            good = Good.objects.create(
+                good_type='automovel',
+                description='Fusca 66',
+                owner=self.owners[0],
+            )
+            good.owner = self.owners[1]
+            good.save()
+            good.delete()
+
+    def test_writes_wait_for_the_lock(self):
+        thread, errors = self.in_thread(self.migrate)
+        thread.join()
+        self.assertEquals(errors, [])
+
+        writers = [self.in_thread(self.write) for _ in range(4)]
+        for thread, errors in writers:
+            thread.join()
+        self.assertEquals(
+            [error for thread, errors in writers for error in errors],
+            [],
+        )
+
+
+class TestSeedDataset(TestCase):
+    """Tests the synthetic dataset of manage.py seed_dataset."""
+
+    def seed(self, **options):
+        out = StringIO()
+        call_command('seed_dataset', stdout=out, **options)
+        return out.getvalue()
+
+    def test_documents(self):
+        self.assertEquals(cpf(529982247), '52998224725')
+        self.assertEquals(cnpj(11222333), '11222333000181')
+
+    def test_seed(self):
+        out = self.seed(people=30, companies=20, goods=100, levels=3)
+
+        self.assertIn('Done: 30 people, 20 companies, 100 goods', out)
+        self.assertEquals(PhysicalPerson.objects.count(), 30)
+        self.assertEquals(Good.objects.count(), 100)
+        self.assertEquals(Owner.objects.count(), 50)
+        self.assertEquals(Change.objects.count(), 150)
+        self.assertTrue(LegalPerson.objects.filter(
+            owner__legal_person__isnull=False,
+        ).exists())
+        for serializer_class, model in [
+            (PhysicalPersonSerializer, PhysicalPerson),
+            (LegalPersonSerializer, LegalPerson),
+            (GoodSerializer, Good),
+        ]:
+            record = model.objects.first()
+            data = serializer_class(record).data
+            serializer = serializer_class(record, data=data)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        good = Good.objects.first()
+        word = good.description.split()[0]
+        self.assertIn(good, search(Good.objects.all(), word, 100))
+
+        stdout = StringIO()
+        call_command('rebuild_rollups', stdout=stdout)
+        self.assertIn('0 rows had drifted', stdout.getvalue())
+
+    def test_seed_again(self):
+        self.seed(people=10, companies=5, goods=10, seed=1)
+        self.seed(people=10, companies=5, goods=10, seed=1)
+
+        self.assertEquals(PhysicalPerson.objects.count(), 20)
+        self.assertEquals(LegalPerson.objects.count(), 10)
+        self.assertEquals(Change.objects.count(), 50)
+
+    def test_seed_after_delete(self):
+        self.seed(people=3, companies=2, goods=0, levels=1, seed=1)
+        # Below the last number, so the next one is still taken.
+        LegalPerson.objects.get(cnpj=cnpj(1)).delete()
+        PhysicalPerson.objects.filter(owner_entry__companies=None).exclude(
+            cpf=cpf(3),
+        ).first().delete()
+        self.seed(people=3, companies=2, goods=0, levels=1, seed=1)
+
+        self.assertEquals(PhysicalPerson.objects.count(), 5)
+        self.assertEquals(LegalPerson.objects.count(), 3)
+
+    def test_invalid_options(self):
+        with self.assertRaises(CommandError):
+            self.seed(people=0, goods=10)
+
+
+@override_settings(API_SERVER_TIMING=True, API_RESPONSE_CACHE_TTL=0)
+class TestServerTiming(TestCase):
+    """Tests the Server-Timing header and log line of api.timing."""
+
+    def setUp(self):
+        admin = get_user_model().objects.create(username='admin')
+        admin.set_password('asdf!@#$')
+        admin.save()
+        self.client = APIClient()
+        credentials = base64.b64encode(b'admin:asdf!@#$').decode()
+        self.client.credentials(HTTP_AUTHORIZATION='Basic ' + credentials)
+        PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+
+    def phases(self, response):
+        return {
+            entry.split(';')[0]: entry
+            for entry in response['Server-Timing'].split(', ')
+        }
+
+    def test_list(self):
+        with self.assertLogs('api.timing', 'INFO') as logs:
+            request = self.client.get('/v1/physical-people/')
+
+        phases = self.phases(request)
+        self.assertEquals(
+            list(phases),
+            ['auth', 'serialize', 'db', 'total'],
+        )
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEquals(line['path'], '/v1/physical-people/')
+        self.assertEquals(line['status'], 200)
+        self.assertGreater(line['queries'], 0)
+        self.assertIn(f'desc="{line["queries"]} queries"', phases['db'])
+        self.assertLessEqual(
+            line['auth_ms'] + line['serialize_ms'] + line['db_ms'],
+            line['total_ms'],
+        )
+
+    def test_create(self):
+        with self.assertLogs('api.timing', 'INFO'):
+            request = self.client.post(
+                '/v1/legal-people/',
+                json.dumps(
+                    dict(LEGAL_PERSON_DATA, state_registration='123456789'),
+                ),
+                content_type='application/json',
+            )
+
+        self.assertEquals(request.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(
+            set(self.phases(request)),
+            {'auth', 'serialize', 'render', 'db', 'total'},
+        )
+
+    @override_settings(API_SERVER_TIMING=False)
+    def test_disabled(self):
+        request = self.client.get('/v1/physical-people/')
+
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Server-Timing', request)
+
+
+class TestMetrics(TestCase):
+    """Tests the Prometheus metrics served at /metrics."""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create(username='admin')
+        self.client = APIClient()
+
+    def sample(self, name):
+        """Value of the sample of /metrics starting with name, 0 if none.
+        """
+        for line in self.client.get('/metrics').content.decode().splitlines():
+            if line.startswith(name + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0
+
+    def test_requests(self):
+        requests = (
+            'api_requests_total'
+            '{route="/v1/goods/<int:id>/",method="GET",status="404"}'
+        )
+        latency = (
+            'api_request_duration_seconds_count'
+            '{route="/v1/goods/<int:id>/",method="GET",status="404"}'
+        )
+        queries = (
+            'api_db_queries_per_request_count'
+            '{route="/v1/goods/<int:id>/"}'
+        )
+        before = [self.sample(requests), self.sample(latency),
+                  self.sample(queries)]
+
+        self.client.force_authenticate(user=self.admin)
+        self.client.get('/v1/goods/1/')
+        self.client.get('/v1/goods/2/')
+
+        self.assertEquals(
+            [self.sample(requests), self.sample(latency),
+             self.sample(queries)],
+            [count + 2 for count in before],
+        )
+
+    def test_auth_failures(self):
+        failures = 'api_auth_failures_total{reason="not_authenticated"}'
+        before = self.sample(failures)
+
+        request = self.client.get('/v1/goods/')
+
+        self.assertEquals(request.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEquals(self.sample(failures), before + 1)
+
+    def test_records(self):
+        PhysicalPerson.objects.create(**PHYSICAL_PERSON_DATA)
+        LegalPerson.objects.create(**dict(
+            LEGAL_PERSON_DATA,
+            owner=Owner.objects.get(document=PHYSICAL_PERSON_DATA['cpf']),
+        ))
+
+        self.assertEquals(self.sample('api_records{model="PhysicalPerson"}'),
+                          1)
+        self.assertEquals(self.sample('api_records{model="LegalPerson"}'), 1)
+        self.assertEquals(self.sample('api_records{model="Good"}'), 0)
+
+    @override_settings(API_METRICS_TOKEN='scrape-token')
+    def test_token(self):
+        request = self.client.get('/metrics')
+        self.assertEquals(request.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        request = self.client.get(
+            '/metrics',
+            HTTP_AUTHORIZATION='Bearer scrape-token',
+        )
+        self.assertEquals(request.status_code, status.HTTP_200_OK)
+
+    def test_processes_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            first = ValueStore(os.path.join(directory, 'values_1.db'))
+            second = ValueStore(os.path.join(directory, 'values_2.db'))
+            first.add([('a', 1), ('b', 2.5)])
+            second.add([('a', 2)])
+            # Enough keys to grow the file beyond its initial size.
+            second.add([(f'key {n:05d}', n) for n in range(5000)])
+
+            with override_settings(API_METRICS_DIR=directory):
+                values = totals()
+            self.assertEquals(values['a'], 3)
+            self.assertEquals(values['b'], 2.5)
+            self.assertEquals(values['key 04999'], 4999)
+
+            # A process reusing the pid of an exited one adds to its values.
+            reopened = ValueStore(os.path.join(directory, 'values_2.db'))
+            reopened.add([('a', 1)])
+            with override_settings(API_METRICS_DIR=directory):
+                self.assertEquals(totals()['a'], 4)
+
+    def test_read_waits_for_a_growing_map(self):
+        values = ValueStore()
+        values.add([('a', 1)])
+        read = []
+        with values.lock:
+            thread = threading.Thread(target=lambda: read.append(
+                values.read(),
+            ))
+            thread.start()
+            thread.join(0.1)
+            self.assertTrue(thread.is_alive())
+            # The map read by the scrape is closed and replaced.
+            values._grow(len(values.map) * 2)
+        thread.join()
+        self.assertEquals(read, [bytes(values.map[:values.used])])
+
+
+@override_settings(API_QUERY_BUDGET_STRICT=True, API_RESPONSE_CACHE_TTL=0)
+class TestQueryBudgets(TestCase):
+    """Tests the query budgets of the views and the N+1 detection."""
+
+    def setUp(self):
+        admin = get_user_model().objects.create(username='admin')
+        admin.set_password('asdf!@#$')
+        admin.save()
+        self.client = APIClient()
+        credentials = base64.b64encode(b'admin:asdf!@#$').decode()
+        self.client.credentials(HTTP_AUTHORIZATION='Basic ' + credentials)
+
+    def requests(self, size):
+        """(method, url, data) of a request to every endpoint, the writes
+        creating, changing and deleting records of their own.
+        """
+        person = PhysicalPerson.objects.order_by('id').first()
+        company = LegalPerson.objects.order_by('id').first()
+        good = Good.objects.order_by('id').first()
+        ids = ','.join(map(str, Good.objects.values_list('id', flat=True)))
+        new_person = dict(PHYSICAL_PERSON_DATA, cpf=cpf(900000000 + size))
+        new_company = dict(
+            LEGAL_PERSON_DATA,
+            cnpj=cnpj(90000000 + size),
+            state_registration='123456789',
+            owner=new_person['cpf'],
+        )
+        new_good = dict(GOOD_DATA, owner=new_company['cnpj'])
+        return [
+            ('get', '/v1/physical-people/', None),
+            ('get', '/v1/physical-people/?q=silva', None),
+            ('get', f'/v1/physical-people/{person.id}/', None),
+            ('get', f'/v1/physical-people/by-cpf/{person.cpf}/', None),
+            ('get', '/v1/legal-people/', None),
+            ('get', f'/v1/legal-people/?owner={person.cpf}', None),
+            ('get', f'/v1/legal-people/{company.id}/', None),
+            ('get', f'/v1/legal-people/by-cnpj/{company.cnpj}/', None),
+            ('get', '/v1/goods/', None),
+            ('get', '/v1/goods/?fields=id,owner', None),
+            ('get', f'/v1/goods/?ids={ids}', None),
+            ('get', '/v1/goods/?q=casa', None),
+            ('get', f'/v1/goods/{good.id}/', None),
+            ('get', '/v1/goods/stats/', None),
+            ('get', f'/v1/owners/{person.cpf}/holdings/', None),
+            ('get', f'/v1/owners/{company.cnpj}/holdings/', None),
+            ('get', f'/v1/owners/{person.cpf}/summary/', None),
+            ('get', '/v1/changes/?since=0', None),
+            ('get', '/v1/cache/stats/', None),
+            ('get', '/metrics', None),
+            ('post', '/v1/token/', None),
+            ('post', '/v1/physical-people/', new_person),
+            ('post', '/v1/legal-people/', new_company),
+            ('post', '/v1/goods/', new_good),
+            ('post', '/v1/goods/', [new_good] * size),
+            ('put', f'/v1/goods/{good.id}/', new_good),
+            ('put', f'/v1/physical-people/{person.id}/', dict(
+                PHYSICAL_PERSON_DATA,
+                cpf=person.cpf,
+            )),
+            ('delete', f'/v1/goods/{good.id}/', None),
+        ]
+
+    def test_dataset_sizes(self):
+        for size in [1, 10, 50]:
+            call_command(
+                'seed_dataset',
+                people=size,
+                companies=size,
+                goods=size * 5,
+                stdout=StringIO(),
+            )
+            for method, url, data in self.requests(size):
+                with self.subTest(size=size, method=method, url=url):
+                    request = getattr(self.client, method)(
+                        url,
+                        data,
+                        format='json',
+                    )
+                    self.assertLess(request.status_code, 300)
+
+    def test_budget_exceeded(self):
+        @query_budget(GET=1)
+        def view(request):
+            PhysicalPerson.objects.count()
+            PhysicalPerson.objects.exists()
+
+        request = APIRequestFactory().get('/')
+        with self.assertRaises(QueryBudgetExceeded) as context:
+            view(request)
+        self.assertIn(
+            '2 queries, over its budget of 1',
+            str(context.exception),
+        )
+
+        # The method without a budget is only checked for repeated queries.
+        view(APIRequestFactory().post('/'))
+
+    def test_repeated_queries(self):
+        people = baker.make(PhysicalPerson, _quantity=6)
+
+        @query_budget(GET=10)
+        def view(request):
+            for person in people:
+                PhysicalPerson.objects.get(id=person.id)
+
+        with self.assertRaises(QueryBudgetExceeded) as context:
+            view(APIRequestFactory().get('/'))
+        self.assertIn('6 runs of the same query', str(context.exception))
+
+    def test_unbudgeted(self):
+        @query_budget(GET=1)
+        def view(request):
+            PhysicalPerson.objects.count()
+            with unbudgeted():
+                for _ in range(10):
+                    PhysicalPerson.objects.count()
+
+        view(APIRequestFactory().get('/'))
+
+    def test_transaction_control(self):
+        @query_budget(POST=1)
+        def view(request):
+            with transaction.atomic():
+                with transaction.atomic():
+                    PhysicalPerson.objects.count()
+
+        # The SAVEPOINT and RELEASE SAVEPOINT of the blocks are not counted.
+        view(APIRequestFactory().post('/'))
+
+    @override_settings(API_QUERY_BUDGET_STRICT=False)
+    def test_warning(self):
+        @query_budget(GET=0)
+        def view(request):
+            return PhysicalPerson.objects.count()
+
+        with self.assertLogs('api.query_budget', 'WARNING') as logs:
+            self.assertEquals(view(APIRequestFactory().get('/goods/')), 0)
+        self.assertIn('GET /goods/: 1 queries', logs.output[0])
+
+    def test_sql_shape(self):
+        self.assertEquals(
+            sql_shape('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            sql_shape('SELECT * FROM t WHERE id IN (%s, %s)'),
+        )
+        self.assertEquals(
+            sql_shape('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)'),
+            sql_shape('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), '
+                      '(%s, %s)'),
+        )
+        self.assertNotEquals(
+            sql_shape('SELECT * FROM t WHERE id = %s'),
+            sql_shape('SELECT * FROM u WHERE id = %s'),
+        )
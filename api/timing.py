@@ -0,0 +1,132 @@
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django import http
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('api.timing', default=None)
+_untimed = nullcontext()
+
+
+class RequestTiming:
+    """Time spent by one request in each phase, and in its SQL queries.
+
+    The time of a phase excludes the queries run within it, which are
+    counted in ``db`` instead, so the phases add up to at most the total.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.queries = 0
+        self.db = 0.0
+
+    @contextmanager
+    def phase(self, name):
+        db = self.db
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start - (self.db - db)
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+
+def phase(name):
+    """Count the time of the block in the named phase of the request.
+
+    A shared no-op when the request is not timed, so the call sites cost
+    next to nothing with the middleware disabled. Phases do not nest.
+    """
+    timing = _current.get()
+    if timing is None:
+        return _untimed
+    return timing.phase(name)
+
+
+def timed_authentication(authentication_class):
+    """Subclass of the authentication class timed in the auth phase.
+    """
+    class TimedAuthentication(authentication_class):
+        def authenticate(self, request):
+            with phase('auth'):
+                return super().authenticate(request)
+
+    TimedAuthentication.__name__ = authentication_class.__name__
+    TimedAuthentication.__qualname__ = authentication_class.__qualname__
+    return TimedAuthentication
+
+
+class JsonResponse(http.JsonResponse):
+    """JsonResponse timing the encoding of its data in the render phase.
+    """
+
+    def __init__(self, *args, **kwargs):
+        with phase('render'):
+            super().__init__(*args, **kwargs)
+
+
+class ServerTimingMiddleware:
+    """Report where the time of each request went.
+
+    The auth, serialize and render phases, the SQL time and query count and
+    the total are sent in a Server-Timing header (in milliseconds) and
+    logged as a JSON line by the ``api.timing`` logger. The body of
+    streamed responses is produced after the middleware returns, so it is
+    left out.
+
+    Enabled by API_SERVER_TIMING, otherwise Django drops the middleware
+    when loading it.
+    """
+
+    def __init__(self, get_response):
+        if not settings.API_SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timing.execute),
+                    )
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        durations = dict(timing.phases, db=timing.db, total=total)
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={seconds * 1000:.3f}'
+            + (f';desc="{timing.queries} queries"' if name == 'db' else '')
+            for name, seconds in durations.items()
+        )
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timing.queries,
+            **{
+                f'{name}_ms': round(seconds * 1000, 3)
+                for name, seconds in durations.items()
+            },
+        }))
+        return response
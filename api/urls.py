@@ -6,8 +6,16 @@ from api import views
 urlpatterns = [
     path('physical-people/', views.physical_people_list),
     path('physical-people/<int:id>/', views.physical_people_detail),
+    path('physical-people/by-cpf/<str:cpf>/', views.physical_people_by_cpf),
     path('legal-people/', views.legal_people_list),
     path('legal-people/<int:id>/', views.legal_people_detail),
+    path('legal-people/by-cnpj/<str:cnpj>/', views.legal_people_by_cnpj),
     path('goods/', views.goods_list),
+    path('goods/stats/', views.goods_stats),
     path('goods/<int:id>/', views.goods_detail),
+    path('owners/<str:document>/holdings/', views.owner_holdings),
+    path('owners/<str:document>/summary/', views.owner_summary),
+    path('changes/', views.changes_list),
+    path('cache/stats/', views.cache_stats),
+    path('token/', views.token_obtain),
 ]
@@ -1,50 +1,230 @@
-from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import ProtectedError
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
 from django.views.decorators.csrf import csrf_exempt
 
-from rest_framework.authentication import (
-    BasicAuthentication,
-    SessionAuthentication,
-)
+from rest_framework.authentication import SessionAuthentication
 from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import (
     api_view,
     authentication_classes,
     permission_classes,
+    renderer_classes,
+)
+from rest_framework.settings import api_settings
+from . import generations
+from .authentication import (
+    CachedBasicAuthentication,
+    SignedTokenAuthentication,
+    issue_token,
 )
+from .changes import changes
+from .conditional import conditional, detail_state, list_state
+from .filters import filter_records, is_multi_get, selected_fields
+from .fragments import encoded_rows, state_fields
+from .holdings import holdings
+from .metrics import exposition
 from .models import Good, LegalPerson, PhysicalPerson
+from .owners import owner_resolver, registered_owners
+from .pagination import IdCursorPagination
+from .query_budget import query_budget, unbudgeted
+from .renderers import NDJSONRenderer
+from .response_cache import cache_response, counters
+from .rollups import summary
+from .search import search
 from .serializers import (
     GoodSerializer,
     LegalPersonSerializer,
-    PhysicalPersonSerializer
+    PhysicalPersonSerializer,
+    ReadSerializer,
 )
+from .streaming import streaming_response, wants_stream
+from .timing import JsonResponse, phase, timed_authentication
+
+AUTHENTICATION_CLASSES = [
+    timed_authentication(SessionAuthentication),
+    timed_authentication(SignedTokenAuthentication),
+    timed_authentication(CachedBasicAuthentication),
+]
+TOKEN_AUTHENTICATION_CLASSES = [
+    timed_authentication(SessionAuthentication),
+    timed_authentication(CachedBasicAuthentication),
+]
+OWNER_IN_USE_ERROR = {
+    'detail': 'Owner of companies or goods, transfer or remove them first.',
+}
+LIST_RENDERER_CLASSES = api_settings.DEFAULT_RENDERER_CLASSES + [
+    NDJSONRenderer,
+]
+
+
+def paginated_response(request, queryset, serializer_class, fields=None):
+    """Serialize one keyset page of the queryset with its navigation links.
+
+    The page is read as the versions of its rows only, the body is then
+    joined from the rows kept encoded by api.fragments and only the rows
+    missing there are loaded and serialized. The bytes are the same
+    JsonResponse would produce from the serializer data.
+    """
+    paginator = IdCursorPagination()
+    states = paginator.paginate_queryset(
+        queryset.values(*state_fields(queryset.model)),
+        request,
+    )
+    encoder = DjangoJSONEncoder()
+    return HttpResponse(
+        '{"next": %s, "previous": %s, "results": [%s]}' % (
+            encoder.encode(paginator.get_next_link()),
+            encoder.encode(paginator.get_previous_link()),
+            ', '.join(encoded_rows(
+                states,
+                queryset,
+                serializer_class,
+                fields,
+            )),
+        ),
+        content_type='application/json',
+    )
+
+
+def single_page_response(results):
+    """Serialized records in the envelope of a page without navigation.
+    """
+    return JsonResponse({
+        'next': None,
+        'previous': None,
+        'results': results,
+    })
+
+
+def multi_get_response(queryset, serializer_class, fields=None):
+    """Serialize the records fetched by ?ids=, ?cpf= or ?cnpj=, by id.
+    """
+    serializer = ReadSerializer(serializer_class, fields)
+    with phase('serialize'):
+        results = [
+            serializer.to_representation(row)
+            for row in serializer.rows(queryset.order_by('id'))
+        ]
+    return single_page_response(results)
+
+
+def search_response(request, queryset, serializer_class, fields=None):
+    """Serialize the records best matching the ?q= search, best first.
+
+    Results are ranked, so they come in a single page of at most ``limit``
+    records instead of being paginated by id.
+    """
+    limit = IdCursorPagination().get_page_size(request)
+    records = search(
+        ReadSerializer(serializer_class, fields).only(queryset),
+        request.query_params['q'],
+        limit,
+    )
+    return single_page_response(
+        serializer_class(records, many=True, fields=fields).data,
+    )
+
 
+def record_response(request, queryset, serializer_class):
+    """Serialize the record of the queryset, 404 when there is none.
 
-def check_owner_exists(owner):
-    """Check if owner exists in DB it could be a physical or legal person.
+    Only the columns of the ?fields= asked for are read.
     """
-    physical_person = PhysicalPerson.objects.filter(cpf=owner).count()
-    legal_person = LegalPerson.objects.filter(cnpj=owner).count()
-    if physical_person == 0 and legal_person == 0:
-        return False
-    return True
+    fields, errors = selected_fields(request, serializer_class)
+    if errors:
+        return JsonResponse(errors, status=400)
+    serializer = ReadSerializer(serializer_class, fields)
+    row = serializer.rows(queryset).first()
+    if row is None:
+        return HttpResponse(status=404)
+    return JsonResponse(serializer.to_representation(row))
+
+
+def bulk_create_response(data, serializer_class):
+    """Validate a list of records and insert them all in one transaction.
+
+    Nothing is inserted when any record is invalid, the errors are returned
+    per record in the order they were sent.
+    """
+    if len(data) > settings.API_BULK_MAX_RECORDS:
+        return JsonResponse(
+            {'detail': 'At most %d records per request.'
+             % settings.API_BULK_MAX_RECORDS},
+            status=400,
+        )
+
+    serializer = serializer_class(data=data, many=True)
+    # Validated outside the transaction of the inserts, which must start
+    # with a write (see VersionedModel.save()).
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400, safe=False)
+    # Inserted in batches, their queries grow with the records sent.
+    with unbudgeted():
+        serializer.save()
+    return JsonResponse(serializer.data, status=201, safe=False)
 
 
 @api_view(['GET', 'POST'])
-@authentication_classes([SessionAuthentication, BasicAuthentication])
+@authentication_classes(AUTHENTICATION_CLASSES)
 @permission_classes([IsAuthenticated])
+@renderer_classes(LIST_RENDERER_CLASSES)
 @csrf_exempt
+@query_budget(GET=3, POST=7)
+@conditional(list_state(PhysicalPerson))
+@cache_response
 def physical_people_list(request):
     """
-    List all physical people, or create a new record.
+    List physical people one page at a time (or search or stream them),
+    optionally filtered, or create one or many (JSON array) records.
     """
     if request.method == 'GET':
-        records = PhysicalPerson.objects.all()
-        serializer = PhysicalPersonSerializer(records, many=True)
-        return JsonResponse(serializer.data, safe=False)
+        records, errors = filter_records(
+            request,
+            PhysicalPerson.objects.all(),
+        )
+        fields, field_errors = selected_fields(
+            request,
+            PhysicalPersonSerializer,
+        )
+        errors.update(field_errors)
+        if errors:
+            return JsonResponse(errors, status=400)
+        if 'q' in request.query_params:
+            return search_response(
+                request,
+                records,
+                PhysicalPersonSerializer,
+                fields,
+            )
+        if is_multi_get(request):
+            return multi_get_response(
+                records,
+                PhysicalPersonSerializer,
+                fields,
+            )
+        if wants_stream(request):
+            return streaming_response(
+                request,
+                records,
+                PhysicalPersonSerializer,
+                fields,
+            )
+        return paginated_response(
+            request,
+            records,
+            PhysicalPersonSerializer,
+            fields,
+        )
 
     if request.method == 'POST':
         data = JSONParser().parse(request)
+        if isinstance(data, list):
+            return bulk_create_response(data, PhysicalPersonSerializer)
         serializer = PhysicalPersonSerializer(data=data)
 
         if serializer.is_valid():
@@ -54,23 +234,29 @@ def physical_people_list(request):
 
 
 @api_view(['GET', 'PUT', 'DELETE'])
-@authentication_classes([SessionAuthentication, BasicAuthentication])
+@authentication_classes(AUTHENTICATION_CLASSES)
 @permission_classes([IsAuthenticated])
 @csrf_exempt
+@query_budget(GET=2, PUT=14, DELETE=10)
+@conditional(detail_state(PhysicalPerson))
+@cache_response
 def physical_people_detail(request, id):
     """
     Retrieve, update or delete a physical person.
     """
+    if request.method == 'GET':
+        return record_response(
+            request,
+            PhysicalPerson.objects.filter(pk=id),
+            PhysicalPersonSerializer,
+        )
+
     try:
         physical_person = PhysicalPerson.objects.get(pk=id)
     except PhysicalPerson.DoesNotExist:
         return HttpResponse(status=404)
 
-    if request.method == 'GET':
-        serializer = PhysicalPersonSerializer(physical_person)
-        return JsonResponse(serializer.data)
-
-    elif request.method == 'PUT':
+    if request.method == 'PUT':
         data = JSONParser().parse(request)
         serializer = PhysicalPersonSerializer(physical_person, data=data)
         if serializer.is_valid():
@@ -79,139 +265,376 @@ def physical_people_detail(request, id):
         return JsonResponse(serializer.errors, status=400)
 
     elif request.method == 'DELETE':
-        physical_person.delete()
+        try:
+            physical_person.delete()
+        except ProtectedError:
+            return JsonResponse(OWNER_IN_USE_ERROR, status=409)
         return HttpResponse(status=200)
 
 
+@api_view(['GET'])
+@authentication_classes(AUTHENTICATION_CLASSES)
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+@query_budget(GET=1)
+def physical_people_by_cpf(request, cpf):
+    """
+    Retrieve a physical person by cpf.
+    """
+    return record_response(
+        request,
+        PhysicalPerson.objects.filter(cpf=cpf),
+        PhysicalPersonSerializer,
+    )
+
+
 @api_view(['GET', 'POST'])
-@authentication_classes([SessionAuthentication, BasicAuthentication])
+@authentication_classes(AUTHENTICATION_CLASSES)
 @permission_classes([IsAuthenticated])
+@renderer_classes(LIST_RENDERER_CLASSES)
 @csrf_exempt
+@query_budget(GET=4, POST=14)
+@conditional(list_state(LegalPerson))
+@cache_response
 def legal_people_list(request):
     """
-    List all legal people, or create a new record.
+    List legal people one page at a time (or search or stream them),
+    optionally filtered, or create one or many (JSON array) records.
     """
     if request.method == 'GET':
-        records = LegalPerson.objects.all()
-        serializer = LegalPersonSerializer(records, many=True)
-        return JsonResponse(serializer.data, safe=False)
+        records, errors = filter_records(
+            request,
+            LegalPerson.objects.select_related('owner'),
+        )
+        fields, field_errors = selected_fields(request, LegalPersonSerializer)
+        errors.update(field_errors)
+        if errors:
+            return JsonResponse(errors, status=400)
+        if 'q' in request.query_params:
+            return search_response(
+                request,
+                records,
+                LegalPersonSerializer,
+                fields,
+            )
+        if is_multi_get(request):
+            return multi_get_response(records, LegalPersonSerializer, fields)
+        if wants_stream(request):
+            return streaming_response(
+                request,
+                records,
+                LegalPersonSerializer,
+                fields,
+            )
+        return paginated_response(
+            request,
+            records,
+            LegalPersonSerializer,
+            fields,
+        )
 
     if request.method == 'POST':
         data = JSONParser().parse(request)
+        if isinstance(data, list):
+            return bulk_create_response(data, LegalPersonSerializer)
         serializer = LegalPersonSerializer(data=data)
 
         if serializer.is_valid():
-            if check_owner_exists(data['owner']):
-                serializer.save()
-                return JsonResponse(serializer.data, status=201)
-            else:
-                return JsonResponse(
-                    {'owner': "Must be an existing cpf or cnpj."},
-                    status=400,
-                )
-
+            serializer.save()
+            return JsonResponse(serializer.data, status=201)
         return JsonResponse(serializer.errors, status=400)
 
 
 @api_view(['GET', 'PUT', 'DELETE'])
-@authentication_classes([SessionAuthentication, BasicAuthentication])
+@authentication_classes(AUTHENTICATION_CLASSES)
 @permission_classes([IsAuthenticated])
 @csrf_exempt
+@query_budget(GET=3, PUT=20, DELETE=16)
+@conditional(detail_state(LegalPerson))
+@cache_response
 def legal_people_detail(request, id):
     """
     Retrieve, update or delete a legal person.
     """
+    if request.method == 'GET':
+        return record_response(
+            request,
+            LegalPerson.objects.filter(pk=id),
+            LegalPersonSerializer,
+        )
+
     try:
-        legal_person = LegalPerson.objects.get(pk=id)
+        legal_person = LegalPerson.objects.select_related('owner').get(
+            pk=id,
+        )
     except LegalPerson.DoesNotExist:
         return HttpResponse(status=404)
 
-    if request.method == 'GET':
-        serializer = LegalPersonSerializer(legal_person)
-        return JsonResponse(serializer.data)
-
-    elif request.method == 'PUT':
+    if request.method == 'PUT':
         data = JSONParser().parse(request)
         serializer = LegalPersonSerializer(legal_person, data=data)
         if serializer.is_valid():
-            if check_owner_exists(data['owner']):
-                serializer.save()
-                return JsonResponse(serializer.data, status=200)
-            else:
-                return JsonResponse(
-                    {'owner': "Must be an existing cpf or cnpj."},
-                    status=400,
-                )
-
+            serializer.save()
+            return JsonResponse(serializer.data)
         return JsonResponse(serializer.errors, status=400)
 
     elif request.method == 'DELETE':
-        legal_person.delete()
+        try:
+            legal_person.delete()
+        except ProtectedError:
+            return JsonResponse(OWNER_IN_USE_ERROR, status=409)
         return HttpResponse(status=200)
 
 
+@api_view(['GET'])
+@authentication_classes(AUTHENTICATION_CLASSES)
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+@query_budget(GET=1)
+def legal_people_by_cnpj(request, cnpj):
+    """
+    Retrieve a legal person by cnpj.
+    """
+    return record_response(
+        request,
+        LegalPerson.objects.filter(cnpj=cnpj),
+        LegalPersonSerializer,
+    )
+
+
 @api_view(['GET', 'POST'])
-@authentication_classes([SessionAuthentication, BasicAuthentication])
+@authentication_classes(AUTHENTICATION_CLASSES)
 @permission_classes([IsAuthenticated])
+@renderer_classes(LIST_RENDERER_CLASSES)
 @csrf_exempt
+@query_budget(GET=4, POST=9)
+@conditional(list_state(Good))
+@cache_response
 def goods_list(request):
     """
-    List all goods, or create a new record.
+    List goods one page at a time (or search or stream them), optionally
+    filtered, or create one or many (JSON array) records.
     """
     if request.method == 'GET':
-        records = Good.objects.all()
-        serializer = GoodSerializer(records, many=True)
-        return JsonResponse(serializer.data, safe=False)
+        records, errors = filter_records(
+            request,
+            Good.objects.select_related('owner'),
+        )
+        fields, field_errors = selected_fields(request, GoodSerializer)
+        errors.update(field_errors)
+        if errors:
+            return JsonResponse(errors, status=400)
+        if 'q' in request.query_params:
+            return search_response(request, records, GoodSerializer, fields)
+        if is_multi_get(request):
+            return multi_get_response(records, GoodSerializer, fields)
+        if wants_stream(request):
+            return streaming_response(request, records, GoodSerializer, fields)
+        return paginated_response(request, records, GoodSerializer, fields)
 
     if request.method == 'POST':
         data = JSONParser().parse(request)
+        if isinstance(data, list):
+            return bulk_create_response(data, GoodSerializer)
         serializer = GoodSerializer(data=data)
 
         if serializer.is_valid():
-            if check_owner_exists(data['owner']):
-                serializer.save()
-                return JsonResponse(serializer.data, status=201)
-            else:
-                return JsonResponse(
-                    {'owner': "Must be an existing cpf or cnpj."},
-                    status=400,
-                )
-
+            serializer.save()
+            return JsonResponse(serializer.data, status=201)
         return JsonResponse(serializer.errors, status=400)
 
 
 @api_view(['GET', 'PUT', 'DELETE'])
-@authentication_classes([SessionAuthentication, BasicAuthentication])
+@authentication_classes(AUTHENTICATION_CLASSES)
 @permission_classes([IsAuthenticated])
 @csrf_exempt
+@query_budget(GET=3, PUT=17, DELETE=9)
+@conditional(detail_state(Good))
+@cache_response
 def goods_detail(request, id):
     """
     Retrieve, update or delete a good.
     """
+    if request.method == 'GET':
+        return record_response(
+            request,
+            Good.objects.filter(pk=id),
+            GoodSerializer,
+        )
+
     try:
-        good = Good.objects.get(pk=id)
+        good = Good.objects.select_related('owner').get(pk=id)
     except Good.DoesNotExist:
         return HttpResponse(status=404)
 
-    if request.method == 'GET':
-        serializer = GoodSerializer(good)
-        return JsonResponse(serializer.data)
-
-    elif request.method == 'PUT':
+    if request.method == 'PUT':
         data = JSONParser().parse(request)
         serializer = GoodSerializer(good, data=data)
         if serializer.is_valid():
-            if check_owner_exists(data['owner']):
-                serializer.save()
-                return JsonResponse(serializer.data, status=200)
-            else:
-                return JsonResponse(
-                    {'owner': "Must be an existing cpf or cnpj."},
-                    status=400,
-                )
-
+            serializer.save()
+            return JsonResponse(serializer.data)
         return JsonResponse(serializer.errors, status=400)
 
     elif request.method == 'DELETE':
         good.delete()
         return HttpResponse(status=200)
+
+
+@api_view(['GET'])
+@authentication_classes(AUTHENTICATION_CLASSES)
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+@query_budget(GET=6)
+def owner_holdings(request, document):
+    """
+    List every company and good the owner controls, directly or through
+    the companies it holds, up to the requested depth.
+    """
+    owner = registered_owners().filter(document=document).first()
+    if owner is None:
+        return HttpResponse(status=404)
+
+    max_depth = settings.API_HOLDINGS_MAX_DEPTH
+    try:
+        depth = int(request.GET.get('depth', max_depth))
+    except ValueError:
+        depth = 0
+    if not 1 <= depth <= max_depth:
+        return JsonResponse(
+            {'depth': ['Must be an integer between 1 and %d.' % max_depth]},
+            status=400,
+        )
+
+    companies, goods = holdings(owner, depth)
+    return JsonResponse({
+        'owner': owner.document,
+        'depth': depth,
+        'companies': [
+            {**LegalPersonSerializer(company).data, 'depth': company_depth}
+            for company, company_depth in companies
+        ],
+        'goods': GoodSerializer(goods, many=True).data,
+    })
+
+
+@api_view(['GET'])
+@authentication_classes(AUTHENTICATION_CLASSES)
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+@query_budget(GET=2)
+def owner_summary(request, document):
+    """
+    Count the goods per type and the companies the owner holds directly.
+    """
+    owner_id = owner_resolver.resolve(document)
+    if owner_id is None:
+        return HttpResponse(status=404)
+    return JsonResponse({'owner': document, **summary(owner_id)})
+
+
+@api_view(['GET'])
+@authentication_classes(AUTHENTICATION_CLASSES)
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+@query_budget(GET=1)
+def goods_stats(request):
+    """
+    Count the goods per type and the companies of every owner.
+    """
+    return JsonResponse(summary())
+
+
+@api_view(['GET'])
+@authentication_classes(AUTHENTICATION_CLASSES)
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+@query_budget(GET=0)
+def cache_stats(request):
+    """
+    Count the GET responses served from the cache and built by the views
+    since this process started.
+    """
+    return JsonResponse({
+        'hits': counters['hits'],
+        'misses': counters['misses'],
+    })
+
+
+@api_view(['GET'])
+@authentication_classes(AUTHENTICATION_CLASSES)
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+@query_budget(GET=5)
+def changes_list(request):
+    """
+    List the records created, updated and deleted after the ?since= seq,
+    oldest first, for mirrors to sync incrementally.
+    """
+    since = request.GET.get('since', '0')
+    if not since.isdigit():
+        return JsonResponse(
+            {'since': ['Must be a non-negative integer.']},
+            status=400,
+        )
+    since = int(since)
+
+    # Reading from 0 rebuilds every table, later seqs may miss deletions.
+    horizon = generations.current(generations.CHANGES_HORIZON)
+    if 0 < since < horizon:
+        return JsonResponse(
+            {'detail': 'Deletions up to seq %d were compacted, sync again '
+             'from since=0.' % horizon},
+            status=410,
+        )
+
+    limit = IdCursorPagination().get_page_size(request)
+    results, more = changes(since, limit)
+    return JsonResponse({
+        'since': since,
+        'last_seq': results[-1]['seq'] if results else since,
+        'more': more,
+        'results': results,
+    })
+
+
+@api_view(['POST'])
+@authentication_classes(TOKEN_AUTHENTICATION_CLASSES)
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+@query_budget(POST=0)
+def token_obtain(request):
+    """
+    Issue a short-lived signed bearer token for the authenticated user.
+    """
+    return JsonResponse(issue_token(request.user))
+
+
+@require_GET
+@query_budget(GET=2)
+def prometheus_metrics(request):
+    """
+    Expose the metrics of every process in the Prometheus text format, with
+    the number of records registered.
+    """
+    token = settings.API_METRICS_TOKEN
+    if token and not constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''),
+        f'Bearer {token}',
+    ):
+        return HttpResponse(status=401)
+
+    # Companies and goods are counted by the rollups, without a table scan.
+    totals = summary()
+    records = [
+        ('PhysicalPerson', PhysicalPerson.objects.count()),
+        ('LegalPerson', totals['companies']),
+        ('Good', totals['goods_total']),
+    ]
+    return HttpResponse(
+        exposition([(
+            'api_records',
+            'Records registered, by model.',
+            [((('model', model),), count) for model, count in records],
+        )]),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,74 @@
+"""Requests/sec of Basic authenticated GETs with and without the credential
+cache of api.authentication.CachedBasicAuthentication.
+
+Usage:
+    python benchmarks/auth.py [--requests N]
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'physical_legal_goods.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+)
+from rest_framework.test import APIClient  # noqa: E402
+
+from api import authentication  # noqa: E402
+
+
+def requests_per_second(client, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get('/v1/goods/?limit=1')
+        assert response.status_code == 200, response.status_code
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        user = get_user_model().objects.create(username='bench')
+        user.set_password('bench-password')
+        user.save()
+
+        client = APIClient()
+        credentials = base64.b64encode(b'bench:bench-password').decode()
+        client.credentials(HTTP_AUTHORIZATION='Basic ' + credentials)
+
+        cache = authentication.credential_cache
+        max_entries = cache.max_entries
+
+        cache.max_entries = 0
+        cache.clear()
+        before = requests_per_second(client, args.requests)
+
+        cache.max_entries = max_entries
+        after = requests_per_second(client, args.requests)
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    print(f'without credential cache: {before:10.1f} req/s')
+    print(f'with credential cache:    {after:10.1f} req/s')
+    print(f'speedup:                  {after / before:10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
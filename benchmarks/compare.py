@@ -0,0 +1,74 @@
+"""Compare two result files of benchmarks/endpoints.py and flag the
+endpoints whose latency grew by more than the threshold.
+
+Exits with status 1 when any endpoint regressed, so it can gate a release.
+
+Usage:
+    python benchmarks/compare.py BASELINE CURRENT [--metric p95_ms]
+                                 [--threshold 10]
+"""
+import argparse
+import json
+import sys
+
+METRICS = ['mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+
+
+def load(path):
+    with open(path) as results:
+        return json.load(results)
+
+
+def compare(baseline, current, metric, threshold):
+    """Yield (size, endpoint, before, after, change %, regressed) of the
+    endpoints measured in both runs.
+    """
+    for size, results in current['sizes'].items():
+        before_endpoints = baseline['sizes'].get(size, {}).get('endpoints', {})
+        for endpoint, stats in results['endpoints'].items():
+            if endpoint not in before_endpoints:
+                continue
+            before = before_endpoints[endpoint][metric]
+            after = stats[metric]
+            change = (after - before) / before * 100 if before else 0.0
+            yield size, endpoint, before, after, change, change > threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--metric', choices=METRICS, default='p95_ms')
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=10.0,
+        help='Percentage of growth counted as a regression.',
+    )
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    current = load(args.current)
+    print(
+        f'{args.metric}: {baseline["metadata"]["revision"]} -> '
+        f'{current["metadata"]["revision"]}'
+    )
+    regressions = 0
+    for size, endpoint, before, after, change, regressed in compare(
+        baseline,
+        current,
+        args.metric,
+        args.threshold,
+    ):
+        regressions += regressed
+        print(
+            f'{size:>9} {endpoint:<36} {before:9.2f} -> {after:9.2f} ms '
+            f'{change:+7.1f}%{"  REGRESSION" if regressed else ""}'
+        )
+
+    print(f'{regressions} regression(s) above {args.threshold:g}%.')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
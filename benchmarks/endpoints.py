@@ -0,0 +1,322 @@
+"""Latency and throughput of every endpoint of api/urls.py on datasets of
+several sizes, saved as JSON for benchmarks/compare.py.
+
+Each size is a fresh test database seeded by ``manage.py seed_dataset``
+with a tenth of the rows as physical people, a fiftieth as companies and
+the rest as goods. The response cache is disabled, so every request does
+the work of the endpoint.
+
+Usage:
+    python benchmarks/endpoints.py [--sizes N,N,...] [--requests N]
+                                   [--output FILE]
+"""
+import argparse
+import base64
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'physical_legal_goods.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+)
+from rest_framework.test import APIClient  # noqa: E402
+
+from api.fragments import fragment_cache  # noqa: E402
+from api.models import Change, Good, LegalPerson, PhysicalPerson  # noqa: E402
+
+SIZES = [10000, 100000, 1000000]
+SAMPLE_SIZE = 1000
+
+
+def dataset(size):
+    """Options of seed_dataset for a dataset of about size rows.
+    """
+    people = max(size // 10, 1)
+    companies = size // 50
+    return {
+        'people': people,
+        'companies': companies,
+        'goods': max(size - people - companies, 0),
+    }
+
+
+def sample(rng, queryset, field):
+    values = list(queryset.order_by('?').values_list(field, flat=True)[
+        :SAMPLE_SIZE
+    ])
+    return lambda: rng.choice(values)
+
+
+def scenarios(rng, client, basic_client):
+    """(name, client, request factory[, response callback]) of the measured
+    requests, in the order they run. The writes run last, the deletions
+    remove the goods created by the POSTs. Everything but /v1/token/ is
+    authenticated with a bearer token.
+    """
+    person_id = sample(rng, PhysicalPerson.objects.all(), 'id')
+    cpf = sample(rng, PhysicalPerson.objects.all(), 'cpf')
+    company_id = sample(rng, LegalPerson.objects.all(), 'id')
+    cnpj = sample(rng, LegalPerson.objects.all(), 'cnpj')
+    good_id = sample(rng, Good.objects.all(), 'id')
+    seq = sample(rng, Change.objects.all(), 'seq')
+    created = []
+
+    def good(owner):
+        return {
+            'good_type': 'automovel',
+            'description': 'Fusca 66 azul',
+            'owner': owner,
+        }
+
+    def good_created(response):
+        created.append(json.loads(response.content)['id'])
+
+    return [
+        ('GET physical-people/', client, lambda: (
+            'get', '/v1/physical-people/', None,
+        )),
+        ('GET physical-people/?q=', client, lambda: (
+            'get', '/v1/physical-people/?q=silva', None,
+        )),
+        ('GET physical-people/<id>/', client, lambda: (
+            'get', f'/v1/physical-people/{person_id()}/', None,
+        )),
+        ('GET physical-people/by-cpf/<cpf>/', client, lambda: (
+            'get', f'/v1/physical-people/by-cpf/{cpf()}/', None,
+        )),
+        ('GET legal-people/', client, lambda: (
+            'get', '/v1/legal-people/', None,
+        )),
+        ('GET legal-people/?q=', client, lambda: (
+            'get', '/v1/legal-people/?q=digital', None,
+        )),
+        ('GET legal-people/<id>/', client, lambda: (
+            'get', f'/v1/legal-people/{company_id()}/', None,
+        )),
+        ('GET legal-people/by-cnpj/<cnpj>/', client, lambda: (
+            'get', f'/v1/legal-people/by-cnpj/{cnpj()}/', None,
+        )),
+        ('GET goods/', client, lambda: (
+            'get', '/v1/goods/', None,
+        )),
+        ('GET goods/?q=', client, lambda: (
+            'get', '/v1/goods/?q=fusca', None,
+        )),
+        ('GET goods/?ids=', client, lambda: (
+            'get',
+            '/v1/goods/?ids=' + ','.join(
+                str(good_id()) for _ in range(50)
+            ),
+            None,
+        )),
+        ('GET goods/<id>/', client, lambda: (
+            'get', f'/v1/goods/{good_id()}/', None,
+        )),
+        ('GET goods/stats/', client, lambda: (
+            'get', '/v1/goods/stats/', None,
+        )),
+        ('GET owners/<cpf>/holdings/', client, lambda: (
+            'get', f'/v1/owners/{cpf()}/holdings/', None,
+        )),
+        ('GET owners/<cpf>/summary/', client, lambda: (
+            'get', f'/v1/owners/{cpf()}/summary/', None,
+        )),
+        ('GET changes/', client, lambda: (
+            'get', f'/v1/changes/?since={seq()}', None,
+        )),
+        ('GET cache/stats/', client, lambda: (
+            'get', '/v1/cache/stats/', None,
+        )),
+        ('POST token/', basic_client, lambda: (
+            'post', '/v1/token/', None,
+        )),
+        ('POST goods/', client, lambda: (
+            'post', '/v1/goods/', good(cnpj()),
+        ), good_created),
+        ('PUT goods/<id>/', client, lambda: (
+            'put', f'/v1/goods/{good_id()}/', good(cnpj()),
+        )),
+        ('DELETE goods/<id>/', client, lambda: (
+            'delete', f'/v1/goods/{created.pop()}/', None,
+        )),
+    ]
+
+
+def summary(latencies):
+    """Latency percentiles in milliseconds and requests/sec of a scenario.
+    """
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return ordered[min(int(len(ordered) * p), len(ordered) - 1)] * 1000
+
+    return {
+        'requests': len(ordered),
+        'mean_ms': statistics.mean(ordered) * 1000,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': ordered[-1] * 1000,
+        'requests_per_second': len(ordered) / sum(ordered),
+    }
+
+
+def run(scenario, requests, warmup):
+    name, client, request, *after = scenario
+    latencies = []
+    for i in range(warmup + requests):
+        method, url, body = request()
+        start = time.perf_counter()
+        response = getattr(client, method)(url, body, format='json')
+        elapsed = time.perf_counter() - start
+        assert response.status_code < 300, (name, response.status_code)
+        for callback in after:
+            callback(response)
+        if i >= warmup:
+            latencies.append(elapsed)
+    return summary(latencies)
+
+
+def benchmark(size, requests, warmup, seed):
+    """Seed a fresh test database with size rows and measure every
+    scenario on it.
+    """
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        options = dataset(size)
+        start = time.perf_counter()
+        call_command(
+            'seed_dataset',
+            seed=seed,
+            stdout=io.StringIO(),
+            **options,
+        )
+        seed_seconds = time.perf_counter() - start
+        fragment_cache.clear()
+
+        user = get_user_model().objects.create(username='bench')
+        user.set_password('bench-password')
+        user.save()
+        basic_client = APIClient()
+        credentials = base64.b64encode(b'bench:bench-password').decode()
+        basic_client.credentials(HTTP_AUTHORIZATION='Basic ' + credentials)
+        token = basic_client.post('/v1/token/').json()['token']
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+
+        results = {}
+        rng = random.Random(seed)
+        for scenario in scenarios(rng, client, basic_client):
+            name = scenario[0]
+            results[name] = run(scenario, requests, warmup)
+            print(
+                f'{size:>9} {name:<36} '
+                f'p50 {results[name]["p50_ms"]:8.2f} ms '
+                f'p95 {results[name]["p95_ms"]:8.2f} ms '
+                f'{results[name]["requests_per_second"]:9.1f} req/s',
+                flush=True,
+            )
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    return {
+        'dataset': options,
+        'seed_seconds': seed_seconds,
+        'seed_rows_per_second': size / seed_seconds,
+        'endpoints': results,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--sizes',
+        type=lambda value: [int(size) for size in value.split(',')],
+        default=SIZES,
+    )
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--output',
+        default=f'benchmark-{datetime.date.today().isoformat()}.json',
+    )
+    args = parser.parse_args()
+
+    setup_test_environment()
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == 'sqlite':
+            # On disk like a deployed database, the 1M rows dataset does
+            # not fit comfortably in memory.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                directory,
+                'benchmark.sqlite3',
+            )
+        with override_settings(API_RESPONSE_CACHE_TTL=0):
+            results = {
+                str(size): benchmark(
+                    size,
+                    args.requests,
+                    args.warmup,
+                    args.seed,
+                )
+                for size in args.sizes
+            }
+
+    report = {
+        'metadata': {
+            'created_at': datetime.datetime.now(
+                datetime.timezone.utc,
+            ).isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'platform': platform.platform(),
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'seed': args.seed,
+        },
+        'sizes': results,
+    }
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print(f'Results saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
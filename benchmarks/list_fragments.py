@@ -0,0 +1,105 @@
+"""Rows/sec of walking every page of /v1/goods/ with and without the encoded
+rows kept by api.fragments.
+
+Usage:
+    python benchmarks/list_fragments.py [--rows N] [--limit N]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'physical_legal_goods.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+)
+from rest_framework.test import APIClient  # noqa: E402
+
+from api.bulk import bulk_insert  # noqa: E402
+from api.fragments import fragment_cache  # noqa: E402
+from api.models import Good, Owner, PhysicalPerson  # noqa: E402
+
+
+def rows_per_second(client, limit):
+    rows = 0
+    url = f'/v1/goods/?limit={limit}'
+    start = time.perf_counter()
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+        body = response.json()
+        rows += len(body['results'])
+        url = body['next']
+    return rows / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--limit', type=int, default=1000)
+    args = parser.parse_args()
+
+    # Every page is built by the view, not answered by the response cache.
+    settings.API_RESPONSE_CACHE_TTL = 0
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        user = get_user_model().objects.create(username='bench')
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        PhysicalPerson.objects.create(
+            cpf='00000000000',
+            name='Bench',
+            email='bench@email.com',
+            zipcode='88000000',
+            phone_number='4899999999',
+        )
+        owner = Owner.objects.get(document='00000000000')
+        bulk_insert(
+            Good,
+            [
+                Good(
+                    good_type='imovel',
+                    description=f'Good {number}',
+                    owner=owner,
+                )
+                for number in range(args.rows)
+            ],
+            batch_size=settings.API_BULK_BATCH_SIZE,
+        )
+
+        max_size = fragment_cache.max_size
+        fragment_cache.max_size = 0
+        fragment_cache.clear()
+        without = rows_per_second(client, args.limit)
+
+        fragment_cache.max_size = max_size
+        cold = rows_per_second(client, args.limit)
+        warm = rows_per_second(client, args.limit)
+        cached = len(fragment_cache)
+        size = fragment_cache.size
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    print(f'without fragment cache: {without:10.1f} rows/s')
+    print(f'cold fragment cache:    {cold:10.1f} rows/s')
+    print(f'warm fragment cache:    {warm:10.1f} rows/s')
+    print(f'speedup (warm):         {warm / without:10.1f}x')
+    print(f'cached rows:            {cached:10d} ({size} characters)')
+
+
+if __name__ == '__main__':
+    main()
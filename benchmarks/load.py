@@ -0,0 +1,802 @@
+"""Requests/sec and latency percentiles of the WSGI or ASGI application under
+concurrent load, driven in process or over a local socket.
+
+A fresh test database is seeded by ``manage.py seed_dataset`` and workers
+(threads or processes) send a weighted mix of requests to the resources for
+--duration seconds. In a closed loop each worker sends its next request as
+soon as the previous one is answered. With --rate the arrivals follow a
+schedule instead (open loop), and the latency is counted from the scheduled
+time, so a stalled server is not hidden by the workers waiting on it.
+
+Latencies are kept in HDR-style histograms, reported per request type with
+the error rate and the database queries of each request.
+
+Usage:
+    python benchmarks/load.py [--interface wsgi|asgi]
+                              [--transport inprocess|socket]
+                              [--workers N] [--worker-type thread|process]
+                              [--rate R] [--arrival constant|poisson]
+                              [--duration S] [--mix get=60,list=10,...]
+                              [--resources goods,...] [--size N]
+                              [--output FILE] [--hgrm FILE]
+"""
+import argparse
+import asyncio
+import contextvars
+import http.client
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'physical_legal_goods.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+)
+
+from api.authentication import issue_token  # noqa: E402
+from api.management.commands.seed_dataset import (  # noqa: E402
+    GOOD_DESCRIPTIONS,
+    cnpj,
+    cpf,
+)
+from api.models import Good, LegalPerson, PhysicalPerson  # noqa: E402
+
+RESOURCES = {
+    'physical-people': (PhysicalPerson, 'cpf'),
+    'legal-people': (LegalPerson, 'cnpj'),
+    'goods': (Good, None),
+}
+KINDS = ['get', 'list', 'post', 'put', 'delete']
+MIX = 'get=60,list=10,post=10,put=10,delete=10'
+# Records of each resource handed to every worker for its GETs and PUTs.
+POOL_SIZE = 200
+# Numbers of the cpfs/cnpjs POSTed by worker n start at FIRST_DOCUMENT plus
+# n times DOCUMENT_BLOCK, far after the ones of the seeded dataset.
+FIRST_DOCUMENT = 10 ** 7
+DOCUMENT_BLOCK = 10 ** 6
+PERCENTILES = [50, 75, 90, 95, 99, 99.9, 99.99, 100]
+
+queries = contextvars.ContextVar('queries', default=None)
+
+
+class Histogram:
+    """Counts of microsecond values in buckets of 2 significant digits, as
+    in HdrHistogram, so millions of latencies take a few kB and merge by
+    adding the counts.
+    """
+    SUB_BUCKET_BITS = 7
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def bucket(self, value):
+        shift = max(value.bit_length() - self.SUB_BUCKET_BITS - 1, 0)
+        return value >> shift << shift, shift
+
+    def record(self, seconds):
+        value = max(int(seconds * 1e6), 0)
+        self.counts[self.bucket(value)[0]] += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def highest_equivalent(self, value):
+        low, shift = self.bucket(value)
+        return low + (1 << shift) - 1
+
+    def distribution(self):
+        """(value in microseconds, cumulative count) of every bucket.
+        """
+        count = 0
+        for value in sorted(self.counts):
+            count += self.counts[value]
+            yield self.highest_equivalent(value), count
+
+    def percentile(self, p):
+        """Value in milliseconds at or below which p% of the values are.
+        """
+        total = self.total
+        if not total:
+            return 0.0
+        wanted = max(math.ceil(total * p / 100), 1)
+        for value, count in self.distribution():
+            if count >= wanted:
+                return value / 1000
+        return 0.0  # pragma: no cover
+
+    def hgrm(self):
+        """Percentile distribution in the text format of HdrHistogram,
+        readable by its plotter.
+        """
+        lines = [
+            f'{"Value":>12} {"Percentile":>14} {"TotalCount":>10} '
+            f'{"1/(1-Percentile)":>14}',
+            '',
+        ]
+        total = self.total
+        for value, count in self.distribution():
+            fraction = count / total
+            inverse = 1 / (1 - fraction) if fraction < 1 else math.inf
+            lines.append(
+                f'{value / 1000:12.3f} {fraction:14.12f} {count:10d} '
+                f'{inverse:14.2f}'
+            )
+        lines.append(
+            f'#[Max = {self.percentile(100):.3f}, Total count = {total}]',
+        )
+        return '\n'.join(lines) + '\n'
+
+
+class Stats:
+    """Latencies, errors and database queries of one request type.
+    """
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = Counter()
+        self.queries = 0
+        self.max_queries = 0
+
+    def record(self, seconds, error=None, query_count=0):
+        self.latency.record(seconds)
+        if error is not None:
+            self.errors[error] += 1
+        self.queries += query_count
+        self.max_queries = max(self.max_queries, query_count)
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.errors.update(other.errors)
+        self.queries += other.queries
+        self.max_queries = max(self.max_queries, other.max_queries)
+
+    def summary(self, duration):
+        requests = self.latency.total
+        return {
+            'requests': requests,
+            'requests_per_second': requests / duration,
+            'error_rate': sum(self.errors.values()) / max(requests, 1),
+            'errors': dict(self.errors),
+            'queries_per_request': self.queries / max(requests, 1),
+            'max_queries': self.max_queries,
+            'latency_ms': {
+                str(p): self.latency.percentile(p) for p in PERCENTILES
+            },
+        }
+
+
+def count_query(execute, sql, params, many, context):
+    counter = queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def counting_queries(sender, connection, **kwargs):
+    # Fired again by every reconnection of the same connection object.
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def counted_wsgi(application):
+    """WSGI application answering the queries run by each request in the
+    X-Query-Count header.
+    """
+    def counted(environ, start_response):
+        counter = [0]
+        queries.set(counter)
+
+        def start(status, headers, exc_info=None):
+            headers = headers + [('X-Query-Count', str(counter[0]))]
+            return start_response(status, headers, exc_info)
+
+        return application(environ, start)
+
+    return counted
+
+
+def counted_asgi(application):
+    """ASGI application answering the queries run by each request in the
+    x-query-count header. The sync views run in a copy of the context, so
+    they count in the same list.
+    """
+    async def counted(scope, receive, send):
+        counter = [0]
+        queries.set(counter)
+
+        async def sending(message):
+            if message['type'] == 'http.response.start':
+                message = dict(message)
+                message['headers'] = list(message.get('headers', [])) + [
+                    (b'x-query-count', str(counter[0]).encode()),
+                ]
+            await send(message)
+
+        await application(scope, receive, sending)
+
+    return counted
+
+
+def wsgi_sender(application):
+    def send(method, path, body, headers):
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers.items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        response = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            response['status'] = int(status.split()[0])
+            response['headers'] = dict(response_headers)
+
+        result = application(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return (
+            response['status'],
+            int(response['headers']['X-Query-Count']),
+            content,
+        )
+
+    return send
+
+
+def asgi_sender(application):
+    loop = asyncio.new_event_loop()
+
+    async def call(method, path, body, headers):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [
+                (name.lower().encode(), value.encode())
+                for name, value in {
+                    'Content-Type': 'application/json',
+                    'Content-Length': str(len(body)),
+                    **headers,
+                }.items()
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+        messages = [{'type': 'http.request', 'body': body}]
+        response = {'body': []}
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = dict(message['headers'])
+            else:
+                response['body'].append(message.get('body', b''))
+
+        await application(scope, receive, send)
+        return (
+            response['status'],
+            int(response['headers'][b'x-query-count']),
+            b''.join(response['body']),
+        )
+
+    def send(method, path, body, headers):
+        return loop.run_until_complete(call(method, path, body, headers))
+
+    return send
+
+
+def socket_sender(address):
+    def send(method, path, body, headers):
+        client = http.client.HTTPConnection(*address)
+        try:
+            client.request(method, path, body, {
+                'Content-Type': 'application/json',
+                **headers,
+            })
+            response = client.getresponse()
+            content = response.read()
+            return (
+                response.status,
+                int(response.getheader('X-Query-Count')),
+                content,
+            )
+        finally:
+            client.close()
+
+    return send
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(application):
+    """Serve the application on a free local port from a thread.
+    """
+    server = make_server(
+        '127.0.0.1',
+        0,
+        application,
+        server_class=ThreadingWSGIServer,
+        handler_class=QuietHandler,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        kind, _, weight = item.partition('=')
+        if kind not in KINDS or not weight.isdigit():
+            raise argparse.ArgumentTypeError(
+                f'Expected kind=weight pairs of: {", ".join(KINDS)}.',
+            )
+        mix[kind] = int(weight)
+    return mix
+
+
+class Worker:
+    """Sends the request mix, each write on records only this worker uses:
+    PUTs go to its share of the seeded records and DELETEs remove what it
+    POSTed (a POST is sent first when there is nothing left to delete).
+    """
+
+    def __init__(self, number, args, pools, owners, send, headers):
+        self.number = number
+        self.rng = random.Random(args.seed * 1000 + number)
+        self.resources = args.resources
+        self.kinds = list(args.mix)
+        self.weights = list(args.mix.values())
+        self.pools = pools
+        self.owners = owners
+        self.created = {resource: [] for resource in self.resources}
+        self.documents = FIRST_DOCUMENT + number * DOCUMENT_BLOCK
+        self.send = send
+        self.headers = headers
+        self.stats = {}
+
+    def body(self, resource, document=None):
+        rng = self.rng
+        if resource == 'physical-people':
+            return {
+                'cpf': document,
+                'name': f'Carga {rng.randrange(10 ** 6)}',
+                'zipcode': f'{rng.randrange(10 ** 8):08d}',
+                'email': f'carga{document}@email.com',
+                'phone_number': f'{rng.randrange(10 ** 10):010d}',
+            }
+        if resource == 'legal-people':
+            return {
+                'cnpj': document,
+                'social_reason': f'Carga {rng.randrange(10 ** 6)} Ltda',
+                'fantasy_name': 'Carga',
+                'state_registration': f'{rng.randrange(10 ** 9):09d}',
+                'zipcode': f'{rng.randrange(10 ** 8):08d}',
+                'email': f'carga{document[:8]}@empresa.com.br',
+                'phone_number': f'{rng.randrange(10 ** 10):010d}',
+                'owner': rng.choice(self.owners['physical-people']),
+            }
+        good_type, descriptions = rng.choice(GOOD_DESCRIPTIONS)
+        return {
+            'good_type': good_type,
+            'description': rng.choice(descriptions).format(rng.randint(1, 9)),
+            'owner': rng.choice(self.owners['legal-people']),
+        }
+
+    def new_document(self, resource):
+        self.documents += 1
+        if resource == 'physical-people':
+            return cpf(self.documents)
+        if resource == 'legal-people':
+            return cnpj(self.documents)
+        return None
+
+    def request(self, kind, resource):
+        """(method, path, body, callback of the answered JSON) of a request.
+        """
+        base = f'/v1/{resource}/'
+        if kind == 'list':
+            return 'GET', base, None, None
+        if kind == 'post':
+            document = self.new_document(resource)
+
+            def created(data):
+                self.created[resource].append((data['id'], document))
+
+            return 'POST', base, self.body(resource, document), created
+        if kind == 'delete':
+            pk, _ = self.created[resource].pop()
+            return 'DELETE', f'{base}{pk}/', None, None
+        pk, document = self.rng.choice(self.pools[resource])
+        if kind == 'get':
+            return 'GET', f'{base}{pk}/', None, None
+        return 'PUT', f'{base}{pk}/', self.body(resource, document), None
+
+    def call(self, kind, resource, scheduled=None):
+        method, path, body, callback = self.request(kind, resource)
+        detail = '' if kind in ('list', 'post') else '<id>/'
+        stats = self.stats.setdefault(
+            f'{method} {resource}/{detail}',
+            Stats(),
+        )
+        payload = json.dumps(body).encode() if body is not None else b''
+        start = time.perf_counter()
+        try:
+            status, query_count, content = self.send(
+                method,
+                path,
+                payload,
+                self.headers,
+            )
+        except Exception as error:
+            # Refused connections and the like count as errors too.
+            stats.record(
+                time.perf_counter() - (scheduled or start),
+                type(error).__name__,
+            )
+            return
+        stats.record(
+            time.perf_counter() - (scheduled or start),
+            str(status) if status >= 400 else None,
+            query_count,
+        )
+        if callback is not None and status < 300:
+            callback(json.loads(content))
+
+    def step(self, scheduled=None):
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        resource = self.rng.choice(self.resources)
+        if kind == 'delete' and not self.created[resource]:
+            self.call('post', resource, scheduled)
+            scheduled = None
+            if not self.created[resource]:
+                # The POST failed, its error is already counted.
+                return
+        self.call(kind, resource, scheduled)
+
+    def run(self, duration, rate, arrival):
+        """Send requests until the duration is over, back to back without a
+        rate, else at the arrival times of a constant or poisson process.
+        """
+        deadline = time.perf_counter() + duration
+        if not rate:
+            while time.perf_counter() < deadline:
+                self.step()
+            return self.stats
+
+        scheduled = time.perf_counter()
+        while True:
+            if arrival == 'poisson':
+                scheduled += self.rng.expovariate(rate)
+            else:
+                scheduled += 1 / rate
+            if scheduled >= deadline:
+                return self.stats
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.step(scheduled)
+
+
+def run_worker(number, args, pools, owners, sender, headers):
+    worker = Worker(number, args, pools, owners, sender(), headers)
+    try:
+        return worker.run(
+            args.duration,
+            args.rate / args.workers,
+            args.arrival,
+        )
+    finally:
+        connections.close_all()
+
+
+def process_worker(results, number, *arguments):
+    results.put((number, run_worker(number, *arguments)))
+
+
+def run_workers(args, pools, owners, sender, headers):
+    """Stats of every worker, run in threads or forked processes.
+    """
+    # Each thread or process opens its own connections.
+    connections.close_all()
+    if args.worker_type == 'process':
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        processes = [
+            context.Process(
+                target=process_worker,
+                args=(
+                    queue,
+                    number,
+                    args,
+                    pools[number],
+                    owners,
+                    sender,
+                    headers,
+                ),
+            )
+            for number in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        results = [queue.get()[1] for _ in processes]
+        for process in processes:
+            process.join()
+        return results
+
+    results = [None] * args.workers
+
+    def target(number):
+        results[number] = run_worker(
+            number,
+            args,
+            pools[number],
+            owners,
+            sender,
+            headers,
+        )
+
+    threads = [
+        threading.Thread(target=target, args=(number,))
+        for number in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def sample(queryset, fields, count):
+    return list(queryset.order_by('?').values_list(*fields)[:count])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--interface',
+        choices=['wsgi', 'asgi'],
+        default='wsgi',
+    )
+    parser.add_argument(
+        '--transport',
+        choices=['inprocess', 'socket'],
+        default='inprocess',
+    )
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument(
+        '--worker-type',
+        choices=['thread', 'process'],
+        default='thread',
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=0,
+        help='Requests/sec of all workers together, 0 for a closed loop.',
+    )
+    parser.add_argument(
+        '--arrival',
+        choices=['constant', 'poisson'],
+        default='constant',
+    )
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(MIX))
+    parser.add_argument(
+        '--resources',
+        type=lambda value: value.split(','),
+        default=list(RESOURCES),
+    )
+    parser.add_argument(
+        '--size',
+        type=int,
+        default=10000,
+        help='Rows of the seeded dataset.',
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Save the results as JSON.')
+    parser.add_argument(
+        '--hgrm',
+        help='Save the latency distribution of all the requests in the '
+             'HdrHistogram text format.',
+    )
+    args = parser.parse_args()
+    if set(args.resources) - set(RESOURCES):
+        parser.error(f'--resources must be among: {", ".join(RESOURCES)}.')
+    if args.interface == 'asgi' and args.transport == 'socket':
+        parser.error('The socket transport serves the WSGI application.')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1.')
+
+    setup_test_environment()
+    directory = tempfile.TemporaryDirectory()
+    if connection.vendor == 'sqlite':
+        # Shared by the threads and processes of the workers.
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            directory.name,
+            'load.sqlite3',
+        )
+    old_config = setup_databases(verbosity=0, interactive=False)
+    server = None
+    try:
+        people = max(args.size // 10, 1)
+        companies = max(args.size // 50, 1)
+        call_command(
+            'seed_dataset',
+            people=people,
+            companies=companies,
+            goods=max(args.size - people - companies, 0),
+            seed=args.seed,
+            stdout=io.StringIO(),
+        )
+        owners = {
+            'physical-people': [
+                document for document, in sample(
+                    PhysicalPerson.objects.all(),
+                    ['cpf'],
+                    POOL_SIZE,
+                )
+            ],
+            'legal-people': [
+                document for document, in sample(
+                    LegalPerson.objects.all(),
+                    ['cnpj'],
+                    POOL_SIZE,
+                )
+            ],
+        }
+        pools = [{} for _ in range(args.workers)]
+        for resource in args.resources:
+            model, field = RESOURCES[resource]
+            records = sample(
+                model.objects.all(),
+                ['id', field or 'id'],
+                POOL_SIZE * args.workers,
+            )
+            for number, pool in enumerate(pools):
+                pool[resource] = records[number::args.workers]
+        user = get_user_model().objects.create(username='load')
+        headers = {
+            'Authorization': 'Bearer ' + issue_token(user)['token'],
+        }
+
+        connection_created.connect(counting_queries)
+        if args.interface == 'asgi':
+            from physical_legal_goods.asgi import application
+
+            def sender():
+                return asgi_sender(counted_asgi(application))
+        else:
+            from physical_legal_goods.wsgi import application
+
+            if args.transport == 'socket':
+                server = serve(counted_wsgi(application))
+
+                def sender():
+                    return socket_sender(server.server_address)
+            else:
+                def sender():
+                    return wsgi_sender(counted_wsgi(application))
+
+        start = time.perf_counter()
+        results = run_workers(args, pools, owners, sender, headers)
+        duration = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.shutdown()
+        connections.close_all()
+        teardown_databases(old_config, verbosity=0)
+        directory.cleanup()
+
+    stats = {}
+    total = Stats()
+    for worker_stats in results:
+        for name, request_stats in worker_stats.items():
+            stats.setdefault(name, Stats()).merge(request_stats)
+            total.merge(request_stats)
+
+    print(
+        f'{"request":<30} {"count":>7} {"req/s":>8} {"errors":>7} '
+        f'{"p50":>8} {"p90":>8} {"p99":>8} {"p99.9":>8} {"max":>8} '
+        f'{"queries":>7}'
+    )
+    for name, request_stats in sorted(stats.items()) + [('all', total)]:
+        latency = request_stats.latency
+        requests = latency.total
+        print(
+            f'{name:<30} {requests:>7} {requests / duration:>8.1f} '
+            f'{sum(request_stats.errors.values()) / requests:>7.2%} '
+            + ' '.join(
+                f'{latency.percentile(p):>8.2f}' for p in (50, 90, 99, 99.9)
+            )
+            + f' {latency.percentile(100):>8.2f} '
+            f'{request_stats.queries / requests:>7.1f}'
+        )
+    print('latencies in ms, queries per request on average')
+    for name, request_stats in sorted(stats.items()):
+        if request_stats.errors:
+            print(f'{name} errors: {dict(request_stats.errors)}')
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'options': {
+                    name: value for name, value in vars(args).items()
+                    if name not in ('output', 'hgrm')
+                },
+                'duration': duration,
+                'all': total.summary(duration),
+                'requests': {
+                    name: request_stats.summary(duration)
+                    for name, request_stats in sorted(stats.items())
+                },
+            }, output, indent=2)
+    if args.hgrm:
+        with open(args.hgrm, 'w') as output:
+            output.write(total.latency.hgrm())
+
+
+if __name__ == '__main__':
+    main()
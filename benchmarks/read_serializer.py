@@ -0,0 +1,96 @@
+"""Rows/sec of serializing goods with the model serializer and with the
+read only api.serializers.ReadSerializer, query included.
+
+Usage:
+    python benchmarks/read_serializer.py [--rows N] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'physical_legal_goods.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+)
+
+from api.bulk import bulk_insert  # noqa: E402
+from api.models import Good, Owner, PhysicalPerson  # noqa: E402
+from api.serializers import GoodSerializer, ReadSerializer  # noqa: E402
+
+
+def model_serializer(queryset):
+    return GoodSerializer(queryset, many=True).data
+
+
+def read_serializer(queryset):
+    serializer = ReadSerializer(GoodSerializer)
+    return [serializer.to_representation(row)
+            for row in serializer.rows(queryset)]
+
+
+def rows_per_second(serialize, queryset, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = serialize(queryset.all())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(rows) / best, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        PhysicalPerson.objects.create(
+            cpf='00000000000',
+            name='Bench',
+            email='bench@email.com',
+            zipcode='88000000',
+            phone_number='4899999999',
+        )
+        owner = Owner.objects.get(document='00000000000')
+        bulk_insert(
+            Good,
+            [
+                Good(
+                    good_type='imovel',
+                    description=f'Good {number}',
+                    owner=owner,
+                )
+                for number in range(args.rows)
+            ],
+            batch_size=settings.API_BULK_BATCH_SIZE,
+        )
+
+        queryset = Good.objects.select_related('owner').order_by('id')
+        before, expected = rows_per_second(model_serializer, queryset,
+                                           args.repeat)
+        after, rows = rows_per_second(read_serializer, queryset, args.repeat)
+        assert rows == expected
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    print(f'model serializer: {before:10.1f} rows/s')
+    print(f'read serializer:  {after:10.1f} rows/s')
+    print(f'speedup:          {after / before:10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -39,10 +39,12 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'api'
+    'api.apps.ApiConfig',
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,8 +60,111 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
-    ]
+        'api.authentication.SignedTokenAuthentication',
+        'api.authentication.CachedBasicAuthentication',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.IdCursorPagination',
+    'PAGE_SIZE': 100,
+    'EXCEPTION_HANDLER': 'api.metrics.exception_handler',
+}
+
+# Verified Basic auth credentials are kept in an in-process LRU so repeated
+# requests skip the password hasher (see api.authentication).
+API_CREDENTIAL_CACHE_SIZE = 1024
+API_CREDENTIAL_CACHE_TTL = 300  # seconds
+
+# Keys signing the bearer tokens issued by /v1/token/ (whitespace separated).
+# The first key signs and all of them verify, so a retired key can be kept
+# at the end of the list until the tokens it signed expire.
+API_TOKEN_SIGNING_KEYS = os.getenv('API_TOKEN_SIGNING_KEYS', '').split() or [
+    SECRET_KEY,
+]
+API_TOKEN_TTL = 300  # seconds
+
+# Answers of the cpf/cnpj owner existence checks kept in memory by
+# api.owners. The Bloom filter is only safe when this process is the single
+# writer of people.
+API_OWNER_CACHE_SIZE = 10000
+API_OWNER_CACHE_TTL = 30  # seconds
+API_OWNER_BLOOM_FILTER = False
+
+# Bulk creation through JSON arrays POSTed to the list endpoints.
+API_BULK_MAX_RECORDS = 10000
+API_BULK_BATCH_SIZE = 500
+
+# Keys accepted by the ?ids=, ?cpf= and ?cnpj= multi-get of the list
+# endpoints, all fetched with one IN query.
+API_MULTI_GET_MAX_KEYS = 500
+
+# Companies walked by /v1/owners/<cpf_or_cnpj>/holdings/ and how long the
+# computed closure stays cached (it is dropped as soon as ownership changes).
+API_HOLDINGS_MAX_DEPTH = 32
+API_HOLDINGS_CACHE_TTL = 300  # seconds
+
+# GET responses of the list and detail endpoints are cached under the ETag
+# of the resource, which changes with every write to the tables behind it.
+# Any cache backend works, the local memory one is per process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+API_RESPONSE_CACHE = 'default'
+API_RESPONSE_CACHE_TTL = 300  # seconds, 0 disables the cache
+
+# Rows of the list pages are kept JSON encoded, per version of the record,
+# in an in-process LRU holding at most this many characters (see
+# api.fragments), so a page only serializes the rows changed since.
+API_FRAGMENT_CACHE_SIZE = 64 * 1024 * 1024
+
+# Days the deletions stay in the change log served by /v1/changes/ once
+# ``manage.py compact_changes`` runs. Mirrors further behind sync again from
+# the start of the log.
+API_CHANGES_RETENTION_DAYS = 30
+
+# Time spent in auth, SQL, serialization and rendering sent in a
+# Server-Timing header and logged by ``api.timing`` for every request. When
+# off the middleware is dropped, so it costs nothing.
+API_SERVER_TIMING = os.getenv('API_SERVER_TIMING', '0') == '1'
+
+# Metrics served at /metrics in the Prometheus text format. Each process
+# keeps its values in a memory mapped file of API_METRICS_DIR and a scrape
+# adds up the files of all of them, so every worker of a server must share
+# the directory, emptied when the server starts. Unset, only the process
+# answering the scrape is reported. A token, when set, must be sent by the
+# scraper as ``Authorization: Bearer <token>``.
+API_METRICS_DIR = os.getenv('API_METRICS_DIR', '')
+API_METRICS_TOKEN = os.getenv('API_METRICS_TOKEN', '')
+
+# Views declare the most queries they may run per request with
+# ``api.query_budget.query_budget``. A request over its budget, or running
+# the same SQL more than API_QUERY_REPEAT_LIMIT times (a query per row), is
+# logged as a warning by ``api.query_budget``, or fails with
+# QueryBudgetExceeded when strict, as in the tests.
+API_QUERY_REPEAT_LIMIT = 5
+API_QUERY_BUDGET_STRICT = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'api.query_budget': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
 
 ROOT_URLCONF = 'physical_legal_goods.urls'
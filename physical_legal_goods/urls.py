@@ -15,6 +15,9 @@ Including another URLconf
 """
 from django.urls import include, path
 
+from api import views
+
 urlpatterns = [
     path('v1/', include('api.urls')),
+    path('metrics', views.prometheus_metrics),
 ]